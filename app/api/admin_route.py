@@ -0,0 +1,54 @@
+import pandas as pd
+from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from app.api.schemas import IngestRequest
+from app.services import ingest_service, user_service
+from app.services.dataset_registry import dataset_registry
+from app.services.reload_service import dataset_reloader
+from app.services.executor import compute_executor
+from app.services.ingest_service import DEMOGRAPHIC_COLUMNS
+
+admin_router = APIRouter(prefix="/admin")
+
+@admin_router.get("/cache")
+async def get_cache_stats():
+    return JSONResponse(status_code=200, content=user_service.result_cache.stats())
+
+
+@admin_router.get("/datasets")
+async def get_datasets():
+    return JSONResponse(status_code=200, content=dataset_registry.status())
+
+
+@admin_router.post("/ingest")
+async def ingest(request: IngestRequest):
+    # Process pool workers hold their own copy of the dataset, which an ingestion here would not reach
+    if not compute_executor.shares_memory:
+        raise HTTPException(status_code=409, detail="Incremental ingestion requires the thread executor.")
+    interactions = pd.DataFrame([record.model_dump() for record in request.interactions],
+                                columns=['user_id', 'survey_type', 'response'])
+    users = pd.DataFrame([record.model_dump() for record in request.users], columns=DEMOGRAPHIC_COLUMNS)
+    try:
+        summary = await run_in_threadpool(ingest_service.ingest, interactions, users)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ingest_service.IngestionSuspended as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return JSONResponse(status_code=200, content=summary)
+
+
+@admin_router.post("/reload")
+async def reload_dataset():
+    """
+    Reloads the dataset from the source files in the background, answering right away. The current dataset
+    is served until the new one is ready; rows ingested since the last load are not kept, and ingestions are
+    rejected until the reload is done.
+    """
+    started = dataset_reloader.start()
+    return JSONResponse(status_code=202 if started else 409, content=dataset_reloader.status())
+
+
+@admin_router.get("/reload")
+async def get_reload_status():
+    return JSONResponse(status_code=200, content=dataset_reloader.status())
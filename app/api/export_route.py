@@ -0,0 +1,36 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse, JSONResponse
+from app.api.schemas import ExportRequest
+from app.services.export_service import ExportsBusy, export_manager
+
+export_router = APIRouter(prefix="/exports")
+
+@export_router.post("")
+async def create_export(request: ExportRequest, dataset: str | None = None):
+    try:
+        job = export_manager.submit(request.user_data, request.format, request.columns, dataset)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ExportsBusy:
+        raise HTTPException(status_code=503, detail="Too many exports in progress, retry later.",
+                            headers={"Retry-After": "10"})
+    return JSONResponse(status_code=202, content=job)
+
+
+@export_router.get("/{job_id}")
+async def get_export(job_id: str):
+    job = export_manager.status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown export.")
+    return JSONResponse(status_code=200, content=job)
+
+
+@export_router.get("/{job_id}/file")
+async def download_export(job_id: str):
+    job = export_manager.status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown export.")
+    if job["state"] != "completed":
+        raise HTTPException(status_code=409, detail=f"The export is {job['state']}.")
+    media_type = "application/gzip" if job["format"] == "csv.gz" else "application/vnd.apache.arrow.file"
+    return FileResponse(job["path"], media_type=media_type, filename=f"audience-{job_id}.{job['format']}")
@@ -0,0 +1,114 @@
+import io
+import time
+
+import pandas as pd
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+
+JSON = "json"
+NDJSON = "ndjson"
+ARROW = "arrow"
+
+MEDIA_TYPES = {
+    JSON: "application/json",
+    NDJSON: "application/x-ndjson",
+    ARROW: "application/vnd.apache.arrow.stream",
+}
+
+# Rows serialized at a time when streaming, bounding the memory used by the response
+STREAM_CHUNK_ROWS = 10_000
+
+
+def negotiate_format(format: str | None, accept: str | None) -> str:
+    """
+    Response format of a request: the `format` query parameter when given, otherwise the first
+    supported media type of the Accept header, defaulting to JSON.
+    """
+    if format:
+        if format not in MEDIA_TYPES:
+            raise HTTPException(status_code=400, detail=f"Format must be one of {list(MEDIA_TYPES)}")
+        return format
+    for media_type in (accept or "").split(","):
+        media_type = media_type.split(";")[0].strip()
+        for name, supported in MEDIA_TYPES.items():
+            if media_type == supported:
+                return name
+    return JSON
+
+
+def project_columns(result: pd.DataFrame, columns: str | None) -> pd.DataFrame:
+    """
+    Keeps the comma separated `columns` of the result, all of them when None.
+    """
+    if not columns:
+        return result
+    selected = [column.strip() for column in columns.split(",") if column.strip()]
+    unknown = [column for column in selected if column not in result.columns]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown columns: {unknown}")
+    return result[selected]
+
+
+def dataframe_response(result: pd.DataFrame, format: str, on_serialized=None):
+    """
+    Serializes a result in the given format, the large formats being streamed chunk by chunk.
+
+    `on_serialized`, when given, is called with the time spent encoding the result: before returning for
+    JSON, and once the stream ends for the streamed formats, which are encoded while the response is sent.
+    """
+    if format == NDJSON:
+        return StreamingResponse(timed_chunks(ndjson_chunks(result), on_serialized), media_type=MEDIA_TYPES[NDJSON])
+    if format == ARROW:
+        try:
+            import pyarrow
+        except ImportError:
+            raise HTTPException(status_code=406, detail="Arrow responses require pyarrow to be installed.")
+        return StreamingResponse(timed_chunks(arrow_chunks(result, pyarrow), on_serialized),
+                                 media_type=MEDIA_TYPES[ARROW])
+    start = time.perf_counter()
+    response = JSONResponse(status_code=200, content=result.to_dict())
+    if on_serialized is not None:
+        on_serialized(time.perf_counter() - start)
+    return response
+
+
+def timed_chunks(chunks, on_serialized):
+    # Times the encoding of every chunk, not the sending, and reports the total when the stream ends or is closed
+    seconds = 0.0
+    chunks = iter(chunks)
+    try:
+        while True:
+            start = time.perf_counter()
+            chunk = next(chunks, None)
+            seconds += time.perf_counter() - start
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        if on_serialized is not None:
+            on_serialized(seconds)
+
+
+def ndjson_chunks(result: pd.DataFrame):
+    # One JSON object per row and line, without the index
+    for start in range(0, len(result), STREAM_CHUNK_ROWS):
+        yield result.iloc[start:start + STREAM_CHUNK_ROWS].to_json(orient="records", lines=True)
+
+
+def arrow_chunks(result: pd.DataFrame, pa):
+    # Arrow IPC stream: the schema, then one record batch per chunk
+    schema = pa.Schema.from_pandas(result, preserve_index=False)
+    buffer = io.BytesIO()
+    with pa.ipc.new_stream(buffer, schema) as writer:
+        for start in range(0, len(result), STREAM_CHUNK_ROWS):
+            chunk = result.iloc[start:start + STREAM_CHUNK_ROWS]
+            writer.write_batch(pa.RecordBatch.from_pandas(chunk, schema=schema, preserve_index=False))
+            yield flush(buffer)
+    yield flush(buffer)
+
+
+def flush(buffer: io.BytesIO) -> bytes:
+    data = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return data
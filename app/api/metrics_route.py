@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+from fastapi.responses import Response
+from app.utils.metrics import METRICS_CONTENT_TYPE, render_metrics
+
+metrics_router = APIRouter()
+
+@metrics_router.get("/metrics")
+async def get_metrics():
+    # Prometheus text exposition format
+    return Response(render_metrics(), media_type=METRICS_CONTENT_TYPE)
@@ -1,18 +1,172 @@
-from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+import time
+import pandas as pd
+from fastapi import APIRouter, Depends, Header, HTTPException
 from fastapi.responses import JSONResponse
-from app.api.schemas import UserRequest 
-from app.services import user_service
-from app.utils.data_manager import get_data
+from app.api.formats import dataframe_response, negotiate_format, project_columns
+from app.api.schemas import UserRequest, BatchUserRequest, LookalikeRequest
+from app.services import audience_service, lookalike_service, page_service, sharding, user_service
+from app.services.executor import ExecutorBusy, compute_executor
+from app.services.dataset_registry import get_dataset
+from app.utils.metrics import observe_stages, server_timing, timed_request, with_stage_timings
 
 target_users_router = APIRouter()
 
+
+async def run_on_executor(func, user_data, data, timings: dict):
+    """
+    Runs the processing on the compute pool, mapping a full pool to 503 and a timeout to 504.
+    The durations of the pipeline stages are recorded and added to `timings`. Process workers get the
+    id of the dataset rather than the dataset, see `user_service.compute_target_users`.
+    """
+    try:
+        result, stages = await compute_executor.run(with_stage_timings, func, user_data,
+                                                    data if compute_executor.shares_memory else data.dataset_id)
+    except ExecutorBusy:
+        raise HTTPException(status_code=503, detail="Server is busy, retry later.", headers={"Retry-After": "1"})
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Request processing timed out.")
+    observe_stages(stages)
+    timings.update(stages)
+    return result
+
+
+def add_profile(response, timings: dict, profile: str | None):
+    # Stage breakdown of the request, returned when asked for with the `X-Profile: 1` header
+    if profile == "1":
+        response.headers["Server-Timing"] = server_timing(timings)
+    return response
+
+
 @target_users_router.post("/target-users/")
-async def create_target_users(request: UserRequest, data=Depends(get_data)):
+async def create_target_users(request: UserRequest | None = None, data=Depends(get_dataset), format: str | None = None,
+                              columns: str | None = None, page_size: int | None = None, cursor: str | None = None,
+                              accept: str | None = Header(default=None), x_profile: str | None = Header(default=None)):
+    """
+    The response is a column oriented JSON object by default. Large audiences can be streamed as NDJSON or
+    as an Arrow IPC stream with `format=ndjson|arrow` or the matching Accept header, and `columns`
+    (e.g. `columns=user_id,similarity`) restricts the columns returned.
+
+    With `page_size`, only the first page of the audience is returned, and the `X-Next-Cursor` header
+    holds the cursor of the next one. Passing it back as `cursor`, without a body, returns the next page
+    of the same ranking.
+
+    `dataset` names the dataset of the registry to target, the default dataset when omitted.
+    """
+    if cursor is not None:
+        with timed_request("target_users_page"):
+            return next_page_response(cursor, data, page_size, columns, negotiate_format(format, accept))
+    with timed_request("target_users"):
+        response_format = negotiate_format(format, accept)
+        if request is None:
+            raise HTTPException(status_code=422, detail="The request body is required without a cursor.")
+        timings = {}
+        result = await run_on_executor(sharding.compute_target_users, request.user_data, data, timings)
+        headers = {}
+        if page_size is not None and isinstance(result, pd.DataFrame):
+            try:
+                result, next_cursor, total = page_service.first_page(result, request.user_data, data, page_size)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            headers = page_headers(next_cursor, total)
+        try:
+            if isinstance(result, pd.DataFrame):
+                response = dataframe_response(project_columns(result, columns), response_format,
+                                              serialization_recorder(timings))
+                response.headers.update(headers)
+            elif result is not None:
+                response = JSONResponse(status_code=200, content=result.to_dict())
+            else:
+                response = JSONResponse(status_code=500, content={"message": "No result"})
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        return add_profile(response, timings, x_profile)
+
+
+def serialization_recorder(timings: dict):
+    """
+    Records the encoding time reported by `dataframe_response` as the serialization stage. Streamed formats
+    report it once sent, after the Server-Timing header, which therefore only has it for JSON responses.
+    """
+    def record(seconds: float):
+        timings["serialization"] = seconds
+        observe_stages({"serialization": seconds})
+    return record
+
+
+def page_headers(next_cursor: str | None, total: int) -> dict:
+    headers = {"X-Total-Count": str(total)}
+    if next_cursor is not None:
+        headers["X-Next-Cursor"] = next_cursor
+    return headers
+
+
+def next_page_response(cursor: str, data, page_size: int | None, columns: str | None, response_format: str):
+    # Slices a cached ranking, cheap enough to stay on the event loop
     try:
-        result = user_service.process_user_data(request.user_data, data)
-        if result is not None:
-            return JSONResponse(status_code=200, content=result.to_dict())
-        else:
-            return JSONResponse(status_code=500, content={"message": "No result"})
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        page, next_cursor, total = page_service.next_page(cursor, data, page_size)
+    except page_service.CursorExpired as e:
+        raise HTTPException(status_code=410, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    response = dataframe_response(project_columns(page, columns), response_format)
+    response.headers.update(page_headers(next_cursor, total))
+    return response
+
+
+@target_users_router.post("/target-users/batch")
+async def create_target_users_batch(request: BatchUserRequest, data=Depends(get_dataset),
+                                    x_profile: str | None = Header(default=None)):
+    with timed_request("target_users_batch"):
+        timings = {}
+        results = await run_on_executor(user_service.compute_target_users_batch, request.user_data, data, timings)
+        try:
+            serialization_start = time.perf_counter()
+            content = [result.to_dict() if isinstance(result, pd.DataFrame)
+                       else {"message": result if result is not None else "No result"}
+                       for result in results]
+            response = JSONResponse(status_code=200, content=content)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        serialization_recorder(timings)(time.perf_counter() - serialization_start)
+        return add_profile(response, timings, x_profile)
+
+
+@target_users_router.post("/lookalike")
+async def create_lookalike_users(request: LookalikeRequest, data=Depends(get_dataset), format: str | None = None,
+                                 columns: str | None = None, accept: str | None = Header(default=None),
+                                 x_profile: str | None = Header(default=None)):
+    """
+    Users most similar to the given seed users, in the same formats as `/target-users/`.
+    """
+    with timed_request("lookalike"):
+        timings = {}
+        response_format = negotiate_format(format, accept)
+        try:
+            result = await run_on_executor(lookalike_service.compute_lookalikes, request, data, timings)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        response = dataframe_response(project_columns(result, columns), response_format,
+                                      serialization_recorder(timings))
+        return add_profile(response, timings, x_profile)
+
+
+@target_users_router.post("/audience-size")
+async def get_audience_size(request: UserRequest, data=Depends(get_dataset)):
+    """
+    Number of users matching the demographic filters and, with a single interest, its tier at the
+    requested confidence level. Filters on gender, region, age_group, income_group and occupation_category
+    are answered from the audience cube, others (age or income ranges, city, occupation) by counting.
+    """
+    with timed_request("audience_size"):
+        try:
+            size = audience_service.cube_audience_size(request.user_data, data)
+            source = "cube"
+            if size is None:
+                size = await run_on_executor(audience_service.compute_audience_size, request.user_data, data, {})
+                source = "scan"
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return {"audience_size": size, "source": source}
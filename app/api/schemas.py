@@ -5,6 +5,12 @@ class InterestProfile(BaseModel):
     interests: List[str]
     weights: List[float]
 
+class ScoringWeights(BaseModel):
+    initial_interest: Optional[float] = Field(default=None, description="Score of the interest declared by the user, the configured weight by default.")
+    yes: Optional[float] = Field(default=None, description="Score of a 'Yes' response, the configured weight by default.")
+    no: Optional[float] = Field(default=None, description="Score of a 'No' response, the configured weight by default.")
+    neutral: Optional[float] = Field(default=None, description="Score of a 'Neutral' response, the configured weight by default.")
+
 class UserData(BaseModel):
     gender: Optional[Union[str, List[str]]] = Field(default=None, description="Can be 'all', 'Male', 'Female', include 'other', or not.")
     occupation: Optional[Union[str, List[str]]] = Field(default=None, description="Can be any specific occupation or list of them.")
@@ -19,6 +25,47 @@ class UserData(BaseModel):
     n_users: Optional[int] = Field(default=None, description="Number of recommended target users.")
     confidence_level: Optional[str] = Field(default=None, description="Confidence level.")
     random_user_percent: Optional[int] = Field(default=None, description="Percentage of random users in recommended target users.")
+    seed: Optional[int] = Field(default=None, description="Seed for drawing the random users, makes the result reproducible.")
+    random_user_proportions: Optional[List[float]] = Field(default=None, description="Shares of the random users drawn from one confidence level lower, two levels lower and the users without interactions.")
+    scoring_weights: Optional[ScoringWeights] = Field(default=None, description="Weights scoring the interests for this request instead of the configured ones.")
 
 class UserRequest(BaseModel):
     user_data: UserData
+
+
+class BatchUserRequest(BaseModel):
+    user_data: List[UserData] = Field(description="One targeting request per campaign.")
+
+
+class InteractionRecord(BaseModel):
+    user_id: int
+    survey_type: str
+    response: str = Field(description="'Yes', 'No' or 'Neutral'.")
+
+
+class DemographicRecord(BaseModel):
+    user_id: int
+    age: int
+    gender: str
+    occupation: str
+    income: int
+    interests: str = Field(description="The interest declared by the user.")
+    city: str
+
+
+class IngestRequest(BaseModel):
+    interactions: List[InteractionRecord] = Field(default=[], description="New interactions of known or new users.")
+    users: List[DemographicRecord] = Field(default=[], description="New users to add to the dataset.")
+
+
+class LookalikeRequest(BaseModel):
+    seed_user_ids: List[int] = Field(description="Users whose lookalikes are searched, e.g. past converters.")
+    n_users: Optional[int] = Field(default=None, description="Number of lookalike users.")
+    n_probe: Optional[int] = Field(default=None, description="Index partitions scanned, higher is more accurate and slower.")
+    user_data: Optional[UserData] = Field(default=None, description="Demographic filters restricting the lookalikes, the interest is ignored.")
+
+
+class ExportRequest(BaseModel):
+    user_data: UserData
+    format: str = Field(default="csv.gz", description="'csv.gz' or 'arrow' (an Arrow IPC file, requires pyarrow).")
+    columns: Optional[List[str]] = Field(default=None, description="Columns exported, all of them by default.")
@@ -0,0 +1,21 @@
+import argparse
+import logging
+
+from app.utils import snapshot
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="User Profiling System maintenance commands.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("build-snapshot", help="Preprocess the source CSVs and (re)write the snapshot used at startup.")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "build-snapshot":
+        print(snapshot.build_snapshot())
+
+
+if __name__ == "__main__":
+    main()
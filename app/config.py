@@ -9,10 +9,77 @@ DEMOGRAPHIC_DATA_PATH = os.path.join(current_directory, 'utils', 'preprocessing'
 INTERACTION_DATA_PATH = os.path.join(current_directory, 'utils', 'preprocessing', 'data', 'interaction_data.csv')
 sys.path.append('UserProfiling')
 
+# Directory of the preprocessed snapshots, see app/utils/snapshot.py
+SNAPSHOT_DIR = os.environ.get('USER_PROFILING_SNAPSHOT_DIR',
+                              os.path.join(current_directory, 'utils', 'preprocessing', 'snapshots'))
+# Load the preprocessed table from a snapshot keyed by the source files and the preprocessing settings
+use_snapshot = os.environ.get('USER_PROFILING_USE_SNAPSHOT', '1') == '1'
+# Also hash the content of the source files when fingerprinting them, not only their size and mtime
+snapshot_hash_sources = False
+# Load the dataset at application startup instead of on the first request
+eager_load = os.environ.get('USER_PROFILING_EAGER_LOAD', '0') == '1'
+
+# Reload the dataset when the source files change, checking them every this many seconds, 0 disables it.
+# Reloads can also be triggered with POST /admin/reload
+reload_watch_seconds = float(os.environ.get('USER_PROFILING_RELOAD_WATCH_SECONDS', 0))
+
+# Named datasets served next to the default one, see app/services/dataset_registry.py: a JSON file mapping every
+# dataset id to its source files and, optionally, its own region and occupation mappings
+datasets_file = os.environ.get('USER_PROFILING_DATASETS')
+# Memory of the named datasets loaded at once, the least recently used ones are evicted beyond it
+dataset_memory_budget_bytes = int(os.environ.get('USER_PROFILING_DATASET_MEMORY_MB', 4096)) * 1024 * 1024
+
+# Read the interaction data in chunks instead of all at once
+streaming_preprocessing = True
+interaction_chunk_size = 1_000_000
+# Store strings as categoricals and scores/counts with the narrowest integer types
+compact_dtypes = True
+
+# Pool running the request processing off the event loop, see app/services/executor.py
+compute_executor = os.environ.get('USER_PROFILING_EXECUTOR', 'thread')  # 'thread' or 'process'
+compute_max_workers = int(os.environ.get('USER_PROFILING_MAX_WORKERS', os.cpu_count() or 1))
+# Requests waiting for a worker beyond which new ones are rejected with 503
+compute_max_queue = int(os.environ.get('USER_PROFILING_MAX_QUEUE', 64))
+compute_timeout_seconds = float(os.environ.get('USER_PROFILING_TIMEOUT_SECONDS', 30))
+
+# Worker processes each serving a user_id range of the snapshot, see app/services/sharding.py.
+# 0 or 1 serves every request in process; sharding needs the snapshot and the thread executor
+shard_count = int(os.environ.get('USER_PROFILING_SHARDS', 0))
+
+# Background audience exports, see app/services/export_service.py
+export_dir = os.environ.get('USER_PROFILING_EXPORT_DIR', os.path.join(current_directory, 'utils', 'preprocessing', 'exports'))
+export_max_workers = int(os.environ.get('USER_PROFILING_EXPORT_WORKERS', 2))
+# Queued and running jobs beyond which new exports are rejected with 503
+export_max_pending = int(os.environ.get('USER_PROFILING_EXPORT_MAX_PENDING', 16))
+# Jobs remembered, the files of the oldest finished ones are removed beyond it
+export_max_jobs = 100
+
+# Result cache of the targeting endpoint, see app/utils/cache.py
+result_cache_size = 1024
+result_cache_ttl_seconds = 300
+result_cache_max_bytes = int(os.environ.get('USER_PROFILING_RESULT_CACHE_MB', 256)) * 1024 * 1024
+
+# Rankings kept for the cursor pagination of the targeting endpoint, see app/services/page_service.py
+ranking_cache_size = 1024
+ranking_cache_ttl_seconds = float(os.environ.get('USER_PROFILING_RANKING_TTL_SECONDS', 600))
+ranking_cache_max_bytes = int(os.environ.get('USER_PROFILING_RANKING_CACHE_MB', 256)) * 1024 * 1024
+
+# Lookalike index, see app/utils/lookalike_index.py
+# Populations smaller than this are searched exhaustively instead of through the partitioned index
+lookalike_min_population = 20_000
+lookalike_max_lists = 1024
+# Lists scanned per query by default, more lists give a better recall for a higher latency
+lookalike_n_probe = 8
+# Weight of the encoded demographics next to the interests in the lookalike vectors, 0 uses the interests only
+lookalike_demographic_weight = 0.0
+lookalike_seed = 0
+
 confidence_level_list = ["Very High", "High", "Good", "Mid", "Low"]
 
 n_return_users_default = 50
 random_users_percent_default = 20
+# Shares of the random users drawn from one confidence level lower, two levels lower and the users without interactions
+random_users_proportions = [0.5, 0.3, 0.2]
 
 # Demogrphic df columns
 city_column = "city"
@@ -41,6 +108,8 @@ interests_columns = ['Sports', 'Finance', 'Politics', 'Fashion', 'Technology', '
 interation_columns = ['Fashion_interaction', 'Finance_interaction', 
                                                 'Politics_interaction', 'Sports_interaction', 
                                                 'Technology_interaction', 'Travel_interaction']
+# Raw Yes/No/Neutral response counts of every interest, kept so scores can be recomputed with other weights
+response_columns = [f'{interest}_{response}' for interest in interests_columns for response in ['Yes', 'No', 'Neutral']]
 
 # Define mapping between cities and regions in Italy
 region_mapping = {
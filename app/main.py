@@ -1,13 +1,51 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from app import config
 from app.api.route import target_users_router
+from app.api.admin_route import admin_router
+from app.api.metrics_route import metrics_router
+from app.api.export_route import export_router
+from app.services.executor import compute_executor
+from app.services.dataset_registry import UnknownDataset
+from app.services.export_service import export_manager
+from app.services.reload_service import dataset_reloader
+from app.services.sharding import shard_pool
+from app.utils.data_manager import DataManager
 import logging
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger()
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Pay the loading cost before serving instead of on the first request
+    if config.eager_load:
+        DataManager.get_dataset()
+    watcher = None
+    if config.reload_watch_seconds > 0:
+        watcher = asyncio.create_task(dataset_reloader.watch(config.reload_watch_seconds))
+    yield
+    if watcher is not None:
+        watcher.cancel()
+    compute_executor.shutdown()
+    export_manager.shutdown()
+    shard_pool.shutdown()
+
+
 # Initialize FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+@app.exception_handler(UnknownDataset)
+async def unknown_dataset_handler(request: Request, exc: UnknownDataset):
+    return JSONResponse(status_code=404, content={"detail": str(exc)})
+
 
 # Include the router
 app.include_router(target_users_router)
+app.include_router(admin_router)
+app.include_router(metrics_router)
+app.include_router(export_router)
@@ -0,0 +1,70 @@
+import numpy as np
+from app.api.schemas import UserData
+from app import config
+from app.utils.dataset import Dataset
+from app.utils.metrics import stage
+from app.utils.scoring import RescoredTiers
+from . import dataset_registry
+from .user_service import build_member_mask, is_single_interest, request_options, request_weights
+import logging
+
+logger = logging.getLogger("audience_service")
+
+# UserData fields answered by the audience cube, with the column they filter
+CUBE_FIELDS = {'gender': config.gender_column, 'region': config.region_column,
+               'age_group': config.age_group_name_column, 'income_group': config.income_quintile_name_column,
+               'occupation_category': config.occupation_category_column}
+# UserData fields the cube cannot answer, which need a pass over the population
+SCAN_FIELDS = ['age', 'income', 'city', 'occupation']
+
+
+def audience_tier(user_data: UserData) -> tuple:
+    """
+    Interest and confidence level of the tier the audience is restricted to, (None, None) without interest.
+    """
+    if user_data.interest is None:
+        return None, None
+    if not is_single_interest(user_data):
+        raise ValueError("The audience size is defined for a single interest.")
+    return user_data.interest.interests[0], request_options(user_data)[0]
+
+
+def cube_audience_size(user_data: UserData, dataset: Dataset) -> int | None:
+    """
+    Audience size of the request read from the audience cube, None when the request filters on columns
+    the cube does not hold, e.g. raw age or income ranges, or brings its own scoring weights.
+    """
+    cube = dataset.audience_cube
+    if any(getattr(user_data, field) for field in SCAN_FIELDS) or request_weights(user_data) is not None:
+        return None
+    if any(getattr(user_data, field) and column not in cube.values for field, column in CUBE_FIELDS.items()):
+        return None
+    interest, confidence_level = audience_tier(user_data)
+    selections = {column: getattr(user_data, field) for field, column in CUBE_FIELDS.items()}
+    return cube.count(selections, interest, confidence_level)
+
+
+def compute_audience_size(user_data: UserData, data: Dataset | str | None = None) -> int:
+    """
+    Entry point run on the compute pool, see `user_service.compute_target_users`.
+    """
+    if not isinstance(data, Dataset):
+        data = dataset_registry.get_dataset(data)
+    return scan_audience_size(user_data, data)
+
+
+def scan_audience_size(user_data: UserData, dataset: Dataset) -> int:
+    """
+    Audience size of the request counted over the filter bitmaps and the tier positions, for the requests
+    `cube_audience_size` cannot answer.
+    """
+    interest, confidence_level = audience_tier(user_data)
+    member_mask = build_member_mask(user_data, dataset)
+    with stage("audience_count"):
+        if interest is None:
+            return len(dataset) if member_mask is None else int(np.count_nonzero(member_mask))
+        weights = request_weights(user_data)
+        if weights is not None:
+            return len(RescoredTiers(dataset, member_mask, weights).get_positions(interest, confidence_level))
+        tier = dataset.tier_index.get_positions(interest, confidence_level)
+        return len(tier) if member_mask is None else int(np.count_nonzero(member_mask[tier]))
@@ -0,0 +1,172 @@
+import json
+import logging
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from app import config
+from app.utils.data_manager import DataManager
+from app.utils.dataset import Dataset
+from app.utils.snapshot import META_FILE, read_snapshot_dataset
+from .reload_service import config_values, prepare_snapshot
+
+logger = logging.getLogger("dataset_registry")
+
+DEFAULT_DATASET = "default"
+
+
+class UnknownDataset(LookupError):
+    """
+    Raised when a request names a dataset the registry does not define.
+    """
+
+
+def load_definitions(path: str | None) -> dict:
+    """
+    Reads the named datasets from a JSON file of the form
+    `{"<id>": {"demographic_data": "...csv", "interaction_data": "...csv", "region_mapping": {...},
+    "occupation_mapping": {...}}}`, the mappings defaulting to those of `app/config.py`. Relative paths
+    are relative to the file.
+    """
+    if not path:
+        return {}
+    with open(path) as file:
+        definitions = json.load(file)
+    base = os.path.dirname(os.path.abspath(path))
+    for dataset_id, definition in definitions.items():
+        if dataset_id == DEFAULT_DATASET or "/" in dataset_id or dataset_id.startswith("."):
+            raise ValueError(f"Invalid dataset id: {dataset_id!r}")
+        for key in ["demographic_data", "interaction_data"]:
+            definition[key] = os.path.join(base, definition[key])
+    return definitions
+
+
+def dataset_settings(dataset_id: str, definition: dict) -> dict:
+    """
+    Config values preprocessing the named dataset: the ones of this process, with its source files, its
+    mappings and a snapshot directory of its own.
+    """
+    settings = config_values()
+    settings.update(DEMOGRAPHIC_DATA_PATH=definition["demographic_data"],
+                    INTERACTION_DATA_PATH=definition["interaction_data"],
+                    SNAPSHOT_DIR=os.path.join(config.SNAPSHOT_DIR, "datasets", dataset_id))
+    if "region_mapping" in definition:
+        settings["region_mapping"] = {region: set(cities) for region, cities in definition["region_mapping"].items()}
+    if "occupation_mapping" in definition:
+        settings["occupation_mapping"] = definition["occupation_mapping"]
+    return settings
+
+
+def source_stats(definition: dict) -> list:
+    return [(os.stat(path).st_size, os.stat(path).st_mtime_ns)
+            for path in [definition["demographic_data"], definition["interaction_data"]]]
+
+
+class DatasetRegistry:
+    """
+    Named datasets, e.g. one per market or customer, loaded on demand next to the default dataset of the
+    DataManager.
+
+    Every dataset is preprocessed into a snapshot of its own, in a spawned process applying its settings,
+    and served memory-mapped from it. Loaded datasets are kept in LRU order within `max_bytes`: beyond it
+    the least recently used ones are dropped, and mapped again from their snapshot when next requested.
+    Requests already holding an evicted dataset finish on it.
+    """
+
+    def __init__(self, definitions: dict, max_bytes: int):
+        self.definitions = definitions
+        self.max_bytes = max_bytes
+        self._datasets = OrderedDict()
+        self._sizes = {}
+        # Snapshot of every dataset and the state of its source files when it was built
+        self._snapshots = {}
+        self._loading = {}
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+
+    def get(self, dataset_id: str) -> Dataset:
+        """
+        Returns the named dataset, loading it first when it is not loaded.
+
+        Raises:
+        - UnknownDataset: When the dataset is not defined.
+        """
+        if dataset_id not in self.definitions:
+            raise UnknownDataset(f"Unknown dataset: {dataset_id}")
+        with self._lock:
+            if dataset_id in self._datasets:
+                self._datasets.move_to_end(dataset_id)
+                return self._datasets[dataset_id]
+            loading = self._loading.setdefault(dataset_id, threading.Lock())
+
+        # Concurrent requests for the same dataset load it once
+        with loading:
+            with self._lock:
+                if dataset_id in self._datasets:
+                    self._datasets.move_to_end(dataset_id)
+                    return self._datasets[dataset_id]
+            dataset = self._load(dataset_id)
+            with self._lock:
+                self._datasets[dataset_id] = dataset
+                self._sizes[dataset_id] = dataset.nbytes()
+                self.loads += 1
+                self._evict(keep=dataset_id)
+        logger.info("Loaded dataset %s with %d users", dataset_id, len(dataset))
+        return dataset
+
+    def _load(self, dataset_id: str) -> Dataset:
+        definition = self.definitions[dataset_id]
+        stats = source_stats(definition)
+        directory, built_from = self._snapshots.get(dataset_id, (None, None))
+        if directory is None or built_from != stats or not os.path.isfile(os.path.join(directory, META_FILE)):
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                directory = pool.submit(prepare_snapshot, dataset_settings(dataset_id, definition)).result()
+            self._snapshots[dataset_id] = (directory, stats)
+
+        dataset = read_snapshot_dataset(directory)
+        dataset.dataset_id = dataset_id
+        dataset.version = DataManager.next_version()
+        return dataset
+
+    def _evict(self, keep: str):
+        # The dataset just loaded stays, even alone over the budget
+        while sum(self._sizes.values()) > self.max_bytes and len(self._datasets) > 1:
+            dataset_id = next(iter(self._datasets))
+            if dataset_id == keep:
+                self._datasets.move_to_end(dataset_id)
+                continue
+            del self._datasets[dataset_id]
+            del self._sizes[dataset_id]
+            self.evictions += 1
+            logger.info("Evicted dataset %s", dataset_id)
+
+    def status(self) -> dict:
+        with self._lock:
+            loaded = {dataset_id: {"users": len(dataset), "bytes": self._sizes[dataset_id]}
+                      for dataset_id, dataset in self._datasets.items()}
+            return {"datasets": sorted(self.definitions), "loaded": loaded, "bytes": sum(self._sizes.values()),
+                    "max_bytes": self.max_bytes, "loads": self.loads, "evictions": self.evictions}
+
+
+dataset_registry = DatasetRegistry(load_definitions(config.datasets_file), config.dataset_memory_budget_bytes)
+
+
+def check_dataset(dataset: str | None):
+    """
+    Raises UnknownDataset when `dataset` names neither the default dataset nor one of the registry.
+    """
+    if dataset not in (None, DEFAULT_DATASET) and dataset not in dataset_registry.definitions:
+        raise UnknownDataset(f"Unknown dataset: {dataset}")
+
+
+def get_dataset(dataset: str | None = None) -> Dataset:
+    """
+    The dataset a request names, the default one of the DataManager when it names none. Also used as
+    the FastAPI dependency of the targeting endpoints, `dataset` being a query parameter.
+    """
+    if dataset is None or dataset == DEFAULT_DATASET:
+        return DataManager.get_dataset()
+    return dataset_registry.get(dataset)
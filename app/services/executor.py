@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from app import config
+
+logger = logging.getLogger("executor")
+
+
+class ExecutorBusy(Exception):
+    """
+    Raised when the compute pool and its queue are full.
+    """
+
+
+class ComputeExecutor:
+    """
+    Runs the CPU-bound request processing off the event loop, on a thread or process pool.
+
+    At most `max_workers` tasks run at once and at most `max_queue` more wait for a worker; beyond
+    that `run` fails fast with ExecutorBusy instead of letting the backlog grow. Tasks taking longer
+    than the timeout are abandoned by the caller, although they keep their worker until they finish.
+    """
+
+    def __init__(self, kind: str, max_workers: int, max_queue: int, timeout_seconds: float | None):
+        if kind not in ("thread", "process"):
+            raise ValueError("Executor kind must be 'thread' or 'process'.")
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout_seconds = timeout_seconds
+        self._pool = None
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def shares_memory(self) -> bool:
+        """
+        Whether the tasks run in this process and can be handed the dataset directly.
+        """
+        return self.kind == "thread"
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def _get_pool(self):
+        # Created on first use, so importing the app does not spawn workers
+        with self._lock:
+            if self._pool is None:
+                if self.kind == "thread":
+                    self._pool = ThreadPoolExecutor(max_workers=self.max_workers)
+                else:
+                    # Spawned, as forking the serving process copies the locks its other threads may hold
+                    self._pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def _release(self, _future):
+        with self._lock:
+            self._in_flight -= 1
+
+    async def run(self, func, *args):
+        """
+        Runs `func(*args)` on the pool and waits for its result.
+
+        Raises:
+        - ExecutorBusy: When `max_workers + max_queue` tasks are already running or waiting.
+        - asyncio.TimeoutError: When the task does not finish within the timeout.
+        """
+        pool = self._get_pool()
+        with self._lock:
+            if self._in_flight >= self.max_workers + self.max_queue:
+                raise ExecutorBusy(f"{self._in_flight} requests are already being processed")
+            self._in_flight += 1
+
+        try:
+            future = pool.submit(func, *args)
+        except Exception:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout_seconds)
+        except asyncio.TimeoutError:
+            # Frees the slot right away if the task has not started yet
+            future.cancel()
+            logger.warning("Request processing timed out after %s seconds", self.timeout_seconds)
+            raise
+
+    def recycle(self):
+        """
+        Replaces the pool by a new one created on next use. Running and queued tasks finish on the old
+        pool, e.g. process workers holding the previous dataset, then its workers exit.
+        """
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+compute_executor = ComputeExecutor(config.compute_executor, config.compute_max_workers,
+                                   config.compute_max_queue, config.compute_timeout_seconds)
@@ -0,0 +1,172 @@
+import gzip
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from app import config
+from app.api.schemas import UserData
+from . import dataset_registry, sharding
+
+logger = logging.getLogger("export_service")
+
+CSV_GZ = "csv.gz"
+ARROW = "arrow"
+EXPORT_FORMATS = [CSV_GZ, ARROW]
+
+# Rows written at a time, the progress of a job advancing chunk by chunk
+EXPORT_CHUNK_ROWS = 100_000
+
+
+class ExportsBusy(Exception):
+    """
+    Raised when `max_pending` exports are already queued or running.
+    """
+
+
+class ExportManager:
+    """
+    Runs audience exports as background jobs on a pool of their own, so long exports neither hold a
+    request open nor take the workers of the targeting endpoints.
+
+    Jobs are kept in memory, up to `max_jobs` of them; the oldest finished jobs are forgotten beyond
+    that, and their files removed. At most `max_pending` jobs are queued or running at once, further
+    submissions fail fast with ExportsBusy instead of growing the queue.
+    """
+
+    def __init__(self, directory: str, max_workers: int, max_jobs: int, max_pending: int):
+        self.directory = directory
+        self.max_workers = max_workers
+        self.max_jobs = max_jobs
+        self.max_pending = max_pending
+        self._jobs = OrderedDict()
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        # Created on first use, as the compute pool
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="export")
+            return self._pool
+
+    def submit(self, user_data: UserData, format: str = CSV_GZ, columns: list | None = None,
+               dataset: str | None = None) -> dict:
+        """
+        Queues an export of the audience of `user_data` in the named `dataset` (the default one when None)
+        and returns the job right away.
+
+        Raises:
+        - ValueError: When the format is unknown, or needs a library which is not installed.
+        - UnknownDataset: When the dataset is not defined.
+        - ExportsBusy: When `max_pending` exports are already queued or running.
+        """
+        dataset_registry.check_dataset(dataset)
+        if format not in EXPORT_FORMATS:
+            raise ValueError(f"Format must be one of {EXPORT_FORMATS}")
+        if format == ARROW:
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise ValueError("Arrow exports require pyarrow to be installed.")
+
+        job_id = uuid.uuid4().hex
+        job = {"id": job_id, "state": "queued", "dataset": dataset, "format": format, "columns": columns, "rows_total": None,
+               "rows_written": 0, "path": None, "error": None, "created_at": time.time(), "finished_at": None}
+        with self._lock:
+            pending = sum(job["state"] in ("queued", "running") for job in self._jobs.values())
+            if pending >= self.max_pending:
+                raise ExportsBusy(f"{pending} exports are already queued or running")
+            self._jobs[job_id] = job
+            self._forget_old_jobs()
+        self._get_pool().submit(self.run, job, user_data)
+        return self.status(job_id)
+
+    def status(self, job_id: str) -> dict | None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            status = dict(job)
+        status["progress"] = status["rows_written"] / status["rows_total"] if status["rows_total"] else None
+        return status
+
+    def _update(self, job: dict, **fields):
+        with self._lock:
+            job.update(fields)
+
+    def run(self, job: dict, user_data: UserData):
+        try:
+            self._update(job, state="running")
+            result = sharding.compute_target_users(user_data, dataset_registry.get_dataset(job["dataset"]))
+            if not isinstance(result, pd.DataFrame):
+                raise ValueError(result or "The audience could not be computed.")
+            if job["columns"]:
+                unknown = [column for column in job["columns"] if column not in result.columns]
+                if unknown:
+                    raise ValueError(f"Unknown columns: {unknown}")
+                result = result[job["columns"]]
+
+            self._update(job, rows_total=len(result))
+            path = os.path.join(self.directory, f"{job['id']}.{job['format']}")
+            write_export(result, path, job["format"], lambda rows: self._update(job, rows_written=rows))
+            self._update(job, state="completed", path=path, finished_at=time.time())
+            logger.info("Exported %d users to %s", len(result), path)
+        except Exception as e:
+            logger.info("Export %s failed: %s", job["id"], e)
+            self._update(job, state="failed", error=str(e), finished_at=time.time())
+
+    def _forget_old_jobs(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job["state"] in ("completed", "failed")]
+        for job_id in finished[:max(0, len(self._jobs) - self.max_jobs)]:
+            job = self._jobs.pop(job_id)
+            if job["path"] is not None and os.path.exists(job["path"]):
+                os.remove(job["path"])
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+def write_export(result: pd.DataFrame, path: str, format: str, on_progress=None):
+    """
+    Writes the audience to `path` chunk by chunk, to a temporary file moved into place once complete.
+
+    Parameters:
+    - result (pd.DataFrame): The audience, best ranked first.
+    - path (str): The export file.
+    - format (str): `csv.gz` (gzip compressed CSV with a header row) or `arrow` (Arrow IPC file).
+    - on_progress (callable, optional): Called with the number of rows written after every chunk.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    staging = f"{path}.part"
+    chunks = (result.iloc[start:start + EXPORT_CHUNK_ROWS] for start in range(0, max(len(result), 1), EXPORT_CHUNK_ROWS))
+    rows = 0
+    if format == ARROW:
+        import pyarrow as pa
+        schema = pa.Schema.from_pandas(result, preserve_index=False)
+        with pa.OSFile(staging, "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+            for chunk in chunks:
+                writer.write_batch(pa.RecordBatch.from_pandas(chunk, schema=schema, preserve_index=False))
+                rows += len(chunk)
+                if on_progress is not None:
+                    on_progress(rows)
+    else:
+        with gzip.open(staging, "wt", newline="") as file:
+            for i, chunk in enumerate(chunks):
+                chunk.to_csv(file, header=i == 0, index=False)
+                rows += len(chunk)
+                if on_progress is not None:
+                    on_progress(rows)
+    os.replace(staging, path)
+
+
+export_manager = ExportManager(config.export_dir, config.export_max_workers, config.export_max_jobs,
+                               config.export_max_pending)
@@ -0,0 +1,269 @@
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from app import config
+from app.utils.data_manager import DataManager
+from app.utils.dataset import Dataset
+from app.utils.preprocessing import helpers
+import logging
+
+logger = logging.getLogger("ingest_service")
+
+# Columns of the demographic data, as in the demographic CSV
+DEMOGRAPHIC_COLUMNS = ['user_id', 'age', 'gender', 'occupation', 'income', 'interests', 'city']
+
+# Ingestions build on the served dataset, so they run one at a time
+_ingest_lock = threading.Lock()
+# Set while a reload replaces the dataset, see `suspend_ingestion`
+_suspended = False
+
+
+class IngestionSuspended(Exception):
+    """
+    Raised when an ingestion is attempted while the dataset is being reloaded, which would drop its rows.
+    """
+
+
+@contextmanager
+def suspend_ingestion():
+    """
+    Rejects ingestions while the block runs, e.g. while a reload builds and swaps in a dataset that would not
+    hold their rows. Waits for a running ingestion to finish first, so none is swapped in meanwhile.
+    """
+    global _suspended
+    with _ingest_lock:
+        _suspended = True
+    try:
+        yield
+    finally:
+        with _ingest_lock:
+            _suspended = False
+
+
+def ingest(interaction_df: pd.DataFrame | None = None, demographic_df: pd.DataFrame | None = None) -> dict:
+    """
+    Applies a batch of new interactions and new users to the served dataset without reprocessing it.
+
+    The batch is applied to a copy of the dataset, see `apply_batch`, which is then swapped in with
+    `DataManager.swap`: requests holding the previous dataset finish on it unchanged, the next ones get the
+    updated one. The new version invalidates the cached results.
+
+    Parameters:
+    - interaction_df (pd.DataFrame, optional): New interactions with 'user_id', 'survey_type' and 'response' columns.
+    - demographic_df (pd.DataFrame, optional): New users with the columns of the demographic data.
+
+    Returns:
+    - dict: Summary of the ingestion.
+
+    Raises:
+    - IngestionSuspended: While the dataset is being reloaded.
+    """
+    with _ingest_lock:
+        if _suspended:
+            raise IngestionSuspended("The dataset is being reloaded, retry the ingestion once it is done.")
+        dataset = DataManager.get_dataset()
+        updated, summary = apply_batch(dataset, interaction_df, demographic_df)
+        if updated is not dataset:
+            summary["version"] = DataManager.swap(updated).version
+        logger.info("Ingested %s", summary)
+        return summary
+
+
+def apply_batch(dataset: Dataset, interaction_df: pd.DataFrame | None = None,
+                demographic_df: pd.DataFrame | None = None) -> tuple:
+    """
+    Returns a copy of `dataset` with a batch of new interactions and new users applied, `dataset` itself
+    being left untouched for the requests reading it.
+
+    New users are preprocessed alone and appended to the table, then the responses of the batch are added to
+    the interest scores and interaction counts of the users they belong to. The columns the batch modifies are
+    copied whole, the others are shared with `dataset`, and the indexes merge the modified rows into copies of
+    their arrays, see `Dataset.updated`. The ingestion is thus linear in the size of the table, with a smaller
+    constant than a full reprocessing since nothing is re-sorted nor regrouped; `apply_batch` in
+    `benchmarks/bench_suite.py` measures it at a fixed batch size.
+
+    Users already in the dataset are skipped, as are interactions of unknown users, survey types or responses,
+    like the preprocessing does.
+
+    Returns:
+    - tuple: The updated dataset, `dataset` itself when the batch changes nothing, and the summary of the ingestion.
+    """
+    data, added, skipped_users = append_users(dataset, demographic_df)
+    responses = dataset.responses
+    if responses is not None and len(added):
+        responses = np.concatenate([responses, np.zeros((len(added), responses.shape[1]), dtype=responses.dtype)])
+    data, responses, updated, applied = apply_interactions(dataset, data, responses, interaction_df)
+
+    positions = np.union1d(added, updated)
+    if len(positions):
+        dataset = dataset.updated(data, positions, responses)
+        dataset.version = DataManager.next_version(dataset.version)
+
+    n_interactions = 0 if interaction_df is None else len(interaction_df)
+    summary = {
+        "users_added": len(added),
+        "users_skipped": skipped_users,
+        "users_updated": len(updated),
+        "interactions_applied": applied,
+        "interactions_skipped": n_interactions - applied,
+        "version": dataset.version,
+    }
+    return dataset, summary
+
+
+def append_users(dataset: Dataset, demographic_df: pd.DataFrame | None) -> tuple:
+    """
+    Appends the new users of `demographic_df`, without interactions yet, to a copy of the table.
+
+    Returns:
+    - tuple: The table, the positions of the appended rows and the number of users skipped as already known.
+    """
+    if demographic_df is None or not len(demographic_df):
+        return dataset.data, np.zeros(0, dtype=np.int64), 0
+
+    missing = [column for column in DEMOGRAPHIC_COLUMNS if column not in demographic_df.columns]
+    if missing:
+        raise ValueError(f"Missing demographic columns: {missing}")
+
+    new_users = demographic_df.drop_duplicates('user_id')
+    new_users = new_users[dataset.positions_of(new_users['user_id']) < 0]
+    skipped = len(demographic_df) - len(new_users)
+    if not len(new_users):
+        return dataset.data, np.zeros(0, dtype=np.int64), skipped
+
+    rows = preprocess_users(new_users[DEMOGRAPHIC_COLUMNS], dataset.data)
+    columns = {}
+    for column in dataset.data.columns:
+        columns[column], rows[column] = align_column(dataset.data[column], rows[column])
+    data = pd.concat([pd.DataFrame(columns, copy=False), rows[dataset.data.columns]], ignore_index=True)
+    return data, np.arange(len(dataset), len(data)), skipped
+
+
+def preprocess_users(demographic_df: pd.DataFrame, data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Preprocesses new users without interactions, the income quintiles being those of the existing table.
+    """
+    rows = demographic_df.reset_index(drop=True).fillna(0)
+
+    for interest in config.interests_columns:
+        rows[interest] = np.where(rows['interests'] == interest, config.inital_interest_weight, 0)
+    for column in config.interation_columns:
+        rows[column] = 0
+    rows['Total'] = 0
+
+    rows = helpers.categorize_age(rows, config.age_column)
+    rows = helpers.city_mapping(rows)
+    rows = helpers.occupation_mapping(rows)
+
+    # Upper income of every quintile of the existing users, the last one being open-ended
+    upper = data.groupby(config.income_quintile_name_column, observed=True)[config.income_column].max().sort_values()
+    bins = [-np.inf, *upper.to_numpy()[:-1], np.inf]
+    rows[config.income_quintile_name_column] = pd.cut(rows[config.income_column], bins=bins,
+                                                      labels=upper.index.tolist())
+    return rows
+
+
+def align_column(column: pd.Series, values: pd.Series) -> tuple:
+    """
+    Brings new values to the dtype of an existing column, widening the column when they do not fit in it.
+    """
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        unknown = pd.Index(pd.unique(values.dropna().astype(object))).difference(column.cat.categories, sort=False)
+        if len(unknown):
+            column = column.cat.add_categories(unknown)
+        return column, pd.Series(pd.Categorical(values.astype(object), dtype=column.dtype), index=values.index)
+
+    if pd.api.types.is_integer_dtype(column.dtype) and pd.api.types.is_integer_dtype(values.dtype) and len(values):
+        dtype = widened_dtype(column.dtype, values.min(), values.max())
+        if dtype != column.dtype:
+            column = column.astype(dtype)
+        return column, values.astype(dtype)
+
+    if column.dtype == object or values.dtype == object:
+        return column.astype(object), values.astype(object)
+    dtype = np.result_type(column.dtype, values.dtype)
+    return column.astype(dtype, copy=False), values.astype(dtype)
+
+
+def widened_dtype(dtype, low, high):
+    """
+    Integer dtype holding both the values of `dtype` and the range [low, high].
+    """
+    info = np.iinfo(dtype)
+    return np.dtype(helpers.smallest_integer_dtype(min(low, info.min), max(high, info.max)))
+
+
+def apply_interactions(dataset: Dataset, data: pd.DataFrame, responses: np.ndarray | None,
+                       interaction_df: pd.DataFrame | None) -> tuple:
+    """
+    Adds the responses of `interaction_df` to the scores and interaction counts of `data`, the table of
+    `dataset` or a copy of it, and to the `responses` counts, in copies of both.
+
+    Returns:
+    - tuple: The table, the response counts, the positions of the modified rows and the number of
+             interactions applied.
+    """
+    if interaction_df is None or not len(interaction_df):
+        return data, responses, np.zeros(0, dtype=np.int64), 0
+
+    users = pd.DataFrame({'user_id': pd.unique(interaction_df['user_id'])})
+    counts, _, _ = helpers.count_interactions(users, [interaction_df])
+    positions = dataset.positions_of(users['user_id'])
+    if len(data) > len(dataset):
+        # Users appended by the same batch, looked up among the new rows only
+        appended = pd.Index(data['user_id'].iloc[len(dataset):]).get_indexer(users['user_id'])
+        positions = np.where((positions < 0) & (appended >= 0), appended + len(dataset), positions)
+    known = positions >= 0
+    counts, positions = counts[known], positions[known]
+
+    response_weights = np.array([config.yes_interaction_weight,
+                                 config.no_interaction_weight,
+                                 config.neutral_interaction_weight])
+    interaction_counts = counts.sum(axis=2)
+    interaction_columns = [f"{interest}_interaction" for interest in config.interests_columns]
+
+    # Columns are replaced rather than written, the table may be shared with requests
+    data = data.copy(deep=False)
+    add_to_columns(data, config.interests_columns, positions, counts @ response_weights)
+    add_to_columns(data, interaction_columns, positions, interaction_counts)
+    add_to_columns(data, ['Total'], positions, interaction_counts.sum(axis=1, keepdims=True))
+    if responses is not None:
+        responses = add_to_rows(responses, positions, counts.reshape(len(counts), -1))
+    return data, responses, positions, int(counts.sum())
+
+
+def add_to_columns(data: pd.DataFrame, columns: list, positions: np.ndarray, deltas: np.ndarray):
+    """
+    Adds `deltas` of shape (len(positions), len(columns)) to the given rows of `columns`.
+
+    Every column gets a new array, so the previous ones are never modified, and integer columns too narrow
+    for the new values are widened together so that they keep sharing one dtype.
+    """
+    current = np.column_stack([data[column].to_numpy()[positions] for column in columns])
+    updated = current + deltas
+
+    dtype = np.result_type(*[data[column].dtype for column in columns])
+    if np.issubdtype(dtype, np.integer) and len(updated):
+        dtype = widened_dtype(dtype, updated.min(), updated.max())
+
+    for j, column in enumerate(columns):
+        array = data[column].to_numpy().astype(dtype)
+        array[positions] = updated[:, j]
+        data[column] = array
+
+
+def add_to_rows(values: np.ndarray, positions: np.ndarray, deltas: np.ndarray) -> np.ndarray:
+    """
+    Returns a copy of the matrix `values` with `deltas` added to its rows at `positions`, widened when the
+    new values do not fit in its integer dtype.
+    """
+    updated = values[positions] + deltas
+    dtype = values.dtype
+    if np.issubdtype(dtype, np.integer) and len(updated):
+        dtype = widened_dtype(dtype, updated.min(), updated.max())
+    values = values.astype(dtype)
+    values[positions] = updated
+    return values
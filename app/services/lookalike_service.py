@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+from app.api.schemas import LookalikeRequest
+from app.utils.dataset import Dataset, as_dataset
+from app.utils.metrics import stage
+from app import config
+from . import dataset_registry
+from .user_service import build_member_mask
+import logging
+
+logger = logging.getLogger("lookalike_service")
+
+
+def compute_lookalikes(request: LookalikeRequest, data: Dataset | str | None = None) -> pd.DataFrame:
+    """
+    Entry point run on the compute pool, see `user_service.compute_target_users`.
+    """
+    if not isinstance(data, Dataset):
+        data = dataset_registry.get_dataset(data)
+    return find_lookalikes(request, data)
+
+
+def find_lookalikes(request: LookalikeRequest, data: Dataset | pd.DataFrame) -> pd.DataFrame:
+    """
+    Finds the users most similar to a group of seed users, e.g. the converters of a past campaign.
+
+    The seed users are summarized by their mean feature vector, which is searched in the lookalike index of
+    the dataset among the users allowed by the demographic filters of `request.user_data`. The seed users
+    themselves are never returned.
+
+    Args:
+    request (LookalikeRequest): The lookalike request received from the API.
+    data (Dataset | pd.DataFrame): The preprocessed dataset.
+
+    Returns:
+    pd.DataFrame: The lookalike users, most similar first, with their cosine `similarity` to the seeds.
+    """
+    dataset = as_dataset(data)
+    seed_positions = dataset.positions_of(request.seed_user_ids)
+    seed_positions = seed_positions[seed_positions >= 0]
+    if not len(seed_positions):
+        raise ValueError("None of the seed users were found.")
+    logger.debug("Searching lookalikes of %d seed users", len(seed_positions))
+
+    member_mask = None if request.user_data is None else build_member_mask(request.user_data, dataset)
+    number_of_users = request.n_users or config.n_return_users_default
+
+    index = dataset.lookalike_index
+    with stage("lookalike_search"):
+        query = np.asarray(index.vectors[seed_positions], dtype=np.float64).mean(axis=0)
+        positions, similarities = index.search(query, number_of_users, member_mask, exclude=seed_positions,
+                                               n_probe=request.n_probe)
+    with stage("materialize"):
+        return dataset.data.iloc[positions].assign(similarity=similarities)
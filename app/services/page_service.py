@@ -0,0 +1,130 @@
+import base64
+import binascii
+import logging
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from app import config
+from app.api.schemas import UserData
+from app.utils.cache import ResultCache
+from app.utils.dataset import Dataset
+from .user_service import request_weights
+
+logger = logging.getLogger("page_service")
+
+ranking_cache = ResultCache(config.ranking_cache_size, config.ranking_cache_ttl_seconds,
+                            max_bytes=config.ranking_cache_max_bytes)
+
+
+class CursorExpired(Exception):
+    """
+    The ranking a cursor points into is no longer cached: it expired, was evicted, or the dataset changed.
+    """
+
+
+class RankedAudience:
+    """
+    A ranked audience kept between pages: the row positions of its users, best ranked first, and the columns
+    computed for the request rather than read from the table, e.g. the similarity.
+    """
+
+    def __init__(self, positions: np.ndarray, columns: dict, page_size: int):
+        self.positions = positions
+        self.columns = columns
+        # Size of the pages when the next requests do not give one
+        self.page_size = page_size
+
+    @classmethod
+    def of(cls, result: pd.DataFrame, user_data: UserData, dataset: Dataset, page_size: int) -> "RankedAudience":
+        # The labels of the result are positions, the table having a default RangeIndex
+        computed = [column for column in result.columns if column not in dataset.data.columns]
+        if request_weights(user_data) is not None:
+            computed = config.interests_columns + computed
+        return cls(result.index.to_numpy().astype(np.int32), {column: result[column].to_numpy() for column in computed},
+                   page_size)
+
+    @property
+    def nbytes(self) -> int:
+        return self.positions.nbytes + sum(values.nbytes for values in self.columns.values())
+
+    def __len__(self):
+        return len(self.positions)
+
+    def page(self, dataset: Dataset, offset: int, size: int) -> pd.DataFrame:
+        """
+        Users `offset` to `offset + size` of the ranking, materializing these rows only.
+        """
+        window = slice(offset, offset + size)
+        return dataset.data.iloc[self.positions[window]].assign(
+            **{column: values[window] for column, values in self.columns.items()})
+
+
+def encode_cursor(ranking_id: str, offset: int) -> str:
+    return base64.urlsafe_b64encode(f"{ranking_id}:{offset}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        ranking_id, offset = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+        return ranking_id, int(offset)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Invalid cursor.")
+
+
+def first_page(result: pd.DataFrame, user_data: UserData, dataset: Dataset, page_size: int) -> tuple:
+    """
+    First page of a ranked audience. The rest of the ranking is cached under a cursor, so the next pages
+    are slices of the same ranking, random users included, instead of new requests.
+
+    Parameters:
+    - result (pd.DataFrame): The whole audience computed for the request, best ranked first.
+    - user_data (UserData): The request.
+    - dataset (Dataset): The dataset the audience was computed on.
+    - page_size (int): Number of users per page.
+
+    Returns:
+    - tuple: The page, the cursor of the next page (None on the last page) and the size of the audience.
+
+    Raises:
+    - ValueError: When the ranking does not fit in the cache budget.
+    """
+    if page_size <= 0:
+        raise ValueError("page_size must be positive.")
+    if len(result) <= page_size:
+        return result, None, len(result)
+
+    ranking = RankedAudience.of(result, user_data, dataset, page_size)
+    ranking_id = uuid.uuid4().hex
+    if not ranking_cache.put(ranking_id, dataset.version, ranking, ranking.nbytes, dataset.dataset_id):
+        raise ValueError("The audience is too large to be paginated, request fewer users.")
+    logger.debug("Cached a ranking of %d users for pagination", len(ranking))
+    return result.iloc[:page_size], encode_cursor(ranking_id, page_size), len(ranking)
+
+
+def next_page(cursor: str, dataset: Dataset, page_size: int | None = None) -> tuple:
+    """
+    Page of a cached ranking starting at `cursor`, in time proportional to the page size, which defaults
+    to the one of the first page.
+
+    Returns:
+    - tuple: The page, the cursor of the next page (None on the last page) and the size of the audience.
+
+    Raises:
+    - ValueError: When the cursor or the page size is invalid.
+    - CursorExpired: When the ranking is no longer cached.
+    """
+    if page_size is not None and page_size <= 0:
+        raise ValueError("page_size must be positive.")
+    ranking_id, offset = decode_cursor(cursor)
+    ranking = ranking_cache.get(ranking_id, dataset.version, dataset.dataset_id)
+    if ranking is None:
+        raise CursorExpired("The cursor expired, request the first page again.")
+    page_size = page_size or ranking.page_size
+    if not 0 <= offset < len(ranking):
+        raise ValueError("Invalid cursor.")
+
+    end = offset + page_size
+    next_cursor = encode_cursor(ranking_id, end) if end < len(ranking) else None
+    return ranking.page(dataset, offset, page_size), next_cursor, len(ranking)
@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import multiprocessing
+import threading
+import time
+import types
+from concurrent.futures import ProcessPoolExecutor
+
+from fastapi.concurrency import run_in_threadpool
+
+from app import config
+from app.services import ingest_service
+from app.services.executor import compute_executor
+from app.utils.data_loader import load_and_preprocess
+from app.utils.data_manager import DataManager
+from app.utils.dataset import Dataset
+from app.utils.snapshot import ensure_snapshot, read_snapshot_dataset, source_fingerprint
+
+logger = logging.getLogger("reload_service")
+
+
+def config_values() -> dict:
+    # Settings of this process, which a spawned process would otherwise read again from the environment
+    return {name: value for name, value in vars(config).items()
+            if not name.startswith("_") and not isinstance(value, types.ModuleType)}
+
+
+def prepare_snapshot(settings: dict) -> str:
+    """
+    Builds the snapshot of the source files in a spawned process, with the settings of its parent.
+    """
+    for name, value in settings.items():
+        setattr(config, name, value)
+    return ensure_snapshot()
+
+
+def build_dataset() -> Dataset:
+    """
+    Builds the dataset of the current source files. The snapshot is preprocessed in a separate process,
+    so the serving process only maps the result and its requests do not compete with the preprocessing.
+    """
+    if not config.use_snapshot:
+        return Dataset(load_and_preprocess())
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        directory = pool.submit(prepare_snapshot, config_values()).result()
+    return read_snapshot_dataset(directory)
+
+
+class DatasetReloader:
+    """
+    Reloads the dataset in the background and swaps it in once it is fully built, indexes included.
+
+    Requests started before the swap keep the dataset they were handed and finish on it, the next ones get
+    the new one. Only one reload runs at a time.
+    """
+
+    def __init__(self):
+        self.state = "idle"
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self) -> bool:
+        """
+        Starts a reload in a background thread, False when one is already running.
+        """
+        with self._lock:
+            if self.state == "running":
+                return False
+            self.state, self.error, self.started_at = "running", None, time.time()
+        self._thread = threading.Thread(target=self.run, name="dataset-reload", daemon=True)
+        self._thread.start()
+        return True
+
+    def join(self, timeout: float | None = None):
+        """
+        Waits for the running reload, if any, to finish.
+        """
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run(self):
+        try:
+            # Rows ingested during the reload would be lost with the dataset they were applied to
+            with ingest_service.suspend_ingestion():
+                dataset = build_dataset()
+                DataManager.swap(dataset)
+            # Process workers hold the previous dataset, new ones load the new snapshot
+            if not compute_executor.shares_memory:
+                compute_executor.recycle()
+            logger.info("Swapped in dataset version %d with %d users", dataset.version, len(dataset))
+            state, error = "idle", None
+        except Exception as e:
+            logger.exception("Dataset reload failed, still serving the previous dataset")
+            state, error = "failed", str(e)
+        with self._lock:
+            self.state, self.error, self.finished_at = state, error, time.time()
+
+    def status(self) -> dict:
+        dataset = DataManager.loaded_dataset()
+        return {"state": self.state, "error": self.error, "started_at": self.started_at,
+                "finished_at": self.finished_at, "version": None if dataset is None else dataset.version}
+
+    async def watch(self, interval_seconds: float):
+        """
+        Reloads the dataset whenever the source files change. A change is acted upon once the files are
+        unchanged for a whole interval, so files still being written are not loaded.
+        """
+        loaded = await run_in_threadpool(source_fingerprint)
+        previous = loaded
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                current = await run_in_threadpool(source_fingerprint)
+            except OSError as e:
+                # e.g. a source file being replaced
+                logger.warning("Cannot fingerprint the source files: %s", e)
+                continue
+            if current != loaded and current == previous and self.start():
+                logger.info("Source files changed, reloading the dataset")
+                loaded = current
+            previous = current
+
+
+dataset_reloader = DatasetReloader()
@@ -0,0 +1,198 @@
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from app import config
+from app.api.schemas import UserData
+from app.services.executor import compute_executor
+from app.utils.dataset import Dataset
+from app.utils.metrics import stage
+from app.utils.snapshot import read_snapshot
+from . import dataset_registry, user_service
+from .similarity_service import profile_vector, rank_users_by_cosine_similarity, top_users_by_similarity
+
+logger = logging.getLogger("sharding")
+
+# Shard held by this worker process: its dataset, and the global row position of each of its rows
+_shard = None
+
+
+def shard_boundaries(user_ids: np.ndarray, n_shards: int) -> np.ndarray:
+    """
+    User ids splitting the population into `n_shards` ranges of about the same size, shard k holding
+    the users with boundaries[k - 1] <= user_id < boundaries[k].
+    """
+    sorted_ids = np.sort(np.asarray(user_ids))
+    return sorted_ids[[len(sorted_ids) * k // n_shards for k in range(1, n_shards)]]
+
+
+def shard_of(user_ids: np.ndarray, boundaries: np.ndarray) -> np.ndarray:
+    return np.searchsorted(boundaries, np.asarray(user_ids), side="right")
+
+
+def init_shard(directory: str, boundaries: np.ndarray, shard_id: int):
+    """
+    Initializer of the shard workers: maps the snapshot and keeps the rows of the shard, in table order,
+    with indexes of their own.
+    """
+    global _shard
+    data = read_snapshot(directory)
+    global_positions = np.flatnonzero(shard_of(data['user_id'].to_numpy(), boundaries) == shard_id)
+    _shard = (Dataset(data.iloc[global_positions].reset_index(drop=True)), global_positions)
+    logger.info("Shard %d serving %d users", shard_id, len(global_positions))
+
+
+def shard_select(user_data: UserData, num_users: int) -> np.ndarray:
+    """
+    Ranking of a multi-interest request on a shard: the global positions of the top `num_users` users of the shard.
+    """
+    dataset, global_positions = _shard
+    member_mask = user_service.build_member_mask(user_data, dataset)
+    positions, _ = rank_users_by_cosine_similarity(dataset, member_mask, user_service.interest_profile_of(user_data),
+                                                   num_users)
+    return global_positions[positions]
+
+
+class ShardPool:
+    """
+    One single-process pool per shard of the population, each worker holding its rows of the snapshot
+    and the indexes built over them.
+
+    Requests fan out to every shard, which filters and ranks its own rows, and the coordinator merges
+    the per-shard candidates with the full table it already maps. The pools follow the snapshot of the
+    served dataset: the first request on a new snapshot starts new pools, and the previous ones finish the
+    tasks they were given before their workers exit, as `ComputeExecutor.recycle` does. Pools are never
+    started again on a replaced snapshot, whose directory may be removed by then.
+    """
+
+    def __init__(self, n_shards: int):
+        self.n_shards = n_shards
+        self.directory = None
+        self.boundaries = None
+        self._pools = []
+        # Snapshot directories the pools served before the current one
+        self._retired = set()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.n_shards > 1 and config.use_snapshot and compute_executor.shares_memory
+
+    def serves(self, dataset) -> bool:
+        """
+        Whether requests on `dataset` can be sharded: it must be the unmodified snapshot of the default dataset,
+        which the workers map.
+        """
+        return (self.enabled and isinstance(dataset, Dataset) and dataset.snapshot_directory is not None
+                and dataset.dataset_id is None)
+
+    def _pools_for(self, dataset: Dataset) -> list | None:
+        # Called with the lock held
+        if self.directory == dataset.snapshot_directory:
+            return self._pools
+        if dataset.snapshot_directory in self._retired:
+            return None
+        if self.directory is not None:
+            self._retired.add(self.directory)
+        self._shutdown_pools(cancel_futures=False)
+        self.boundaries = shard_boundaries(dataset.data['user_id'].to_numpy(), self.n_shards)
+        # Spawned rather than forked, the serving process runs threads
+        context = multiprocessing.get_context("spawn")
+        self._pools = [ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=init_shard,
+                                           initargs=(dataset.snapshot_directory, self.boundaries, shard_id))
+                       for shard_id in range(self.n_shards)]
+        self.directory = dataset.snapshot_directory
+        logger.info("Started %d shard workers on %s", self.n_shards, self.directory)
+        return self._pools
+
+    def map(self, dataset: Dataset, func, args: list) -> list | None:
+        """
+        Runs `func(*args[k])` on every shard k of `dataset` and returns the results in shard order, None when
+        the snapshot of `dataset` was replaced and its shards are gone, e.g. for a request started before a reload.
+        """
+        with self._lock:
+            pools = self._pools_for(dataset)
+            if pools is None:
+                return None
+            # Submitted with the lock held, so the pools cannot be retired in between
+            futures = [pool.submit(func, *shard_args) for pool, shard_args in zip(pools, args)]
+        return [future.result() for future in futures]
+
+    def _shutdown_pools(self, cancel_futures: bool):
+        for pool in self._pools:
+            pool.shutdown(wait=False, cancel_futures=cancel_futures)
+        self._pools = []
+        self.directory = None
+
+    def shutdown(self):
+        with self._lock:
+            self._shutdown_pools(cancel_futures=True)
+
+
+shard_pool = ShardPool(config.shard_count)
+
+
+def compute_target_users(user_data: UserData, data: Dataset | str | None = None):
+    """
+    Sharded counterpart of `user_service.compute_target_users`, which it falls back to when the dataset
+    cannot be sharded or the request is not sharded, see `is_sharded`.
+    """
+    if not isinstance(data, Dataset):
+        data = dataset_registry.get_dataset(data)
+    if not (shard_pool.serves(data) and is_sharded(user_data)):
+        return user_service.compute_target_users(user_data, data)
+    return user_service.get_target_users(user_data, data, process_user_data_sharded)
+
+
+def is_sharded(user_data: UserData) -> bool:
+    """
+    Whether a request fans out to the shards: multi-interest profiles with the configured scoring weights.
+
+    Single-interest requests are served in process. Their tier selection is already index-backed and cheaper
+    than a fan-out, and their random users could only match the in-process draw by drawing them on the
+    coordinator. Custom scoring weights rebuild the tiers over the whole population, which the shards do not see.
+    """
+    return not user_service.is_single_interest(user_data) and user_service.request_weights(user_data) is None
+
+
+def process_user_data_sharded(user_data: UserData, dataset: Dataset):
+    """
+    Counterpart of `user_service.process_user_data` fanning out to the shards, for the requests of `is_sharded`.
+
+    The result is identical to the in-process one: every shard returns its own top users, ordered the same
+    way since it keeps the table order, and the coordinator ranks their union again.
+    """
+    if not is_sharded(user_data):
+        return user_service.process_user_data(user_data, dataset)
+    try:
+        number_of_users = user_service.request_options(user_data)[1]
+        with stage("shard_select"):
+            selected = shard_pool.map(dataset, shard_select, [(user_data, number_of_users)] * shard_pool.n_shards)
+        if selected is None:
+            return user_service.process_user_data(user_data, dataset)
+        candidates = np.concatenate(selected).astype(np.int64)
+
+        interest_profile = user_service.interest_profile_of(user_data)
+        with stage("shard_merge"):
+            positions, similarities = merge_by_similarity(dataset, candidates, interest_profile, number_of_users)
+        with stage("materialize"):
+            data = dataset.data.iloc[positions].assign(similarity=similarities)
+        return user_service.finalize_result(user_data, data[:number_of_users])
+    except Exception as e:
+        logger.info("An error occurred: %s", e)
+        return None
+
+
+def merge_by_similarity(dataset: Dataset, candidates: np.ndarray, interest_profile: pd.Series,
+                        num_users: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Ranks the similarity candidates of the shards with `top_users_by_similarity`. The similarities of the
+    candidates are bit-identical to the ones of a full pass, and sorting them keeps the row order tie-break.
+    """
+    candidates = np.sort(candidates)
+    similarities = dataset.interest_vectors.cosine_similarity(profile_vector(interest_profile), candidates)
+    return top_users_by_similarity(dataset, candidates, similarities, interest_profile, num_users)
@@ -1,11 +1,18 @@
 import pandas as pd
 import logging
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
 from app import config
+from app.utils.dataset import Dataset
+from app.utils.interest_vectors import cosine_similarity
+from app.utils.metrics import stage
+from app.utils.scoring import rescore
+from app.utils.tier_index import TierIndex, sample_members, take_members
 
 logger = logging.getLogger("similarity_service")
 
+# Similarities equal up to this many decimals are considered tied when ranking
+similarity_decimals = 12
+
 
 def get_lower_confidence_level(current_level):
     """
@@ -19,141 +26,131 @@ def get_lower_confidence_level(current_level):
         return "Low"
 
 
-def add_random_users(df: pd.DataFrame, num_random_users: int, confidence_level: str, interest: str) -> pd.DataFrame:
+def add_random_positions(tier_index: TierIndex, member_mask: np.ndarray | None, num_random_users: int,
+                         confidence_level: str, interest: str, seed: int | None = None,
+                         proportions: list | None = None, exclude: np.ndarray | None = None) -> np.ndarray:
     """
-    Add random users based on the specified proportions from lower confidence levels or users without interactions.
+    Draws random users from the two lower confidence levels and from the users without interactions,
+    using the precomputed tier positions.
+
+    The users are drawn without replacement from the whole pools, so no user is drawn twice, and the
+    cost depends on the number of users drawn rather than on the size of the population.
 
     Parameters:
-    - df (pd.DataFrame): DataFrame containing user data and interest scores.
+    - tier_index (TierIndex): Tier index of the dataset.
+    - member_mask (np.ndarray | None): Boolean array selecting the rows allowed by the demographic filters.
     - num_random_users (int): Number of random users to add.
     - confidence_level (str): The current confidence level.
-    - interest (str): The column name for the specific interest.
+    - interest (str): The specific interest.
+    - seed (int, optional): Seed of the random generator, for reproducible samples. Defaults to None.
+    - proportions (list, optional): Shares of the users drawn from one level lower, two levels lower and
+                                    the users without interactions. Defaults to `config.random_users_proportions`.
+    - exclude (np.ndarray, optional): Positions not to draw, e.g. the users already selected.
 
     Returns:
-    - pd.DataFrame: DataFrame with added random users.
+    - np.ndarray: Row positions of the sampled users.
     """
-    # Determine number of users to add from each lower confidence level
-    num_one_level_lower = int(num_random_users * 0.5)
-    num_two_levels_lower = int(num_random_users * 0.3)
-    num_no_interaction = num_random_users - num_one_level_lower - num_two_levels_lower
-    random_users_df = pd.DataFrame()
+    pools = random_pools(tier_index, interest, confidence_level)
+    # Users without interactions, or the second lower level when the filters allow none of them
+    if not len(take_members(pools[2], member_mask, 1)):
+        pools[2] = pools[1]
 
-    # Determine lower confidence levels
-    lower_confidence_1 = get_lower_confidence_level(confidence_level)
-    lower_confidence_2 = get_lower_confidence_level(lower_confidence_1)
+    rng = np.random.default_rng(seed)
+    sampled = []
+    taken = np.asarray(exclude if exclude is not None else [], dtype=np.int64)
+    for pool, size in zip(pools, random_pool_sizes(num_random_users, proportions)):
+        sampled.append(sample_members(pool, member_mask, size, rng, np.concatenate([taken, *sampled])))
+    return np.concatenate(sampled).astype(np.int32)
 
-    # Get DataFrames for each level
-    df_lower_1 = filter_users_by_interest(df, interest, lower_confidence_1, num_one_level_lower, add_random=None)
-    df_lower_2 = filter_users_by_interest(df, interest, lower_confidence_2, num_two_levels_lower, add_random=None)
-    df_no_interaction = df[df[config.interation_columns].sum(axis=1) == 0]
 
-    # Sample users from each level
-    if num_one_level_lower > 0:
-        random_users_df = pd.concat([random_users_df, df_lower_1.sample(num_one_level_lower, replace=True)])
-
-    if num_two_levels_lower > 0:
-        random_users_df = pd.concat([random_users_df, df_lower_2.sample(num_two_levels_lower, replace=True)])
+def random_pools(tier_index: TierIndex, interest: str, confidence_level: str) -> list:
+    """
+    Positions of the pools the random users are drawn from: the tiers one and two levels lower than
+    `confidence_level`, and the users without interactions.
+    """
+    lower_confidence_1 = get_lower_confidence_level(confidence_level)
+    lower_confidence_2 = get_lower_confidence_level(lower_confidence_1)
+    return [tier_index.get_positions(interest, lower_confidence_1), tier_index.get_positions(interest, lower_confidence_2),
+            tier_index.no_interaction]
 
-    if num_no_interaction > 0:
-        if not df_no_interaction.empty:
-            random_users_df = pd.concat([random_users_df, df_no_interaction.sample(num_no_interaction, replace=True)])
-        else:
-            random_users_df = pd.concat([random_users_df, df_lower_2.sample(num_no_interaction, replace=True)])
 
-    logger.info("Number of added user from one lower confidence level %d", len(df_lower_1))
-    logger.info("Number of added user from two lower confidence level %d", len(df_lower_2))
-    logger.info("Number of added user who do not have any interaction %d", len(df_no_interaction))
+def random_pool_sizes(num_random_users: int, proportions: list | None) -> list:
+    """
+    Number of random users drawn from each of the `random_pools`.
+    """
+    proportions = random_users_proportions(proportions)
+    num_one_level_lower = int(num_random_users * proportions[0])
+    num_two_levels_lower = int(num_random_users * proportions[1])
+    return [num_one_level_lower, num_two_levels_lower, num_random_users - num_one_level_lower - num_two_levels_lower]
 
-    return random_users_df
 
-def is_in_top_3(row, interest_columns, interest):
-    sorted_values = row[interest_columns].sort_values(ascending=False)
-    top_3_values = sorted_values.head(3).values
-    return row[interest] in top_3_values
+def random_users_proportions(proportions: list | None) -> list:
+    """
+    Validates the shares of the random users drawn from each pool, see `add_random_positions`.
+    """
+    if proportions is None:
+        return config.random_users_proportions
+    if len(proportions) != 3 or min(proportions) < 0 or not np.isclose(sum(proportions), 1):
+        raise ValueError("Random user proportions must be three non-negative values summing to 1.")
+    return proportions
 
 
-def filter_users_by_interest(df: pd.DataFrame, interest: str, confidence_level: str, 
-                             num_users: int, add_random: float|None) -> pd.DataFrame:
+def select_users_by_interest(tier_index: TierIndex, member_mask: np.ndarray | None, interest: str,
+                             confidence_level: str, num_users: int, add_random: float|None,
+                             seed: int | None = None, proportions: list | None = None) -> np.ndarray:
     """
-    Filter users based on interest and confidence level using predefined interest columns.
+    Selects the users of a tier with the most interactions with the interest among the rows allowed by
+    `member_mask`, without re-sorting the population, and mixes in random users, see `add_random_positions`.
 
     Parameters:
-    - df (pd.DataFrame): DataFrame containing user data and interest scores.
-    - interest (str): The column name for the specific interest to filter by (must be one of the predefined interests).
-    - confidence_level (str): The confidence level ('very high', 'high', 'good', 'mid', 'low').
+    - tier_index (TierIndex): Tier index of the dataset.
+    - member_mask (np.ndarray | None): Boolean array selecting the rows allowed by the demographic filters.
+    - interest (str): The specific interest to filter by (must be one of the predefined interests).
+    - confidence_level (str): The confidence level ('Very High', 'High', 'Good', 'Mid', 'Low').
     - num_users (int): Number of users to return.
     - add_random (float, optional): Proportion of random users to add (0 to 1). Defaults to None.
+    - seed (int, optional): Seed used to draw the random users, for reproducible results. Defaults to None.
+    - proportions (list, optional): Shares of the random users drawn from each pool, see `add_random_positions`.
 
     Returns:
-    - pd.DataFrame: Filtered DataFrame based on the given confidence level.
+    - np.ndarray: Row positions of the selected users, best ranked first.
     """
-    # Predefined interest columns
-    interest_columns = config.interests_columns
+    if add_random is None:
+        with stage("interest_ranking"):
+            return tier_index.top_positions(interest, confidence_level, member_mask, num_users)
 
-    if interest not in interest_columns:
-        raise ValueError(f"Interest must be one of {interest_columns}")
+    num_random_users = int(num_users * add_random)
+    with stage("interest_ranking"):
+        ranked = tier_index.top_positions(interest, confidence_level, member_mask, num_users)
 
-    sorting_col = f"{interest}_interaction"
+    # Reserve space for the random users, drawn among the users not selected yet
+    reserved = num_users - num_random_users
+    with stage("random_fill"):
+        random_positions = add_random_positions(tier_index, member_mask, num_random_users, confidence_level,
+                                                interest, seed, proportions, exclude=ranked[:reserved])
 
-    # Base filtering based on confidence level
-    if confidence_level == "Very High":
-        conditions = (df[interest] > 0) & (df[[col for col in interest_columns if col != interest]].le(0).all(axis=1))
-        filtered_df = df[conditions].sort_values(by=sorting_col, ascending=False)
+    # Fill any shortfall left by exhausted pools from the ranking
+    combined = np.concatenate([ranked[:reserved], random_positions])
+    shortfall = num_users - len(combined)
+    if shortfall > 0:
+        combined = unique_in_order(np.concatenate([combined, ranked[reserved:]]))
 
-    elif confidence_level == "High":
-        max_interest = df[interest_columns].idxmax(axis=1)
-        conditions = (df[interest] > 0) & (max_interest == interest)
-        filtered_df = df[conditions].sort_values(by=sorting_col, ascending=False)
+    logger.debug("Number of targeted users after final processing %d", len(combined))
+    return combined[:num_users]
 
-    elif confidence_level == "Good":
-        # Apply the function to filter rows
-        filtered_df = df[df.apply(is_in_top_3, axis=1, interest_columns=interest_columns, interest=interest)]
 
-        # Sort the filtered DataFrame by the sorting column in descending order
-        filtered_df = filtered_df.sort_values(by=sorting_col, ascending=False)
-
-    elif confidence_level == "Mid":
-        filtered_df = df[df[interest] >= 0].sort_values(by=sorting_col, ascending=False)
-
-    elif confidence_level == "Low":
-        filtered_df = df.sort_values(by=sorting_col, ascending=False)
-
-    else:
-        raise ValueError("Invalid confidence level. Choose from 'Very high', 'High', 'Good', 'Mid', 'Low'.")
-
-   # Add random users if specified
-    if add_random is not None:
-        num_random_users = int(num_users * add_random)
-        random_users_df = add_random_users(df, num_random_users, confidence_level, interest)
-        logger.info("Number of random users %d", len(random_users_df))
-        logger.info("Number of filtered users before adding random users %d", len(filtered_df))
-    
-        # Trim the filtered_df to leave space for random users
-        filtered_df_temp = filtered_df[:(num_users - num_random_users)]
-        logger.info("Number of filtered users after reserving space for random users %d", len(filtered_df_temp))
-    
-        # Combine filtered_df and random_users_df, then drop duplicates
-        combined_df = pd.concat([filtered_df_temp, random_users_df]).drop_duplicates().reset_index(drop=True)
-        logger.info("Number of users after adding random users and dropping duplicates %d", len(combined_df))
-    
-        # Calculate shortfall and add more users from the filtered_df if needed
-        shortfall = num_users - len(combined_df)
-        if shortfall > 0:
-            additional_users = filtered_df[len(filtered_df_temp):(len(filtered_df_temp) + shortfall)]
-            combined_df = pd.concat([combined_df, additional_users]).drop_duplicates().reset_index(drop=True)
-            logger.info("Number of users after filling shortfall %d", len(combined_df))
-
-        filtered_df = combined_df
-
-        logger.info("Number of targeted users after final processing %d", len(filtered_df))
-
-    return filtered_df.head(num_users)
+def unique_in_order(positions: np.ndarray) -> np.ndarray:
+    """
+    Drops repeated positions, keeping the first occurrence of each.
+    """
+    _, first = np.unique(positions, return_index=True)
+    return positions[np.sort(first)]
 
 
 def sort_users_by_cosine_similarity(df: pd.DataFrame, interest_profile: pd.Series) -> pd.DataFrame:
     """
     Sorts users based on the cosine similarity between their interest scores and a given interest profile
-    using Scikit-learn's cosine_similarity function. In case of ties in similarity, it sorts based on the weights
+    using the NumPy `cosine_similarity` kernel of `app.utils.interest_vectors`. In case of ties in similarity, it sorts based on the weights
     in the interest profile from highest to lowest.
 
     Parameters:
@@ -180,8 +177,8 @@ def sort_users_by_cosine_similarity(df: pd.DataFrame, interest_profile: pd.Serie
     # Calculate cosine similarities
     similarities = cosine_similarity(user_interests, profile_array).flatten()
 
-    # Add similarity scores to the DataFrame
-    df['similarity'] = similarities
+    # Add similarity scores to a copy, the input may be the shared dataset
+    df = df.assign(similarity=similarities)
 
     # Create a list of columns sorted by the weight in the interest profile
     sorted_interests = interest_profile.sort_values(ascending=False).index.tolist()
@@ -189,4 +186,114 @@ def sort_users_by_cosine_similarity(df: pd.DataFrame, interest_profile: pd.Serie
     # Sort by similarity score (descending), and by interest weights in descending order as tiebreakers
     sorted_df = df.sort_values(by=['similarity'] + sorted_interests, ascending=[False] + [False] * len(sorted_interests))
 
-    return sorted_df
\ No newline at end of file
+    return sorted_df
+
+
+def profile_vector(interest_profile: pd.Series) -> np.ndarray:
+    """
+    Validates an interest profile and returns its weights aligned with `config.interests_columns`,
+    interests missing from the profile having no weight.
+    """
+    if not np.isclose(interest_profile.sum(), 1):
+        raise ValueError("The sum of the interest profile values must be 1.")
+
+    interest_columns = config.interests_columns
+    if set(interest_profile.index) - set(interest_columns):
+        raise ValueError(f"Interest must be one of {interest_columns}")
+
+    return interest_profile.reindex(interest_columns, fill_value=0).to_numpy(dtype=float)
+
+
+def rank_users_by_cosine_similarity(dataset: Dataset, member_mask: np.ndarray | None, interest_profile: pd.Series,
+                                    num_users: int, weights: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Top-k counterpart of `sort_users_by_cosine_similarity`: returns the `num_users` users most similar to the
+    interest profile among the rows allowed by `member_mask`, in the same order, without sorting the population
+    or touching the DataFrame.
+
+    Similarities come from a single product against the unit interest vectors cached at load time, the
+    ranking itself is done by `top_users_by_similarity`. With custom scoring weights, the scores of the
+    members are recomputed from their response counts first.
+
+    Parameters:
+    - dataset (Dataset): The dataset to rank.
+    - member_mask (np.ndarray | None): Boolean array selecting the rows allowed by the demographic filters.
+    - interest_profile (pd.Series): Weights by interest, summing to 1.
+    - num_users (int): Number of users to return.
+    - weights (np.ndarray, optional): Scoring weights replacing the configured ones, see `scoring.rescore`.
+
+    Returns:
+    - tuple: Row positions of the selected users, best ranked first, and their similarities.
+    """
+    if weights is None:
+        return rank_users_by_cosine_similarity_batch(dataset, member_mask, [interest_profile], [num_users])[0]
+
+    profile = profile_vector(interest_profile)
+    with stage("interest_ranking"):
+        positions = np.arange(len(dataset)) if member_mask is None else np.flatnonzero(member_mask)
+        scores = rescore(dataset, positions, weights)
+        similarities = cosine_similarity(scores, profile.reshape(1, -1))[:, 0]
+        return top_users_by_similarity(dataset, positions, similarities, interest_profile, num_users, scores)
+
+
+def rank_users_by_cosine_similarity_batch(dataset: Dataset, member_mask: np.ndarray | None, interest_profiles: list,
+                                          num_users: list) -> list:
+    """
+    Ranks the rows allowed by `member_mask` against several interest profiles, computing the similarities of
+    all the profiles with one product over the interest vectors.
+
+    Parameters:
+    - dataset (Dataset): The dataset to rank.
+    - member_mask (np.ndarray | None): Boolean array selecting the rows allowed by the demographic filters.
+    - interest_profiles (List[pd.Series]): Weights by interest, each summing to 1.
+    - num_users (List[int]): Number of users to return for each profile.
+
+    Returns:
+    - list: One (positions, similarities) tuple per profile, as returned by `rank_users_by_cosine_similarity`.
+    """
+    profiles = np.array([profile_vector(profile) for profile in interest_profiles]).reshape(len(interest_profiles), -1)
+
+    with stage("interest_ranking"):
+        positions = None if member_mask is None else np.flatnonzero(member_mask)
+        similarities = dataset.interest_vectors.cosine_similarities(profiles, positions)
+        if positions is None:
+            positions = np.arange(len(similarities))
+
+        return [top_users_by_similarity(dataset, positions, similarities[:, i], profile, count)
+                for i, (profile, count) in enumerate(zip(interest_profiles, num_users))]
+
+
+def top_users_by_similarity(dataset: Dataset, positions: np.ndarray, similarities: np.ndarray,
+                            interest_profile: pd.Series, num_users: int,
+                            scores: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Selects the `num_users` most similar users without sorting all of them.
+
+    The candidates are narrowed down with `np.partition` (keeping every user tied with the k-th similarity),
+    then only those are ordered by similarity and, on ties, by the profile interests from the highest weight
+    to the lowest, and finally by row order. Similarities are compared up to `similarity_decimals` decimals,
+    so floating point noise does not decide between users that tie exactly. The interest scores are those of
+    the dataset, unless `scores` gives them for every user at `positions`.
+    """
+    # Users pointing in the same direction must tie even when their similarities differ in the last bits
+    ranking_keys = np.round(similarities, similarity_decimals)
+
+    if num_users < len(ranking_keys):
+        kth = len(ranking_keys) - num_users
+        threshold = np.partition(ranking_keys, kth)[kth]
+        candidates = np.flatnonzero(ranking_keys >= threshold)
+    else:
+        candidates = np.arange(len(ranking_keys))
+
+    # np.lexsort uses the last key as the primary one
+    sorted_interests = interest_profile.sort_values(ascending=False).index.tolist()
+    # Widened before negating, so narrow integer scores cannot overflow
+    if scores is None:
+        tie_breakers = [-dataset.data[interest].to_numpy()[positions[candidates]].astype(np.float64)
+                        for interest in reversed(sorted_interests)]
+    else:
+        tie_breakers = [-scores[candidates, config.interests_columns.index(interest)].astype(np.float64)
+                        for interest in reversed(sorted_interests)]
+    order = candidates[np.lexsort([candidates] + tie_breakers + [-ranking_keys[candidates]])][:num_users]
+
+    return positions[order], similarities[order]
@@ -1,73 +1,244 @@
+import hashlib
+import json
+import numpy as np
 import pandas as pd
 from app.api.schemas import UserData
 from app import config
-from app.utils.helpers import filter_by_intervals, filter_by_feature
-from .similarity_service import sort_users_by_cosine_similarity, filter_users_by_interest
-import logging 
+from app.utils.cache import ResultCache
+from app.utils.helpers import FilterSelection
+from app.utils.dataset import Dataset, as_dataset
+from app.utils.metrics import stage
+from app.utils.scoring import RescoredTiers, default_weights, rescore
+from .similarity_service import (rank_users_by_cosine_similarity, rank_users_by_cosine_similarity_batch,
+                                 select_users_by_interest, profile_vector)
+from . import dataset_registry
+import logging
 
 logger = logging.getLogger("user_service")
 
+result_cache = ResultCache(config.result_cache_size, config.result_cache_ttl_seconds,
+                           max_bytes=config.result_cache_max_bytes)
 
-def process_user_data(user_data: UserData, data: pd.DataFrame) -> pd.DataFrame:
+# UserData fields restricting the population, requests agreeing on all of them share the same filter mask
+FILTER_FIELDS = ['age', 'age_group', 'city', 'region', 'gender', 'income', 'income_group', 'occupation', 'occupation_category']
+
+
+def compute_target_users(user_data: UserData, data: Dataset | str | None = None):
+    """
+    Entry point run on the compute pool. Process pool workers are not handed the dataset but its id, and
+    use the one of their own DataManager or registry, which maps the shared snapshot.
+    """
+    if not isinstance(data, Dataset):
+        data = dataset_registry.get_dataset(data)
+    return get_target_users(user_data, data)
+
+
+def compute_target_users_batch(user_data_list: list, data: Dataset | str | None = None) -> list:
+    """
+    Batch counterpart of `compute_target_users`.
+    """
+    if not isinstance(data, Dataset):
+        data = dataset_registry.get_dataset(data)
+    return process_user_data_batch(user_data_list, data)
+
+
+def get_target_users(user_data: UserData, data: Dataset | pd.DataFrame, process=None):
+    """
+    Cached front of `process_user_data`.
+
+    Only reproducible requests are cached: multi-interest profiles, and single-interest requests carrying a
+    seed for their random users. Entries are keyed by the canonical request and the dataset version, so
+    reloading the data invalidates them, and weigh their memory usage against `config.result_cache_max_bytes`,
+    so large audiences, e.g. bulk exports, evict the least recently used results or are not kept at all.
+    Messages and failures are not cached.
+
+    Args:
+    user_data (UserData): The user data received from the API.
+    data (Dataset | pd.DataFrame): The preprocessed dataset.
+    process (callable, optional): Function computing the result, `process_user_data` by default.
+
+    Returns:
+    The result of `process_user_data`, which must not be modified since it may be shared.
+    """
+    if process is None:
+        process = process_user_data
+    if not (isinstance(data, Dataset) and is_reproducible(user_data)):
+        return process(user_data, data)
+
+    key = request_key(user_data)
+    result = result_cache.get(key, data.version, data.dataset_id)
+    if result is None:
+        result = process(user_data, data)
+        if isinstance(result, pd.DataFrame) and len(result):
+            result_cache.put(key, data.version, result, int(result.memory_usage().sum()), data.dataset_id)
+    return result
+
+
+def process_user_data(user_data: UserData, data: Dataset | pd.DataFrame) -> pd.DataFrame:
     """
     Process the user data for profile computation.
 
     Args:
     user_data (UserData): The user data received from the API.
+    data (Dataset | pd.DataFrame): The preprocessed dataset, a bare DataFrame gets its indexes built on the fly.
 
     Returns:
     dict: A dictionary containing the processed results or status.
     """
     try:
+        dataset = as_dataset(data)
         # Perform processing logic here.
-        logger.info( "Processing user data start with %d data points ", len(data))
-        ## filters by age
-        data = filter_by_intervals(data, user_data.age, config.age_column)
-        data = filter_by_feature(data, user_data.age_group, config.age_group_name_column)
+        logger.debug("Processing user data start with %d data points", len(dataset))
+        member_mask = build_member_mask(user_data, dataset)
+
+        data = handle_interest_profile(user_data, member_mask, dataset)
+        return finalize_result(user_data, data)
+    except Exception as e:
+        logger.info("An error occurred: %s", e)
+        return None
+
+
+def process_user_data_batch(user_data_list: list, data: Dataset | pd.DataFrame) -> list:
+    """
+    Process several user data requests at once, e.g. all the campaigns of a planning run.
 
-        logger.info( "Remaining data points after filtering by age %d", len(data))
+    Requests sharing the same demographic filters are grouped so the filter mask is computed once per
+    group, and the multi-interest profiles of a group are all ranked with one similarity product.
 
-        ## filters by city and region
-        data = filter_by_feature(data, user_data.city, config.city_column)
-        data = filter_by_feature(data, user_data.region, config.region_column)
+    Args:
+    user_data_list (List[UserData]): The user data received from the API.
+    data (Dataset | pd.DataFrame): The preprocessed dataset.
 
-        logger.info( "Remaining data points after filtering by city and region %d", len(data))
+    Returns:
+    list: One result per request, as returned by `process_user_data`.
+    """
+    dataset = as_dataset(data)
+    results = [None] * len(user_data_list)
 
-        ## filter by gender
-        data = filter_by_feature(data, user_data.gender, config.gender_column)
+    groups = {}
+    for i, user_data in enumerate(user_data_list):
+        groups.setdefault(filter_key(user_data), []).append(i)
+    logger.info("Processing %d user data requests in %d filter groups", len(user_data_list), len(groups))
 
-        logger.info( "Remaining data points after filtering by gender %d", len(data))
+    for indices in groups.values():
+        try:
+            member_mask = build_member_mask(user_data_list[indices[0]], dataset)
+        except Exception as e:
+            logger.info("An error occurred: %s", e)
+            continue
 
-        ## filters by income
-        data = filter_by_intervals(data, user_data.income, config.income_column)
-        data = filter_by_feature(data, user_data.income_group, config.income_quintile_name_column)
+        profiles = {}
+        for i in indices:
+            user_data = user_data_list[i]
+            try:
+                if is_single_interest(user_data) or request_weights(user_data) is not None:
+                    results[i] = finalize_result(user_data, handle_interest_profile(user_data, member_mask, dataset))
+                else:
+                    profiles[i] = interest_profile_of(user_data)
+                    profile_vector(profiles[i])
+            except Exception as e:
+                logger.info("An error occurred: %s", e)
 
-        logger.info( "Remaining data points after filtering by income %d", len(data))
+        if profiles:
+            try:
+                number_of_users = [request_options(user_data_list[i])[1] for i in profiles]
+                rankings = rank_users_by_cosine_similarity_batch(dataset, member_mask, list(profiles.values()),
+                                                                 number_of_users)
+            except Exception as e:
+                logger.info("An error occurred: %s", e)
+                continue
+            for i, (positions, similarities) in zip(profiles, rankings):
+                with stage("materialize"):
+                    data = dataset.data.iloc[positions].assign(similarity=similarities)
+                results[i] = finalize_result(user_data_list[i], data)
 
-        ## filters by occupation
-        data = filter_by_feature(data, user_data.occupation, config.occupation_column)
-        data = filter_by_feature(data, user_data.occupation_category, config.occupation_category_column)
+    return results
 
-        logger.info( "Remaining data points after filtering by occupation %d", len(data))
 
-        data = handle_interest_profile(user_data, data)
-        if user_data.n_users and isinstance(user_data.n_users, int):
-            data = data[:user_data.n_users]
-        
-        if len(data) == 0:
-            return "Please use more easier limitations."
-        return data
-    except Exception as e:
-        logger.info("An error occurred: %s", e)
-        return None
+def is_reproducible(user_data: UserData) -> bool:
+    if user_data.interest is None:
+        return False
+    return user_data.seed is not None or not is_single_interest(user_data)
+
+
+def request_key(user_data: UserData) -> str:
+    canonical = json.dumps(user_data.model_dump(), sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
 
+def build_member_mask(user_data: UserData, dataset: Dataset) -> np.ndarray | None:
+    """
+    Combines the demographic filters of the request into a boolean mask over the dataset rows,
+    None when the request does not filter at all.
+    """
+    selection = dataset.filter_index.selection()
+
+    ## filters by age
+    with stage("age"):
+        selection.by_intervals(user_data.age, config.age_column)
+        selection.by_feature(user_data.age_group, config.age_group_name_column)
+
+    log_remaining("Remaining data points after filtering by age %d", selection)
+
+    ## filters by city and region
+    with stage("location"):
+        selection.by_feature(user_data.city, config.city_column)
+        selection.by_feature(user_data.region, config.region_column)
+
+    log_remaining("Remaining data points after filtering by city and region %d", selection)
+
+    ## filter by gender
+    with stage("gender"):
+        selection.by_feature(user_data.gender, config.gender_column)
+
+    log_remaining("Remaining data points after filtering by gender %d", selection)
+
+    ## filters by income
+    with stage("income"):
+        selection.by_intervals(user_data.income, config.income_column)
+        selection.by_feature(user_data.income_group, config.income_quintile_name_column)
+
+    log_remaining("Remaining data points after filtering by income %d", selection)
+
+    ## filters by occupation
+    with stage("occupation"):
+        selection.by_feature(user_data.occupation, config.occupation_column)
+        selection.by_feature(user_data.occupation_category, config.occupation_category_column)
+
+    log_remaining("Remaining data points after filtering by occupation %d", selection)
+
+    with stage("mask"):
+        return selection.mask()
+
+
+def filter_key(user_data: UserData) -> tuple:
+    return tuple(repr(getattr(user_data, field)) for field in FILTER_FIELDS)
+
+
+def log_remaining(message: str, selection: FilterSelection):
+    # Counting the selected rows costs a pass over the bitmap, so only do it when the message is emitted
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(message, selection.count())
+
+
+def finalize_result(user_data: UserData, data: pd.DataFrame):
+    if user_data.n_users and isinstance(user_data.n_users, int):
+        data = data[:user_data.n_users]
 
-def handle_interest_profile(user_data: UserData, data: pd.DataFrame) -> str:
+    if len(data) == 0:
+        return "Please use more easier limitations."
+    return data
+
+
+def request_options(user_data: UserData) -> tuple:
+    """
+    Returns the confidence level, number of users and proportion of random users of the request, defaults applied.
+    """
     confidence_level = user_data.confidence_level
     if not confidence_level:
         confidence_level = "Low"
 
-    number_of_users = user_data.n_users 
+    number_of_users = user_data.n_users
     if not number_of_users:
         number_of_users = config.n_return_users_default
 
@@ -75,13 +246,52 @@ def handle_interest_profile(user_data: UserData, data: pd.DataFrame) -> str:
     if not random_users_percent:
         random_users_percent = config.random_users_percent_default
 
-    random_users_percent = random_users_percent / 100
-    
-    if user_data:
-        if sum(1 for item in user_data.interest.weights if item > 0) == 1:
-            data = filter_users_by_interest(data, user_data.interest.interests[0], confidence_level, num_users=number_of_users, add_random=random_users_percent)
-        else:
-            interest_profile = pd.Series(data=user_data.interest.weights, index=user_data.interest.interests)
-            data = sort_users_by_cosine_similarity(data, interest_profile)
-        
-    return data[:number_of_users]
\ No newline at end of file
+    return confidence_level, number_of_users, random_users_percent / 100
+
+
+def request_weights(user_data: UserData) -> np.ndarray | None:
+    """
+    Scoring weights of the request (declared interest, Yes, No, Neutral), None when they are the configured ones.
+    """
+    if user_data.scoring_weights is None:
+        return None
+    requested = user_data.scoring_weights
+    weights = default_weights()
+    for i, value in enumerate([requested.initial_interest, requested.yes, requested.no, requested.neutral]):
+        if value is not None:
+            weights[i] = value
+    return None if np.array_equal(weights, default_weights()) else weights
+
+
+def is_single_interest(user_data: UserData) -> bool:
+    return sum(1 for item in user_data.interest.weights if item > 0) == 1
+
+
+def interest_profile_of(user_data: UserData) -> pd.Series:
+    return pd.Series(data=user_data.interest.weights, index=user_data.interest.interests)
+
+
+def handle_interest_profile(user_data: UserData, member_mask: np.ndarray | None, dataset: Dataset) -> pd.DataFrame:
+    confidence_level, number_of_users, random_users_percent = request_options(user_data)
+    weights = request_weights(user_data)
+
+    if is_single_interest(user_data):
+        # Custom weights move users between tiers, which are then rebuilt over the members only
+        tier_index = dataset.tier_index if weights is None else RescoredTiers(dataset, member_mask, weights)
+        positions = select_users_by_interest(tier_index, member_mask, user_data.interest.interests[0],
+                                             confidence_level, num_users=number_of_users, add_random=random_users_percent,
+                                             seed=user_data.seed, proportions=user_data.random_user_proportions)
+        with stage("materialize"):
+            data = dataset.data.iloc[positions]
+    else:
+        positions, similarities = rank_users_by_cosine_similarity(dataset, member_mask, interest_profile_of(user_data),
+                                                                  number_of_users, weights)
+        with stage("materialize"):
+            data = dataset.data.iloc[positions].assign(similarity=similarities)
+
+    if weights is not None:
+        # The interest scores returned are the ones the users were ranked by
+        scores = rescore(dataset, positions, weights)
+        data = data.assign(**{interest: scores[:, i] for i, interest in enumerate(config.interests_columns)})
+
+    return data[:number_of_users]
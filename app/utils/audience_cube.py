@@ -0,0 +1,169 @@
+import numpy as np
+import pandas as pd
+
+from app import config
+from app.utils.confidence import compute_confidence_masks
+
+
+def _native(value):
+    # Native Python values so the cube can be persisted as JSON metadata
+    return getattr(value, "item", lambda: value)()
+
+
+class AudienceCube:
+    """
+    Number of users in every cell of the cross-tabulation of the categorical demographic columns, overall
+    and for every (interest, confidence level) tier.
+
+    The cube is built at load time, so the size of an audience defined by these columns is a sum over a
+    few thousand cells instead of a pass over the population. Missing values get a cell of their own,
+    which no filter ever selects.
+    """
+
+    columns = [config.gender_column, config.region_column, config.age_group_name_column,
+               config.income_quintile_name_column, config.occupation_category_column]
+
+    def __init__(self, data: pd.DataFrame):
+        self.values = {column: [_native(value) for value in pd.unique(data[column].dropna())]
+                       for column in self.columns if column in data.columns}
+        self._value_codes = None
+        self.n_rows = 0
+        self.cells = np.zeros(0, dtype=np.int32)
+        self.levels = np.zeros((0, len(config.interests_columns)), dtype=np.uint8)
+        self.total = np.zeros(self.shape, dtype=np.int64)
+        self.tiers = np.zeros((len(config.interests_columns), len(config.confidence_level_list), *self.shape),
+                              dtype=np.int64)
+        self.update(data, np.arange(len(data)))
+
+    @property
+    def shape(self) -> tuple:
+        return tuple(len(values) + 1 for values in self.values.values())
+
+    def state(self) -> dict:
+        """
+        Arrays and metadata describing the cube, see `from_state`.
+        """
+        return {"values": [[column, values] for column, values in self.values.items()], "n_rows": self.n_rows,
+                "cells": self.cells, "levels": self.levels, "total": self.total, "tiers": self.tiers}
+
+    @classmethod
+    def from_state(cls, state: dict) -> "AudienceCube":
+        """
+        Rebuilds a cube from `state()` without touching the table, e.g. from memory-mapped arrays.
+        """
+        cube = cls.__new__(cls)
+        cube.values = {column: values for column, values in state["values"]}
+        cube.n_rows = state["n_rows"]
+        for name in ["cells", "levels", "total", "tiers"]:
+            setattr(cube, name, state[name])
+        return cube
+
+    def row_cells(self, rows: pd.DataFrame) -> np.ndarray | None:
+        """
+        Flat cell of every row, None when a row holds a value missing from the cube.
+        """
+        codes = []
+        for column, values in self.values.items():
+            column_codes = pd.Index(values).get_indexer(rows[column])
+            unknown = column_codes < 0
+            if (unknown & rows[column].notna().to_numpy()).any():
+                return None
+            column_codes[unknown] = len(values)
+            codes.append(column_codes)
+        if not codes:
+            return np.zeros(len(rows), dtype=np.int32)
+        return np.ravel_multi_index(codes, self.shape).astype(np.int32)
+
+    def row_levels(self, rows: pd.DataFrame) -> np.ndarray:
+        """
+        Confidence levels of every row and interest, as a bit per level.
+        """
+        masks = compute_confidence_masks(rows[config.interests_columns].to_numpy())
+        levels = np.zeros((len(rows), len(config.interests_columns)), dtype=np.uint8)
+        for bit, level in enumerate(config.confidence_level_list):
+            levels |= masks[level].astype(np.uint8) << bit
+        return levels
+
+    def update(self, data: pd.DataFrame, positions: np.ndarray):
+        """
+        Moves the rows at `positions`, which were modified or appended to `data`, to their cells and tiers.
+        The cube is rebuilt when a row brings a value it does not know.
+        """
+        positions = np.unique(np.asarray(positions, dtype=np.int64))
+        rows = data.iloc[positions]
+        cells = self.row_cells(rows)
+        if cells is None:
+            self.__init__(data)
+            return
+        levels = self.row_levels(rows)
+
+        # Writable copies, the arrays may be mapped from a snapshot
+        total, tiers = self.total.copy(), self.tiers.copy()
+        flat_total, flat_tiers = total.reshape(-1), tiers.reshape(tiers.shape[0], tiers.shape[1], -1)
+        known = positions[positions < self.n_rows]
+        self._add(flat_total, flat_tiers, self.cells[known], self.levels[known], -1)
+        self._add(flat_total, flat_tiers, cells, levels, 1)
+
+        grown_cells = np.zeros(len(data), dtype=np.int32)
+        grown_cells[:self.n_rows] = self.cells
+        grown_cells[positions] = cells
+        grown_levels = np.zeros((len(data), len(config.interests_columns)), dtype=np.uint8)
+        grown_levels[:self.n_rows] = self.levels
+        grown_levels[positions] = levels
+        self.cells, self.levels, self.total, self.tiers = grown_cells, grown_levels, total, tiers
+        self.n_rows = len(data)
+
+    @staticmethod
+    def _add(flat_total: np.ndarray, flat_tiers: np.ndarray, cells: np.ndarray, levels: np.ndarray, sign: int):
+        n_cells = len(flat_total)
+        flat_total += sign * np.bincount(cells, minlength=n_cells)
+        for i in range(flat_tiers.shape[0]):
+            for bit in range(flat_tiers.shape[1]):
+                member = (levels[:, i] >> bit) & 1 == 1
+                flat_tiers[i, bit] += sign * np.bincount(cells[member], minlength=n_cells)
+
+    def count(self, selections: dict, interest: str | None = None, confidence_level: str | None = None) -> int:
+        """
+        Number of users matching the selections, and belonging to the tier when an interest is given.
+
+        Parameters:
+        - selections (dict): Accepted values by column of `columns`, as a value or a list of them. Columns
+                             missing or set to None are not filtered.
+        - interest (str, optional): Interest of the tier.
+        - confidence_level (str, optional): Confidence level of the tier, required with an interest.
+
+        Returns:
+        - int: The audience size.
+        """
+        counts = self.total
+        if interest is not None:
+            if interest not in config.interests_columns:
+                raise ValueError(f"Interest must be one of {config.interests_columns}")
+            if confidence_level not in config.confidence_level_list:
+                raise ValueError("Invalid confidence level. Choose from 'Very high', 'High', 'Good', 'Mid', 'Low'.")
+            counts = self.tiers[config.interests_columns.index(interest),
+                                config.confidence_level_list.index(confidence_level)]
+
+        # Unfiltered columns are summed out first, so the selections only index the remaining axes
+        filtered = [axis for axis, column in enumerate(self.values) if selections.get(column)]
+        unfiltered = tuple(axis for axis in range(len(self.values)) if axis not in filtered)
+        if unfiltered:
+            counts = counts.sum(axis=unfiltered)
+        indices = []
+        for column in (list(self.values)[axis] for axis in filtered):
+            selected = selections[column]
+            if isinstance(selected, str):
+                selected = [selected]
+            codes = self.value_codes[column]
+            indices.append(sorted({codes[value] for value in selected if value in codes}))
+        return int(counts[np.ix_(*indices)].sum()) if indices else int(counts)
+
+    @property
+    def value_codes(self) -> dict:
+        """
+        Cell index of every value, by column.
+        """
+        if getattr(self, "_value_codes", None) is None:
+            self._value_codes = {column: {value: code for code, value in enumerate(values)}
+                                 for column, values in self.values.items()}
+        return self._value_codes
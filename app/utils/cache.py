@@ -0,0 +1,96 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResultCache:
+    """
+    Thread-safe LRU cache whose entries also expire after a time to live.
+
+    Entries belong to a dataset version: as soon as the cache is used with a newer version,
+    everything stored for the older ones is dropped. Several datasets can share the cache, each
+    under its own `namespace` whose entries and version are independent of the others.
+
+    With `max_bytes`, the entries are also evicted once their sizes, as given to `put`, add up to more
+    than the budget.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float, max_bytes: int | None = None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _check_version(self, version, namespace):
+        if namespace not in self._versions:
+            self._versions[namespace] = version
+        elif version != self._versions[namespace]:
+            for key in [key for key in self._entries if key[0] == namespace]:
+                self._remove(key)
+            self._versions[namespace] = version
+
+    def _remove(self, key):
+        self._bytes -= self._entries.pop(key)[2]
+
+    def get(self, key, version, namespace=None):
+        """
+        Returns the value cached under `key` for the dataset `version`, None on a miss.
+        """
+        key = (namespace, key)
+        with self._lock:
+            self._check_version(version, namespace)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, version, value, size: int = 0, namespace=None) -> bool:
+        """
+        Caches `value` under `key` for the dataset `version`, False when it is larger than the whole budget.
+        """
+        if self.max_size <= 0 or (self.max_bytes is not None and size > self.max_bytes):
+            return False
+        key = (namespace, key)
+        with self._lock:
+            self._check_version(version, namespace)
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_size or (self.max_bytes is not None and self._bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "dataset_version": self._versions.get(None),
+            }
+            if self.max_bytes is not None:
+                stats.update(bytes=self._bytes, max_bytes=self.max_bytes)
+            return stats
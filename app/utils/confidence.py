@@ -0,0 +1,76 @@
+import numpy as np
+
+from app import config
+
+
+def _very_high(values: np.ndarray) -> np.ndarray:
+    # The interest is the only one with a positive score
+    positive = values > 0
+    return positive & (positive.sum(axis=1) == 1)[:, None]
+
+
+def _high(values: np.ndarray) -> np.ndarray:
+    # The interest is positive and is the first column holding the row maximum (same as `idxmax`)
+    first_max = np.zeros(values.shape, dtype=bool)
+    if len(values):
+        first_max[np.arange(len(values)), values.argmax(axis=1)] = True
+    return (values > 0) & first_max
+
+
+def _good(values: np.ndarray) -> np.ndarray:
+    # The interest score is one of the three largest values of the row
+    n_interests = values.shape[1]
+    if n_interests <= 3:
+        return np.ones(values.shape, dtype=bool)
+    third_largest = np.partition(values, n_interests - 3, axis=1)[:, n_interests - 3]
+    return values >= third_largest[:, None]
+
+
+def _mid(values: np.ndarray) -> np.ndarray:
+    return values >= 0
+
+
+def _low(values: np.ndarray) -> np.ndarray:
+    return np.ones(values.shape, dtype=bool)
+
+
+_LEVEL_KERNELS = dict(zip(config.confidence_level_list, [_very_high, _high, _good, _mid, _low]))
+
+
+def compute_confidence_masks(interest_values: np.ndarray) -> dict:
+    """
+    Computes the membership of every user in every confidence level for every interest
+    with vectorized passes over the interest matrix.
+
+    Parameters:
+    - interest_values (np.ndarray): Matrix of shape (n_users, n_interests) holding the interest scores,
+                                    columns ordered as `config.interests_columns`.
+
+    Returns:
+    - dict: Mapping from confidence level to a boolean matrix of shape (n_users, n_interests), where
+            entry [u, i] tells whether user u belongs to that confidence level for interest i.
+    """
+    values = np.asarray(interest_values)
+    return {level: kernel(values) for level, kernel in _LEVEL_KERNELS.items()}
+
+
+def compute_confidence_mask(interest_values: np.ndarray, interest: str, confidence_level: str) -> np.ndarray:
+    """
+    Computes the membership of every user in one confidence level for one interest.
+
+    Parameters:
+    - interest_values (np.ndarray): Matrix of shape (n_users, n_interests) holding the interest scores.
+    - interest (str): The interest to compute the membership for (must be one of the predefined interests).
+    - confidence_level (str): The confidence level ('Very High', 'High', 'Good', 'Mid', 'Low').
+
+    Returns:
+    - np.ndarray: Boolean array of shape (n_users,).
+    """
+    interest_columns = config.interests_columns
+    if interest not in interest_columns:
+        raise ValueError(f"Interest must be one of {interest_columns}")
+    if confidence_level not in _LEVEL_KERNELS:
+        raise ValueError("Invalid confidence level. Choose from 'Very high', 'High', 'Good', 'Mid', 'Low'.")
+
+    values = np.asarray(interest_values)
+    return _LEVEL_KERNELS[confidence_level](values)[:, interest_columns.index(interest)]
@@ -4,16 +4,34 @@ from app import config
 from .preprocessing import helpers
 
 
-def load_and_preprocess():
+def load_and_preprocess(streaming: bool | None = None):
     """
     Load data from CSV files, preprocess, and return the final DataFrame.
+
+    In streaming mode the interaction CSV is read in chunks of `config.interaction_chunk_size` rows,
+    which keeps the memory bounded regardless of the size of the interaction log.
     """
+    if streaming is None:
+        streaming = config.streaming_preprocessing
+
     # Load data
     demographic_df = pd.read_csv(config.DEMOGRAPHIC_DATA_PATH)
-    interaction_df = pd.read_csv(config.INTERACTION_DATA_PATH)
+    if streaming:
+        interaction_chunks = pd.read_csv(config.INTERACTION_DATA_PATH, chunksize=config.interaction_chunk_size,
+                                         usecols=['user_id', 'survey_type', 'response'])
+        user_interaction_df = helpers.process_user_data_streaming(demographic_df, interaction_chunks)
+    else:
+        interaction_df = pd.read_csv(config.INTERACTION_DATA_PATH)
+        user_interaction_df = helpers.process_user_data(demographic_df, interaction_df)
+
+    return add_derived_columns(user_interaction_df)
 
-    user_interaction_df = helpers.process_user_data(demographic_df, interaction_df)
 
+def add_derived_columns(user_interaction_df):
+    """
+    Adds the age groups, regions, occupation categories and income quintiles to the table of user
+    interests, and compacts its dtypes when `config.compact_dtypes` is set.
+    """
     user_interaction_df = helpers.categorize_age(user_interaction_df, config.age_column)
     
     user_interaction_df = helpers.city_mapping(user_interaction_df)
@@ -21,4 +39,7 @@ def load_and_preprocess():
     user_interaction_df = helpers.occupation_mapping(user_interaction_df)
 
     user_interaction_df = helpers.categorize_income_quintiles(user_interaction_df)
+
+    if config.compact_dtypes:
+        user_interaction_df = helpers.compact_dtypes(user_interaction_df)
     return user_interaction_df
\ No newline at end of file
@@ -1,15 +1,66 @@
+from app import config
 from app.utils.data_loader import load_and_preprocess
+from app.utils.dataset import Dataset
+from app.utils.snapshot import load_snapshot_dataset
 
 ## Singleton
 class DataManager:
-    _data = None
+    _dataset = None
+    _version = 0
+
+    @classmethod
+    def _load(cls) -> Dataset:
+        dataset = load_snapshot_dataset() if config.use_snapshot else Dataset(load_and_preprocess())
+        dataset.version = cls.next_version()
+        return dataset
+
+    @classmethod
+    def next_version(cls, current: int = 0) -> int:
+        """
+        Returns a new dataset version, greater than `current`, given to the data whenever it is loaded or modified.
+        """
+        cls._version = max(cls._version, current) + 1
+        return cls._version
+
+    @classmethod
+    def get_dataset(cls):
+        if cls._dataset is None:
+            cls._dataset = cls._load()
+        return cls._dataset
+
+    @classmethod
+    def loaded_dataset(cls) -> Dataset | None:
+        """
+        Returns the served dataset, None when it was not loaded yet.
+        """
+        return cls._dataset
 
     @classmethod
     def get_data(cls):
-        if cls._data is None:
-            cls._data = load_and_preprocess()
-        return cls._data
+        return cls.get_dataset().data
+
+    @classmethod
+    def swap(cls, dataset: Dataset) -> Dataset:
+        """
+        Serves `dataset` from now on, under a new version. Requests holding the previous dataset finish
+        on it, and it is freed along with its last reference.
+        """
+        dataset.version = cls.next_version()
+        cls._dataset = dataset
+        return dataset
 
-# Dependency function
+    @classmethod
+    def reload(cls):
+        """
+        Loads the data again and bumps the dataset version, which invalidates the cached results.
+        """
+        cls._dataset = cls._load()
+        return cls._dataset
+
+# Dependency functions
 def get_data():
     return DataManager.get_data()
+
+
+def get_dataset():
+    return DataManager.get_dataset()
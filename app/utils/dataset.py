@@ -0,0 +1,157 @@
+import copy
+import threading
+
+import numpy as np
+import pandas as pd
+
+from app import config
+from app.utils.audience_cube import AudienceCube
+from app.utils.helpers import FilterIndex
+from app.utils.interest_vectors import InterestVectors
+from app.utils.lookalike_index import LookalikeIndex
+from app.utils.tier_index import TierIndex
+
+
+# Held while a lazy index is built, so concurrent first requests build it once
+_lazy_index_lock = threading.Lock()
+
+
+class Dataset:
+    """
+    The preprocessed user table together with the indexes derived from it at load time.
+
+    Row positions used by the indexes are positions in `data`, which always carries a
+    default RangeIndex so that labels and positions coincide.
+
+    The raw Yes/No/Neutral counts rescoring the users with other weights are kept in `responses`, next to
+    the table rather than in it, so they never reach the results.
+    """
+
+    # Indexes derived from the table, by attribute name
+    index_types = {"tier_index": TierIndex, "filter_index": FilterIndex, "interest_vectors": InterestVectors,
+                   "lookalike_index": LookalikeIndex, "audience_cube": AudienceCube}
+    # Indexes only some endpoints use, built on first access rather than with the dataset, e.g. the lookalike
+    # index and its k-means training are not needed by the shard workers
+    lazy_indexes = {"lookalike_index"}
+
+    def __init__(self, data: pd.DataFrame, indexes: dict | None = None, version: int = 0,
+                 responses: np.ndarray | None = None):
+        """
+        Parameters:
+        - data (pd.DataFrame): The preprocessed user table.
+        - indexes (dict, optional): Prebuilt indexes by attribute name, the missing ones are built from `data`,
+                                    the lazy ones on first access.
+        - version (int): Version of the data, changes whenever the data is reloaded.
+        - responses (np.ndarray, optional): Response counts of shape (len(data), len(config.response_columns)),
+                                            taken out of `data` by default when it holds `config.response_columns`.
+        """
+        self.version = version
+        # Snapshot the table was read from, as long as it is unmodified, so other processes can map the same data
+        self.snapshot_directory = None
+        # Id of the named dataset of the registry, None for the default dataset
+        self.dataset_id = None
+        if responses is None and all(column in data.columns for column in config.response_columns):
+            responses = data[config.response_columns].to_numpy()
+            data = data.drop(columns=config.response_columns)
+        if not isinstance(data.index, pd.RangeIndex) or data.index.start != 0 or data.index.step != 1:
+            data = data.reset_index(drop=True)
+        self.data = data
+        # None when the data was preprocessed without the response counts
+        self.responses = responses
+        self._user_positions = None
+        indexes = indexes or {}
+        for name, index_type in self.index_types.items():
+            if name in indexes:
+                setattr(self, name, indexes[name])
+            elif name not in self.lazy_indexes:
+                setattr(self, name, index_type(data))
+
+    def __getattr__(self, name):
+        # Only called for missing attributes, i.e. the lazy indexes not built yet
+        if name not in Dataset.lazy_indexes:
+            raise AttributeError(f"'Dataset' object has no attribute '{name}'")
+        with _lazy_index_lock:
+            if name not in self.__dict__:
+                setattr(self, name, self.index_types[name](self.data))
+        return self.__dict__[name]
+
+    def __len__(self):
+        return len(self.data)
+
+    def built_indexes(self) -> list:
+        """
+        Names of the indexes built so far, the lazy ones only once accessed.
+        """
+        return [name for name in self.index_types if name in self.__dict__]
+
+    def index_state(self) -> dict:
+        """
+        State of every index, suitable for persisting next to the table, see `from_state`. The lazy indexes
+        not built yet are built first.
+        """
+        return {name: getattr(self, name).state() for name in self.index_types}
+
+    def nbytes(self) -> int:
+        """
+        Approximate memory held by the table and its indexes, memory-mapped arrays included.
+        """
+        def state_nbytes(state) -> int:
+            if isinstance(state, np.ndarray):
+                return state.nbytes
+            if isinstance(state, dict):
+                return sum(state_nbytes(value) for value in state.values())
+            if isinstance(state, (list, tuple)):
+                return sum(state_nbytes(value) for value in state)
+            return 0
+
+        indexes = [getattr(self, name).state() for name in self.built_indexes()]
+        return (int(self.data.memory_usage(index=False, deep=True).sum()) + state_nbytes(indexes)
+                + state_nbytes(self.responses))
+
+    def positions_of(self, user_ids) -> np.ndarray:
+        """
+        Row positions of the given user ids, -1 for the ids missing from the table.
+        """
+        if self._user_positions is None:
+            self._user_positions = pd.Index(self.data['user_id'])
+        return self._user_positions.get_indexer(user_ids)
+
+    def updated(self, data: pd.DataFrame, positions: np.ndarray, responses: np.ndarray | None) -> "Dataset":
+        """
+        A new Dataset over `data` and `responses`, copies of the table and of the response counts whose rows
+        at `positions` were modified or appended.
+
+        The indexes are updated from shallow copies of the current ones, whose `update` replaces the arrays
+        it changes instead of writing them, so this dataset and its indexes stay untouched for the requests
+        still reading them. Only the modified rows are recomputed, but the replaced arrays are copied whole,
+        so an update is linear in the number of rows.
+        """
+        # Lazy indexes not built yet are left to the new dataset to build from its own table
+        indexes = {name: copy.copy(getattr(self, name)) for name in self.built_indexes()}
+        for index in indexes.values():
+            index.update(data, positions)
+        dataset = Dataset(data, indexes, self.version, responses)
+        dataset.dataset_id = self.dataset_id
+        if len(data) == len(self):
+            # Same users at the same positions
+            dataset._user_positions = self._user_positions
+        return dataset
+
+    @classmethod
+    def from_state(cls, data: pd.DataFrame, state: dict, version: int = 0,
+                   responses: np.ndarray | None = None) -> "Dataset":
+        """
+        Rebuilds a Dataset from a table and the `index_state()` persisted with it.
+        """
+        indexes = {name: index_type.from_state(state[name])
+                   for name, index_type in cls.index_types.items() if name in state}
+        return cls(data, indexes, version, responses)
+
+
+def as_dataset(data: "Dataset | pd.DataFrame") -> Dataset:
+    """
+    Wraps a bare DataFrame into a Dataset, building its indexes on the fly.
+    """
+    if isinstance(data, Dataset):
+        return data
+    return Dataset(data)
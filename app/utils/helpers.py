@@ -1,5 +1,8 @@
+import numpy as np
 import pandas as pd
 
+from app import config
+
 
 ## filters by age interval
 def filter_by_intervals(data: pd.DataFrame, interval: None|list, feature_column: None|str) -> pd.DataFrame:
@@ -36,3 +39,170 @@ def filter_by_feature(data: pd.DataFrame, feature_list: None|str|list, feature_c
         return data[data[feature_column].isin(feature_list)]
     return data
 
+
+
+class FilterIndex:
+    """
+    Inverted index over the demographic columns of a dataset, built once at load time.
+
+    Categorical columns keep one packed bitmap per distinct value and numeric columns keep their
+    values presorted, so a request combines its filters with bitwise ANDs and the table is
+    materialized a single time at the end instead of once per filter.
+    """
+
+    feature_columns = [config.gender_column, config.city_column, config.region_column,
+                       config.occupation_column, config.occupation_category_column,
+                       config.age_group_name_column, config.income_quintile_name_column]
+    interval_columns = [config.age_column, config.income_column]
+
+    def __init__(self, data: pd.DataFrame):
+        self.n_rows = len(data)
+        self._bitmaps = {}
+        self._sorted = {}
+
+        for column in self.feature_columns:
+            if column not in data.columns:
+                continue
+            codes, uniques = pd.factorize(data[column], use_na_sentinel=True)
+            # Native Python values so the index can be persisted as JSON metadata
+            self._bitmaps[column] = {getattr(value, "item", lambda: value)(): np.packbits(codes == code)
+                                     for code, value in enumerate(uniques)}
+
+        for column in self.interval_columns:
+            if column not in data.columns:
+                continue
+            values = data[column].to_numpy()
+            order = np.argsort(values, kind="stable")
+            self._sorted[column] = (values[order], order)
+
+    def state(self) -> dict:
+        """
+        Arrays and metadata describing the index, see `from_state`.
+        """
+        return {
+            "n_rows": self.n_rows,
+            "bitmaps": [[column, value, bitmap] for column, bitmaps in self._bitmaps.items()
+                        for value, bitmap in bitmaps.items()],
+            "sorted": [[column, values, order] for column, (values, order) in self._sorted.items()],
+        }
+
+    @classmethod
+    def from_state(cls, state: dict) -> "FilterIndex":
+        """
+        Rebuilds an index from `state()` without touching the table, e.g. from memory-mapped arrays.
+        """
+        index = cls.__new__(cls)
+        index.n_rows = state["n_rows"]
+        index._bitmaps = {}
+        for column, value, bitmap in state["bitmaps"]:
+            index._bitmaps.setdefault(column, {})[value] = bitmap
+        index._sorted = {column: (values, order) for column, values, order in state["sorted"]}
+        return index
+
+    def update(self, data: pd.DataFrame, positions: np.ndarray):
+        """
+        Indexes the rows appended to `data` since the index was built. The demographics of existing
+        rows are never modified, so positions below the indexed row count are ignored. Bitmaps and sorted
+        arrays are replaced, never written, so a copy of the index can be updated while the original is read.
+        """
+        n_rows = len(data)
+        if n_rows == self.n_rows:
+            return
+        appended = data.iloc[self.n_rows:]
+        self._bitmaps = {column: dict(bitmaps) for column, bitmaps in self._bitmaps.items()}
+        self._sorted = dict(self._sorted)
+
+        for column, bitmaps in self._bitmaps.items():
+            codes, uniques = pd.factorize(appended[column], use_na_sentinel=True)
+            new_codes = {getattr(value, "item", lambda: value)(): code for code, value in enumerate(uniques)}
+            for value in new_codes.keys() - bitmaps.keys():
+                bitmaps[value] = np.zeros((self.n_rows + 7) // 8, dtype=np.uint8)
+            for value, bitmap in bitmaps.items():
+                bitmaps[value] = append_bits(bitmap, self.n_rows, codes == new_codes.get(value, -2))
+
+        for column, (values, order) in self._sorted.items():
+            new_values = appended[column].to_numpy()
+            new_order = np.argsort(new_values, kind="stable")
+            values = values.astype(np.result_type(values, new_values), copy=False)
+            # Appended rows come after the existing ones holding the same value, as with a stable sort
+            at = np.searchsorted(values, new_values[new_order], side="right")
+            self._sorted[column] = (np.insert(values, at, new_values[new_order]),
+                                    np.insert(order, at, new_order + self.n_rows))
+
+        self.n_rows = n_rows
+
+    def selection(self) -> "FilterSelection":
+        return FilterSelection(self)
+
+    def feature_bitmap(self, feature_list: None|str|list, feature_column: str) -> np.ndarray | None:
+        """
+        Packed bitmap of the rows whose `feature_column` is one of `feature_list`, None when no filter applies.
+        """
+        if not feature_list:
+            return None
+        if isinstance(feature_list, str):
+            feature_list = [feature_list]
+        bitmaps = self._bitmaps[feature_column]
+        result = np.zeros((self.n_rows + 7) // 8, dtype=np.uint8)
+        for value in feature_list:
+            bitmap = bitmaps.get(value)
+            if bitmap is not None:
+                result |= bitmap
+        return result
+
+    def interval_bitmap(self, interval: None|list, feature_column: str) -> np.ndarray | None:
+        """
+        Packed bitmap of the rows whose `feature_column` lies within the closed interval, None when no filter applies.
+        """
+        if not (isinstance(interval, list) and len(interval) == 2):
+            return None
+        sorted_values, order = self._sorted[feature_column]
+        # Bounds as 0-d arrays so they are compared without being cast to a narrow column type
+        start = np.searchsorted(sorted_values, np.asarray(interval[0]), side="left")
+        stop = np.searchsorted(sorted_values, np.asarray(interval[1]), side="right")
+        mask = np.zeros(self.n_rows, dtype=bool)
+        mask[order[start:stop]] = True
+        return np.packbits(mask)
+
+
+def append_bits(bitmap: np.ndarray, n_bits: int, bits: np.ndarray) -> np.ndarray:
+    """
+    Appends `bits` to a packed bitmap holding `n_bits` bits, repacking only its last byte.
+    """
+    full = n_bits // 8
+    tail = np.unpackbits(bitmap[full:], count=n_bits - 8 * full).view(bool)
+    return np.concatenate([bitmap[:full], np.packbits(np.concatenate([tail, bits]))])
+
+
+class FilterSelection:
+    """
+    Accumulates the filters of one request as a single packed bitmap.
+    """
+
+    def __init__(self, index: FilterIndex):
+        self.index = index
+        self.bitmap = None
+
+    def _intersect(self, bitmap: np.ndarray | None) -> "FilterSelection":
+        if bitmap is not None:
+            self.bitmap = bitmap if self.bitmap is None else self.bitmap & bitmap
+        return self
+
+    def by_feature(self, feature_list: None|str|list, feature_column: str) -> "FilterSelection":
+        return self._intersect(self.index.feature_bitmap(feature_list, feature_column))
+
+    def by_intervals(self, interval: None|list, feature_column: str) -> "FilterSelection":
+        return self._intersect(self.index.interval_bitmap(interval, feature_column))
+
+    def count(self) -> int:
+        if self.bitmap is None:
+            return self.index.n_rows
+        return int(np.unpackbits(self.bitmap, count=self.index.n_rows).sum())
+
+    def mask(self) -> np.ndarray | None:
+        """
+        Boolean mask over all rows, None when no filter was applied.
+        """
+        if self.bitmap is None:
+            return None
+        return np.unpackbits(self.bitmap, count=self.index.n_rows).view(bool)
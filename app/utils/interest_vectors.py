@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+
+from app import config
+
+
+def normalize_rows(values: np.ndarray) -> np.ndarray:
+    """
+    Scales every row to unit L2 norm, leaving all-zero rows at zero (same arithmetic as scikit-learn's `normalize`).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    norms = np.sqrt(np.einsum("ij,ij->i", values, values))
+    norms[norms == 0.0] = 1.0
+    return values / norms[:, None]
+
+
+def cosine_similarity(values: np.ndarray, profiles: np.ndarray) -> np.ndarray:
+    """
+    Cosine similarities between the rows of `values` and of `profiles`, as a (n_values, n_profiles) matrix.
+    Same arithmetic as scikit-learn's `cosine_similarity`, all-zero rows having no similarity with anything.
+    """
+    return normalize_rows(values) @ normalize_rows(profiles).T
+
+
+class InterestVectors:
+    """
+    Interest score vectors of every user normalized to unit length once at load time, so cosine
+    similarities against a profile reduce to a single matrix-vector product.
+    """
+
+    def __init__(self, data: pd.DataFrame):
+        self.unit = normalize_rows(data[config.interests_columns].to_numpy())
+
+    def state(self) -> dict:
+        """
+        Arrays and metadata describing the index, see `from_state`.
+        """
+        return {"unit": self.unit}
+
+    @classmethod
+    def from_state(cls, state: dict) -> "InterestVectors":
+        """
+        Rebuilds an index from `state()` without touching the table, e.g. from memory-mapped arrays.
+        """
+        index = cls.__new__(cls)
+        index.unit = state["unit"]
+        return index
+
+    def update(self, data: pd.DataFrame, positions: np.ndarray):
+        """
+        Normalizes again the rows at `positions`, which were modified or appended to `data`, into new
+        vectors: the current ones may be read meanwhile, or memory-mapped read-only.
+        """
+        unit = np.zeros((len(data), self.unit.shape[1]))
+        unit[:len(self.unit)] = self.unit
+        unit[positions] = normalize_rows(data[config.interests_columns].iloc[positions].to_numpy())
+        self.unit = unit
+
+    def cosine_similarity(self, profile: np.ndarray, positions: np.ndarray | None = None) -> np.ndarray:
+        """
+        Cosine similarity between the users at `positions` (all users when None) and the profile vector.
+        """
+        return self.cosine_similarities(np.asarray(profile).reshape(1, -1), positions)[:, 0]
+
+    def cosine_similarities(self, profiles: np.ndarray, positions: np.ndarray | None = None) -> np.ndarray:
+        """
+        Cosine similarities between the users at `positions` (all users when None) and several profile
+        vectors at once, as a (n_users, n_profiles) matrix.
+
+        The products are accumulated interest by interest in a fixed order rather than through BLAS, so a
+        user gets bit-identical similarities whatever subset of the population or batch of profiles it is
+        computed with.
+        """
+        unit_profiles = normalize_rows(profiles)
+        vectors = self.unit if positions is None else self.unit[positions]
+        similarities = np.zeros((len(vectors), len(unit_profiles)))
+        for j in range(unit_profiles.shape[1]):
+            similarities += vectors[:, j, None] * unit_profiles[None, :, j]
+        return similarities
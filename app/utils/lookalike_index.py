@@ -0,0 +1,222 @@
+import numpy as np
+import pandas as pd
+
+from app import config
+from app.utils.interest_vectors import normalize_rows
+
+# Quantized codes are the unit vectors scaled to the int8 range
+QUANTIZATION_SCALE = 127
+# Candidates kept from the quantized scores for every result, before reranking them with the exact vectors
+RERANK_FACTOR = 4
+# Rows scored against the centroids at a time, bounding the memory of the assignment
+ASSIGNMENT_CHUNK_ROWS = 8192
+# Similarities equal up to this many decimals are considered tied, ties are broken by row position
+SIMILARITY_DECIMALS = 6
+
+
+def lookalike_vectors(data: pd.DataFrame, encodings: dict) -> np.ndarray:
+    """
+    Feature vectors of the users: their unit interest vectors, followed by the one-hot encoded demographic
+    columns of `encodings` scaled by `config.lookalike_demographic_weight`, normalized to unit length.
+    """
+    vectors = normalize_rows(data[config.interests_columns].to_numpy())
+    if config.lookalike_demographic_weight and encodings:
+        one_hots = [pd.Categorical(data[column], categories=categories).codes[:, None] == np.arange(len(categories))
+                    for column, categories in encodings.items()]
+        weight = config.lookalike_demographic_weight / np.sqrt(len(one_hots))
+        vectors = np.hstack([vectors] + [weight * one_hot for one_hot in one_hots])
+    return normalize_rows(vectors).astype(np.float32)
+
+
+def quantize(vectors: np.ndarray) -> np.ndarray:
+    return np.round(vectors * QUANTIZATION_SCALE).astype(np.int8)
+
+
+def nearest_centroids(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGNMENT_CHUNK_ROWS):
+        labels[start:start + ASSIGNMENT_CHUNK_ROWS] = np.argmax(
+            vectors[start:start + ASSIGNMENT_CHUNK_ROWS] @ centroids.T, axis=1)
+    return labels
+
+
+def spherical_kmeans(vectors: np.ndarray, n_lists: int, rng: np.random.Generator, n_iterations: int = 10) -> np.ndarray:
+    """
+    Centroids of `n_lists` clusters of unit vectors, trained on a sample of them.
+    """
+    sample = vectors[rng.choice(len(vectors), size=min(len(vectors), 64 * n_lists), replace=False)]
+    centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)]
+    for _ in range(n_iterations):
+        labels = nearest_centroids(sample, centroids)
+        sums = np.zeros(centroids.shape, dtype=np.float64)
+        np.add.at(sums, labels, sample)
+        # Clusters left empty, e.g. seeded on duplicated vectors, restart from random points
+        empty = ~sums.any(axis=1)
+        sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+        centroids = normalize_rows(sums).astype(np.float32)
+    return centroids
+
+
+class LookalikeIndex:
+    """
+    Inverted file (IVF) index over the feature vectors of the users, for "users like these" queries.
+
+    The vectors are partitioned around centroids trained with spherical k-means, and stored list by list as
+    int8 codes. A query scans the codes of the `n_probe` lists whose centroids are the most similar to it,
+    then reranks the best candidates with the exact vectors, so it touches about `n_probe / n_lists` of the
+    population. Populations smaller than `config.lookalike_min_population` are searched exhaustively.
+    """
+
+    encoded_columns = [config.gender_column, config.region_column, config.occupation_category_column,
+                       config.age_group_name_column, config.income_quintile_name_column]
+
+    def __init__(self, data: pd.DataFrame):
+        self.encodings = {column: [getattr(value, "item", lambda: value)() for value in pd.unique(data[column].dropna())]
+                          for column in self.encoded_columns if column in data.columns}
+        self.vectors = lookalike_vectors(data, self.encodings)
+
+        n_rows = len(data)
+        n_lists = min(config.lookalike_max_lists, int(np.sqrt(n_rows)))
+        if n_rows < config.lookalike_min_population or n_lists < 2:
+            self.centroids = np.zeros((0, self.vectors.shape[1]), dtype=np.float32)
+            self.assignments = np.zeros(n_rows, dtype=np.int32)
+        else:
+            rng = np.random.default_rng(config.lookalike_seed)
+            self.centroids = spherical_kmeans(self.vectors, n_lists, rng)
+            self.assignments = nearest_centroids(self.vectors, self.centroids)
+        self._build_lists()
+
+    def _build_lists(self):
+        # Members of every list stored contiguously, list l spanning offsets[l]:offsets[l + 1], by position
+        self.members = np.argsort(self.assignments, kind="stable").astype(np.int32)
+        self._build_offsets()
+        self.codes = quantize(self.vectors[self.members])
+
+    def _build_offsets(self):
+        counts = np.bincount(self.assignments, minlength=len(self.centroids))
+        self.offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    def state(self) -> dict:
+        """
+        Arrays and metadata describing the index, see `from_state`.
+        """
+        return {"encodings": self.encodings, "vectors": self.vectors, "centroids": self.centroids,
+                "assignments": self.assignments, "members": self.members, "offsets": self.offsets,
+                "codes": self.codes}
+
+    @classmethod
+    def from_state(cls, state: dict) -> "LookalikeIndex":
+        """
+        Rebuilds an index from `state()` without touching the table, e.g. from memory-mapped arrays.
+        """
+        index = cls.__new__(cls)
+        for name, value in state.items():
+            setattr(index, name, value)
+        return index
+
+    @property
+    def n_lists(self) -> int:
+        return len(self.centroids)
+
+    def update(self, data: pd.DataFrame, positions: np.ndarray):
+        """
+        Recomputes the vectors of the rows at `positions`, which were modified or appended to `data`,
+        and moves them to the list of their nearest centroid. The centroids themselves are kept.
+
+        Only the rows at `positions` are encoded, assigned and quantized: they are taken out of the lists
+        and merged back at their place, as `_build_lists` would order them. Arrays are replaced, never
+        written, so a copy of the index can be updated while the original is read.
+        """
+        positions = np.unique(np.asarray(positions, dtype=np.int64))
+        vectors = lookalike_vectors(data.iloc[positions], self.encodings)
+        grown = np.zeros((len(data), self.vectors.shape[1]), dtype=np.float32)
+        grown[:len(self.vectors)] = self.vectors
+        grown[positions] = vectors
+        assignments = np.zeros(len(data), dtype=np.int32)
+        assignments[:len(self.assignments)] = self.assignments
+        if self.n_lists:
+            assignments[positions] = nearest_centroids(vectors, self.centroids)
+        self.vectors, self.assignments = grown, assignments
+
+        changed = np.zeros(len(data), dtype=bool)
+        changed[positions] = True
+        kept = ~changed[self.members]
+        members, codes = self.members[kept], self.codes[kept]
+        # Lists ordered by (list, position), the order of the stable sort of `_build_lists`
+        n_rows = np.int64(len(data))
+        kept_keys = assignments[members].astype(np.int64) * n_rows + members
+        keys = assignments[positions].astype(np.int64) * n_rows + positions
+        order = np.argsort(keys)
+        at = np.searchsorted(kept_keys, keys)
+        self.members = np.insert(members, at[order], positions[order]).astype(np.int32)
+        self.codes = np.insert(codes, at[order], quantize(vectors[order]), axis=0)
+        self._build_offsets()
+
+    def search(self, query: np.ndarray, num_users: int, member_mask: np.ndarray | None = None,
+               exclude: np.ndarray | None = None, n_probe: int | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the users most similar to a query vector.
+
+        Parameters:
+        - query (np.ndarray): Query in the space of the feature vectors, e.g. the mean vector of seed users.
+        - num_users (int): Number of users to return.
+        - member_mask (np.ndarray | None): Boolean array selecting the rows allowed, None allows every row.
+        - exclude (np.ndarray, optional): Positions never returned, e.g. the seed users.
+        - n_probe (int, optional): Lists scanned, trading latency for recall. Defaults to `config.lookalike_n_probe`.
+                                   More lists are scanned when the filters leave too few candidates.
+
+        Returns:
+        - tuple: Row positions of the users, most similar first, and their cosine similarities.
+        """
+        query = normalize_rows(np.asarray(query, dtype=np.float64).reshape(1, -1))[0].astype(np.float32)
+        if n_probe is None:
+            n_probe = config.lookalike_n_probe
+        if n_probe < 1:
+            raise ValueError("n_probe must be at least 1.")
+
+        if not self.n_lists or n_probe >= self.n_lists:
+            candidates = self.allowed(np.arange(len(self.vectors)), member_mask, exclude)
+            return self.rank(candidates, self.vectors[candidates] @ query, num_users)
+
+        lists = np.argsort(-(self.centroids @ query), kind="stable")
+        wanted = RERANK_FACTOR * num_users
+        slots = np.zeros(0, dtype=np.int64)
+        scanned = 0
+        while scanned < len(lists):
+            # Probe n_probe lists, then twice as many each time too few candidates pass the filters
+            probe = lists[scanned:max(n_probe, 2 * scanned)]
+            scanned += len(probe)
+            new_slots = np.concatenate([np.arange(self.offsets[l], self.offsets[l + 1]) for l in probe])
+            new_slots = new_slots[self.allowed_slots(new_slots, member_mask, exclude)]
+            slots = np.concatenate([slots, new_slots])
+            if len(slots) >= wanted:
+                break
+
+        # Shortlist on the quantized codes, then rerank with the exact vectors
+        approximate = self.codes[slots].astype(np.float32) @ query
+        if len(slots) > wanted:
+            slots = slots[np.argpartition(-approximate, wanted - 1)[:wanted]]
+        candidates = self.members[slots]
+        return self.rank(candidates, self.vectors[candidates] @ query, num_users)
+
+    def allowed_slots(self, slots: np.ndarray, member_mask: np.ndarray | None, exclude: np.ndarray | None) -> np.ndarray:
+        positions = self.members[slots]
+        keep = np.ones(len(slots), dtype=bool)
+        if member_mask is not None:
+            keep &= member_mask[positions]
+        if exclude is not None and len(exclude):
+            keep &= ~np.isin(positions, exclude)
+        return keep
+
+    def allowed(self, positions: np.ndarray, member_mask: np.ndarray | None, exclude: np.ndarray | None) -> np.ndarray:
+        if member_mask is not None:
+            positions = positions[member_mask[positions]]
+        if exclude is not None and len(exclude):
+            positions = positions[~np.isin(positions, exclude)]
+        return positions
+
+    def rank(self, positions: np.ndarray, similarities: np.ndarray, num_users: int) -> tuple[np.ndarray, np.ndarray]:
+        # Highest similarity first, ties by row position, so the exact and approximate paths agree on ties
+        keys = np.round(similarities.astype(np.float64), SIMILARITY_DECIMALS)
+        order = np.lexsort((positions, -keys))[:num_users]
+        return positions[order], similarities[order].astype(np.float64)
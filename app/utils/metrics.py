@@ -0,0 +1,78 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from prometheus_client import CONTENT_TYPE_LATEST, Histogram, generate_latest
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Stage durations of the request being processed, None when nobody collects them
+_stage_timings: ContextVar[dict | None] = ContextVar("stage_timings", default=None)
+
+stage_seconds = Histogram("user_profiling_stage_seconds", "Time spent in each stage of the targeting pipeline.",
+                          ["stage"], buckets=LATENCY_BUCKETS)
+request_seconds = Histogram("user_profiling_request_seconds", "Time spent handling the targeting requests.",
+                            ["endpoint"], buckets=LATENCY_BUCKETS)
+
+# Media type of `render_metrics`, the Prometheus text exposition format
+METRICS_CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+
+def render_metrics() -> bytes:
+    return generate_latest()
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Times the enclosed block as the pipeline stage `name` of the current request, when its stages are collected.
+    """
+    timings = _stage_timings.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+
+def with_stage_timings(func, *args) -> tuple:
+    """
+    Calls `func` collecting the durations of its stages, and returns its result with them.
+
+    Meant to be run on the compute pool: the durations travel back with the result, so they are recorded
+    by the serving process whichever pool ran the request.
+    """
+    timings = {}
+    token = _stage_timings.set(timings)
+    try:
+        return func(*args), timings
+    finally:
+        _stage_timings.reset(token)
+
+
+@contextmanager
+def timed_request(endpoint: str):
+    """
+    Records the duration of the enclosed request handling in `request_seconds`, whether it succeeds or fails.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        request_seconds.labels(endpoint).observe(time.perf_counter() - start)
+
+
+def observe_stages(timings: dict):
+    for name, seconds in timings.items():
+        stage_seconds.labels(name).observe(seconds)
+
+
+def server_timing(timings: dict) -> str:
+    """
+    Stage breakdown as a `Server-Timing` header value, durations in milliseconds.
+    """
+    return ", ".join(f"{name};dur={seconds * 1000:.3f}" for name, seconds in timings.items())
@@ -1,12 +1,17 @@
 from app import config
+import numpy as np
 import pandas as pd
 
+# Survey responses in the order used by the streaming counters
+interaction_responses = ['Yes', 'No', 'Neutral']
 
 
 def process_user_data(demographic_df:pd.DataFrame, interaction_df:pd.DataFrame) -> pd.DataFrame:
     """
     Processes demographic and interaction data to update user interest scores based on
-    predefined interests and responses from interaction data.
+    predefined interests and responses from interaction data. The raw response counts are kept as
+    `config.response_columns`, which `Dataset` moves out of the table, so the scores can be recomputed with
+    other weights.
 
     Parameters:
     - demographic_df (pd.DataFrame): DataFrame containing user demographics and their primary interests.
@@ -43,34 +48,116 @@ def process_user_data(demographic_df:pd.DataFrame, interaction_df:pd.DataFrame)
     demographic_data = demographic_data.merge(interaction_pivot, on='user_id', how='left')
 
     # Adjust scores based on survey responses
+    for column in config.response_columns:
+        if column not in demographic_data:
+            demographic_data[column] = 0
     for interest in interests:
-        demographic_data[f'{interest}_Yes'] = demographic_data.get(f'{interest}_Yes', 0) * config.yes_interaction_weight
-        demographic_data[f'{interest}_No'] = demographic_data.get(f'{interest}_No', 0) * config.no_interaction_weight
-        demographic_data[f'{interest}_Neutral'] = demographic_data.get(f'{interest}_Neutral', 0) * config.neutral_interaction_weight
-
         # Sum up the points for each interest and update the interest score
-        demographic_data[interest] += (demographic_data[f'{interest}_Yes'] +
-                                       demographic_data[f'{interest}_No'] +
-                                       demographic_data[f'{interest}_Neutral'])
+        demographic_data[interest] += (demographic_data[f'{interest}_Yes'] * config.yes_interaction_weight +
+                                       demographic_data[f'{interest}_No'] * config.no_interaction_weight +
+                                       demographic_data[f'{interest}_Neutral'] * config.neutral_interaction_weight)
 
-    # Drop the individual response columns if they are no longer needed
-    response_columns = [f'{interest}_{response}' for interest in interests for response in ['Yes', 'No', 'Neutral']]
-    demographic_data.drop(columns=response_columns, inplace=True)
+    # Keep the raw response counts aside, they are added back after the other columns
+    responses = demographic_data[config.response_columns].fillna(0).astype(np.int64)
+    demographic_data.drop(columns=config.response_columns, inplace=True)
 
     merged_df = add_interaction_counts(demographic_data, interaction_data)
 
     # Set initial interest scores based on user's listed interests
     merged_df = merged_df.fillna(0)
 
-    for index, row in merged_df.iterrows():
-        user_interest = row['interests']
-        if user_interest in interests:
-            merged_df.at[index, user_interest] += config.inital_interest_weight
+    for interest in interests:
+        merged_df.loc[merged_df['interests'] == interest, interest] += config.inital_interest_weight
 
     merged_df['Total'] = merged_df[config.interation_columns].sum(axis=1)
+    merged_df[config.response_columns] = responses
 
     return merged_df
 
+def process_user_data_streaming(demographic_df: pd.DataFrame, interaction_chunks) -> pd.DataFrame:
+    """
+    Streaming counterpart of `process_user_data` producing the same DataFrame, while reading the
+    interaction data chunk by chunk.
+
+    Response counts are accumulated per user into a preallocated (users x interests x responses)
+    array, so the memory used depends on the number of users and the chunk size only, never on the
+    total number of interactions. Survey types outside `config.interests_columns` and responses
+    other than Yes/No/Neutral are skipped.
+
+    Parameters:
+    - demographic_df (pd.DataFrame): DataFrame containing user demographics and their primary interests.
+    - interaction_chunks (Iterable[pd.DataFrame]): Chunks of the interaction data, e.g. `pd.read_csv(..., chunksize=...)`.
+
+    Returns:
+    - pd.DataFrame: Updated demographic DataFrame with adjusted interest scores.
+    """
+    interests = config.interests_columns
+    counts, has_interaction, seen_survey_types = count_interactions(demographic_df, interaction_chunks)
+
+    response_weights = np.array([config.yes_interaction_weight,
+                                 config.no_interaction_weight,
+                                 config.neutral_interaction_weight])
+    scores = counts @ response_weights
+    scores += (demographic_df['interests'].to_numpy()[:, None] == np.array(interests)[None, :]) * config.inital_interest_weight
+
+    demographic_data = demographic_df.copy()
+    if not has_interaction.all():
+        # The batch pipeline gets NaN from the merge for users without interactions, which turns the scores into floats
+        scores = scores.astype(float)
+    for i, interest in enumerate(interests):
+        demographic_data[interest] = scores[:, i]
+
+    interaction_counts = counts.sum(axis=2)
+    for survey_type in sorted(seen_survey_types):
+        demographic_data[f"{survey_type}_interaction"] = interaction_counts[:, interests.index(survey_type)].astype(int)
+
+    merged_df = demographic_data.fillna(0)
+    merged_df['Total'] = merged_df[config.interation_columns].sum(axis=1)
+    merged_df[config.response_columns] = counts.reshape(len(counts), -1)
+
+    return merged_df
+
+
+def count_interactions(demographic_df: pd.DataFrame, interaction_chunks):
+    """
+    Accumulates the Yes/No/Neutral responses of every user of `demographic_df` per interest.
+
+    Parameters:
+    - demographic_df (pd.DataFrame): DataFrame containing user demographics.
+    - interaction_chunks (Iterable[pd.DataFrame]): Chunks of the interaction data.
+
+    Returns:
+    - tuple: The counts as an int array of shape (n_users, n_interests, 3), a boolean array telling which
+             users have at least one interaction, and the set of survey types seen in the data.
+    """
+    interests = config.interests_columns
+    n_users = len(demographic_df)
+    n_responses = len(interaction_responses)
+
+    user_index = pd.Index(pd.unique(demographic_df['user_id']))
+    row_slots = user_index.get_indexer(demographic_df['user_id'])
+
+    counts = np.zeros(len(user_index) * len(interests) * n_responses, dtype=np.int64)
+    has_interaction = np.zeros(len(user_index), dtype=bool)
+    seen_survey_types = set()
+
+    for chunk in interaction_chunks:
+        slots = user_index.get_indexer(chunk['user_id'])
+        interest_codes = pd.Categorical(chunk['survey_type'], categories=interests).codes
+        response_codes = pd.Categorical(chunk['response'], categories=interaction_responses).codes
+
+        has_interaction[slots[slots >= 0]] = True
+        seen_survey_types.update(interests[code] for code in np.unique(interest_codes[slots >= 0]) if code >= 0)
+
+        keep = (slots >= 0) & (interest_codes >= 0) & (response_codes >= 0)
+        flat = (slots[keep].astype(np.int64) * len(interests) + interest_codes[keep]) * n_responses + response_codes[keep]
+        cells, cell_counts = np.unique(flat, return_counts=True)
+        counts[cells] += cell_counts
+
+    counts = counts.reshape(len(user_index), len(interests), n_responses)[row_slots]
+    return counts, has_interaction[row_slots], seen_survey_types
+
+
 def add_interaction_counts(demographic_df, interaction_df):
     """
     Processes interaction data to compute interaction counts per user per survey type,
@@ -156,4 +243,47 @@ def categorize_income_quintiles(df: pd.DataFrame) -> pd.DataFrame:
     quintile_labels = config.income_quintile_labels
     df[config.income_quintile_name_column] = pd.qcut(df[config.income_column],
                                                       q=config.number_of_income_quintile, labels=quintile_labels)
-    return df
\ No newline at end of file
+    return df
+
+def compact_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converts the preprocessed table to a compact representation: string columns become categoricals and
+    integer-valued numeric columns get the narrowest integer type holding their values. The interest
+    scores, the interaction counts and the response counts each share one type, so they can still be
+    handled as matrices.
+
+    Parameters:
+    - df (pd.DataFrame): The preprocessed DataFrame.
+
+    Returns:
+    - pd.DataFrame: The same data with compact dtypes.
+    """
+    groups = [config.interests_columns, config.interation_columns, config.response_columns]
+    grouped = {column for group in groups for column in group}
+    singles = [[column] for column in df.columns if column not in grouped]
+
+    for group in groups + singles:
+        group = [column for column in group if column in df.columns]
+        if not group:
+            continue
+        if all(df[column].dtype == object for column in group):
+            for column in group:
+                df[column] = df[column].astype('category')
+            continue
+        if not all(pd.api.types.is_numeric_dtype(df[column]) and not pd.api.types.is_bool_dtype(df[column])
+                   for column in group):
+            continue
+        values = df[group].to_numpy()
+        if not np.isfinite(values).all() or not np.array_equal(values, np.round(values)):
+            continue
+        dtype = smallest_integer_dtype(values.min(), values.max()) if values.size else np.int8
+        for column in group:
+            df[column] = df[column].astype(dtype)
+    return df
+
+
+def smallest_integer_dtype(low, high):
+    for dtype in (np.int8, np.int16, np.int32, np.int64):
+        if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64
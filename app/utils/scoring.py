@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+
+from app import config
+from app.utils.confidence import compute_confidence_mask
+from app.utils.dataset import Dataset
+from app.utils.tier_index import take_members
+
+
+def default_weights() -> np.ndarray:
+    """
+    Scoring weights used at load time: declared interest, Yes, No and Neutral responses.
+    """
+    return np.array([config.inital_interest_weight, config.yes_interaction_weight,
+                     config.no_interaction_weight, config.neutral_interaction_weight], dtype=np.float64)
+
+
+def rescore(dataset: Dataset, positions: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """
+    Interest scores of the users at `positions` under other scoring weights, computed from the raw response
+    counts kept at load time with a single contraction.
+
+    Parameters:
+    - dataset (Dataset): The dataset, holding the response counts in `responses`.
+    - positions (np.ndarray): Row positions of the users to score.
+    - weights (np.ndarray): Weights of the declared interest and of the Yes, No and Neutral responses.
+
+    Returns:
+    - np.ndarray: Scores of shape (len(positions), n_interests), columns ordered as `config.interests_columns`.
+    """
+    if dataset.responses is None:
+        raise ValueError("The dataset does not hold the response counts, reload it to use custom scoring weights.")
+
+    interests = config.interests_columns
+    responses = dataset.responses[positions]
+    # (interest, response) rows by interest columns, so the contraction is one matrix product
+    response_weights = np.kron(np.eye(len(interests)), weights[1:].reshape(-1, 1))
+    scores = responses.astype(np.float64) @ response_weights
+
+    declared = declared_interests(dataset.data, positions)
+    has_declared = declared >= 0
+    scores[np.flatnonzero(has_declared), declared[has_declared]] += weights[0]
+    return scores
+
+
+def declared_interests(data: pd.DataFrame, positions: np.ndarray) -> np.ndarray:
+    """
+    Index in `config.interests_columns` of the interest declared by the users at `positions`, -1 for other values.
+    """
+    column = data['interests']
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        # Compares the categories once instead of every row
+        lookup = np.array([config.interests_columns.index(value) if value in config.interests_columns else -1
+                           for value in column.cat.categories] + [-1])
+        return lookup[column.cat.codes.to_numpy()[positions]]
+    values = column.to_numpy()[positions]
+    declared = np.full(len(positions), -1)
+    for i, interest in enumerate(config.interests_columns):
+        declared[values == interest] = i
+    return declared
+
+
+class RescoredTiers:
+    """
+    Tiers of the rows allowed by a member mask under other scoring weights, with the interface of `TierIndex`
+    used by `select_users_by_interest`.
+
+    The scores of the members are recomputed once, and a tier is only built when it is asked for: its members
+    are sorted by descending interaction count, ties by ascending position, as in `TierIndex`.
+    """
+
+    def __init__(self, dataset: Dataset, member_mask: np.ndarray | None, weights: np.ndarray):
+        self.data = dataset.data
+        self.candidates = np.arange(len(dataset)) if member_mask is None else np.flatnonzero(member_mask)
+        self.scores = rescore(dataset, self.candidates, weights)
+        self.no_interaction = self.candidates[self.data['Total'].to_numpy()[self.candidates] == 0].astype(np.int32)
+        self._positions = {}
+
+    def get_positions(self, interest: str, confidence_level: str) -> np.ndarray:
+        key = (interest, confidence_level)
+        if key not in self._positions:
+            tier = self.candidates[compute_confidence_mask(self.scores, interest, confidence_level)]
+            interactions = self.data[f"{interest}_interaction"].to_numpy()[tier].astype(np.int64)
+            # np.lexsort uses the last key as the primary one
+            self._positions[key] = tier[np.lexsort([tier, -interactions])].astype(np.int32)
+        return self._positions[key]
+
+    def top_positions(self, interest: str, confidence_level: str, member_mask: np.ndarray | None,
+                      num_users: int | None) -> np.ndarray:
+        return take_members(self.get_positions(interest, confidence_level), member_mask, num_users)
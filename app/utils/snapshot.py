@@ -0,0 +1,324 @@
+import hashlib
+import itertools
+import json
+import logging
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from app import config
+from app.utils.data_loader import load_and_preprocess
+from app.utils.dataset import Dataset
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows, where concurrent workers may each build the snapshot
+    fcntl = None
+
+logger = logging.getLogger("snapshot")
+
+# Bump when the on-disk layout or the preprocessing output changes in a way the fingerprint cannot see
+SNAPSHOT_FORMAT_VERSION = 6
+
+META_FILE = "meta.json"
+
+# Columns stored together as one column-major matrix
+MATRIX_GROUPS = {"interests": config.interests_columns, "interactions": config.interation_columns}
+# Response counts of the dataset, stored apart from the table, see `Dataset.responses`
+RESPONSES_FILE = "responses.npy"
+
+
+def source_fingerprint(hash_contents: bool | None = None) -> str:
+    """
+    Fingerprint of everything the preprocessed table depends on: the source CSVs and the
+    config values used by the preprocessing.
+
+    Parameters:
+    - hash_contents (bool, optional): Also hash the content of the source files instead of relying on
+                                      their size and modification time only. Defaults to `config.snapshot_hash_sources`.
+
+    Returns:
+    - str: Hex digest identifying the snapshot.
+    """
+    if hash_contents is None:
+        hash_contents = config.snapshot_hash_sources
+
+    digest = hashlib.sha256()
+    digest.update(str(SNAPSHOT_FORMAT_VERSION).encode())
+    for path in [config.DEMOGRAPHIC_DATA_PATH, config.INTERACTION_DATA_PATH]:
+        stat = os.stat(path)
+        digest.update(f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+        if hash_contents:
+            with open(path, "rb") as file:
+                for block in iter(lambda: file.read(1 << 20), b""):
+                    digest.update(block)
+
+    settings = {
+        "interests_columns": config.interests_columns,
+        "weights": [config.inital_interest_weight, config.yes_interaction_weight,
+                    config.no_interaction_weight, config.neutral_interaction_weight],
+        "age_bins": config.age_bins,
+        "age_labels": [config.age_numeric_labels, config.age_descriptive_labels],
+        "income_quintiles": [config.number_of_income_quintile, config.income_quintile_labels],
+        "region_mapping": {region: sorted(cities) for region, cities in config.region_mapping.items()},
+        "occupation_mapping": config.occupation_mapping,
+        "compact_dtypes": config.compact_dtypes,
+        "lookalike": [config.lookalike_min_population, config.lookalike_max_lists,
+                      config.lookalike_demographic_weight, config.lookalike_seed],
+    }
+    digest.update(json.dumps(settings, sort_keys=True).encode())
+    return digest.hexdigest()[:16]
+
+
+def write_snapshot(df: pd.DataFrame, directory: str, fingerprint: str = "", replace: bool = True,
+                   index_state: dict | None = None, responses: np.ndarray | None = None) -> str:
+    """
+    Writes the DataFrame to `directory` as .npy files plus a JSON metadata file.
+
+    String and categorical columns are stored as categorical codes with the narrowest integer type.
+    The interest scores and the interaction counts are stored as column-major matrices whose columns
+    back the DataFrame columns, so kernels and every worker process can map them without copying.
+    Other numeric columns keep their dtype. Arrays found in `index_state` are written next to the
+    columns so the derived indexes can be mapped as well, and so are the `responses` counts of the dataset.
+
+    The snapshot is written to a version directory of its own, next to `directory`, which becomes a symbolic
+    link to it. Replacing a snapshot switches the link in a single `os.replace`, so readers see either the old
+    snapshot or the new one, never a partial or missing one. Without `replace`, an existing snapshot (e.g.
+    written meanwhile by another worker) is kept.
+
+    Returns:
+    - str: The snapshot directory.
+    """
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=f".{os.path.basename(directory)}-", dir=parent)
+
+    matrices = {}
+    for name, group in MATRIX_GROUPS.items():
+        group = [column for column in group if column in df.columns]
+        if group and len({df[column].dtype for column in group}) == 1:
+            np.save(os.path.join(staging, f"{name}.npy"), np.asfortranarray(df[group].to_numpy()))
+            matrices.update({column: (f"{name}.npy", i) for i, column in enumerate(group)})
+
+    columns = []
+    for i, column in enumerate(df.columns):
+        series = df[column]
+        if column in matrices:
+            file_name, matrix_column = matrices[column]
+            columns.append({"name": column, "file": file_name, "kind": "array", "column": matrix_column})
+            continue
+        entry = {"name": column, "file": f"{i}.npy"}
+        if isinstance(series.dtype, pd.CategoricalDtype) or series.dtype == object:
+            categorical = pd.Categorical(series)
+            values = categorical.codes
+            entry.update(kind="categorical", categories=categorical.categories.tolist(),
+                         ordered=bool(categorical.ordered))
+        else:
+            values = series.to_numpy()
+            entry.update(kind="array")
+        np.save(os.path.join(staging, entry["file"]), values)
+        columns.append(entry)
+
+    meta = {"format": SNAPSHOT_FORMAT_VERSION, "fingerprint": fingerprint, "n_rows": len(df), "columns": columns}
+    if index_state is not None:
+        meta["indexes"] = _dump_arrays(index_state, staging, itertools.count())
+    if responses is not None:
+        np.save(os.path.join(staging, RESPONSES_FILE), np.ascontiguousarray(responses))
+        meta["responses"] = RESPONSES_FILE
+    with open(os.path.join(staging, META_FILE), "w") as file:
+        json.dump(meta, file)
+
+    if os.path.isdir(directory) and not replace:
+        shutil.rmtree(staging, ignore_errors=True)
+        return directory
+    previous = os.path.realpath(directory) if os.path.islink(directory) else None
+    link = f"{staging}.link"
+    try:
+        os.symlink(os.path.basename(staging), link)
+        os.replace(link, directory)
+    except OSError:
+        # No symbolic links (e.g. Windows without the privilege), or a snapshot directory of an older layout
+        if os.path.lexists(link):
+            os.unlink(link)
+        _rename_into_place(staging, directory)
+        return directory
+    # Processes still mapping the old files keep reading them after they are unlinked
+    if previous is not None:
+        shutil.rmtree(previous, ignore_errors=True)
+    return directory
+
+
+def _rename_into_place(staging: str, directory: str):
+    # Leaves `directory` missing for a moment when it exists, readers retry through `read_snapshot_dataset`
+    if not os.path.isdir(directory):
+        os.rename(staging, directory)
+        return
+    retired = f"{staging}.retired"
+    os.rename(directory, retired)
+    os.rename(staging, directory)
+    shutil.rmtree(retired, ignore_errors=True)
+
+
+def _dump_arrays(state, directory: str, counter):
+    # Replaces the arrays nested in `state` by references to the .npy files they are saved to
+    if isinstance(state, np.ndarray):
+        file_name = f"index-{next(counter)}.npy"
+        np.save(os.path.join(directory, file_name), state)
+        return {"__array__": file_name}
+    if isinstance(state, dict):
+        return {key: _dump_arrays(value, directory, counter) for key, value in state.items()}
+    if isinstance(state, (list, tuple)):
+        return [_dump_arrays(value, directory, counter) for value in state]
+    return state
+
+
+def _load_arrays(state, directory: str, mmap_mode: str | None):
+    if isinstance(state, dict):
+        if "__array__" in state:
+            return _load_array(os.path.join(directory, state["__array__"]), mmap_mode)
+        return {key: _load_arrays(value, directory, mmap_mode) for key, value in state.items()}
+    if isinstance(state, list):
+        return [_load_arrays(value, directory, mmap_mode) for value in state]
+    return state
+
+
+def _load_array(path: str, mmap_mode: str | None) -> np.ndarray:
+    # A plain ndarray view of the memmap, so pandas never sees the subclass
+    return np.asarray(np.load(path, mmap_mode=mmap_mode))
+
+
+def read_snapshot(directory: str, mmap: bool = True) -> pd.DataFrame:
+    """
+    Reads a snapshot written by `write_snapshot`.
+
+    With `mmap` the column arrays are memory-mapped read-only and wrapped without copying, so the
+    pages are shared with every other process reading the same snapshot.
+    """
+    meta = read_meta(directory)
+    mmap_mode = "r" if mmap else None
+
+    columns = {}
+    loaded = {}
+    for entry in meta["columns"]:
+        if entry["file"] not in loaded:
+            loaded[entry["file"]] = _load_array(os.path.join(directory, entry["file"]), mmap_mode)
+        values = loaded[entry["file"]]
+        if "column" in entry:
+            values = values[:, entry["column"]]
+        if entry["kind"] == "categorical":
+            values = pd.Categorical.from_codes(values, categories=entry["categories"],
+                                               ordered=entry["ordered"], validate=False)
+        columns[entry["name"]] = values
+    return pd.DataFrame(columns, copy=False)
+
+
+def read_meta(directory: str) -> dict:
+    with open(os.path.join(directory, META_FILE)) as file:
+        return json.load(file)
+
+
+def read_snapshot_dataset(directory: str, mmap: bool = True) -> Dataset:
+    """
+    Reads a snapshot as a Dataset, attaching the indexes persisted with it instead of rebuilding them.
+
+    The link of the snapshot is resolved once, so every file comes from the same version even when the
+    snapshot is replaced meanwhile, and the dataset records the version directory it maps.
+    """
+    resolved = os.path.realpath(directory)
+    try:
+        return _read_snapshot_dataset(resolved, mmap)
+    except FileNotFoundError:
+        # Replaced and removed between resolving the link and opening the files: read the new version
+        if os.path.realpath(directory) == resolved:
+            raise
+        return _read_snapshot_dataset(os.path.realpath(directory), mmap)
+
+
+def _read_snapshot_dataset(directory: str, mmap: bool) -> Dataset:
+    data = read_snapshot(directory, mmap)
+    meta = read_meta(directory)
+    mmap_mode = "r" if mmap else None
+    responses = _load_array(os.path.join(directory, meta["responses"]), mmap_mode) if "responses" in meta else None
+    state = meta.get("indexes")
+    if state is None:
+        dataset = Dataset(data, responses=responses)
+    else:
+        dataset = Dataset.from_state(data, _load_arrays(state, directory, mmap_mode), responses=responses)
+    dataset.snapshot_directory = directory
+    return dataset
+
+
+@contextmanager
+def snapshot_lock():
+    """
+    Exclusive lock across processes, held while a snapshot is built so that concurrently starting
+    workers preprocess the data once and then all map the same files.
+    """
+    os.makedirs(config.SNAPSHOT_DIR, exist_ok=True)
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(config.SNAPSHOT_DIR, ".lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def snapshot_path(fingerprint: str) -> str:
+    return os.path.join(config.SNAPSHOT_DIR, fingerprint)
+
+
+def build_snapshot(replace: bool = True) -> str:
+    """
+    Preprocesses the source CSVs and writes the snapshot for the current fingerprint,
+    removing the snapshots of older fingerprints.
+
+    Parameters:
+    - replace (bool): Overwrite the snapshot of the current fingerprint when it already exists.
+
+    Returns:
+    - str: The snapshot directory.
+    """
+    fingerprint = source_fingerprint()
+    dataset = Dataset(load_and_preprocess())
+    directory = write_snapshot(dataset.data, snapshot_path(fingerprint), fingerprint, replace, dataset.index_state(),
+                               dataset.responses)
+    current = os.path.realpath(directory)
+    for name in os.listdir(config.SNAPSHOT_DIR):
+        stale = os.path.join(config.SNAPSHOT_DIR, name)
+        if name == fingerprint or os.path.realpath(stale) == current:
+            continue
+        # Only snapshots are removed, the directory also holds those of the named datasets
+        if os.path.islink(stale):
+            os.unlink(stale)
+        elif os.path.isfile(os.path.join(stale, META_FILE)):
+            shutil.rmtree(stale, ignore_errors=True)
+    logger.info("Wrote snapshot %s", directory)
+    return directory
+
+
+def ensure_snapshot() -> str:
+    """
+    Returns the directory of the snapshot matching the current fingerprint, building the snapshot
+    first when it does not exist yet. Only one process builds it, the others wait for it.
+    """
+    directory = snapshot_path(source_fingerprint())
+    if not os.path.isfile(os.path.join(directory, META_FILE)):
+        with snapshot_lock():
+            if not os.path.isfile(os.path.join(directory, META_FILE)):
+                logger.info("No snapshot for the current data, preprocessing the source files")
+                directory = build_snapshot(replace=False)
+    return directory
+
+
+def load_snapshot_dataset() -> Dataset:
+    """
+    Returns the dataset from the snapshot matching the current fingerprint, see `ensure_snapshot`.
+    """
+    return read_snapshot_dataset(ensure_snapshot())
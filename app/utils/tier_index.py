@@ -0,0 +1,187 @@
+import numpy as np
+import pandas as pd
+
+from app import config
+from app.utils.confidence import compute_confidence_masks
+
+
+class TierIndex:
+    """
+    Row positions of the users belonging to every (interest, confidence level) pair,
+    presorted by the interaction count of that interest in descending order.
+
+    Built once per dataset so that requests only intersect the precomputed positions
+    with their demographic filter instead of recomputing and re-sorting the tiers.
+    """
+
+    def __init__(self, data: pd.DataFrame):
+        self.n_rows = len(data)
+        self._positions = {}
+
+        masks = compute_confidence_masks(data[config.interests_columns].to_numpy())
+        for i, interest in enumerate(config.interests_columns):
+            interactions = data[f"{interest}_interaction"].to_numpy().astype(np.int64)
+            # Stable sort so that ties keep the table order and the ranking is deterministic
+            order = np.argsort(-interactions, kind="stable").astype(np.int32)
+            for level, mask in masks.items():
+                self._positions[(interest, level)] = order[mask[order, i]]
+
+        self.no_interaction = np.flatnonzero(data['Total'].to_numpy() == 0).astype(np.int32)
+
+    def state(self) -> dict:
+        """
+        Arrays and metadata describing the index, see `from_state`.
+        """
+        return {
+            "n_rows": self.n_rows,
+            "positions": [[interest, level, positions] for (interest, level), positions in self._positions.items()],
+            "no_interaction": self.no_interaction,
+        }
+
+    @classmethod
+    def from_state(cls, state: dict) -> "TierIndex":
+        """
+        Rebuilds an index from `state()` without touching the table, e.g. from memory-mapped arrays.
+        """
+        index = cls.__new__(cls)
+        index.n_rows = state["n_rows"]
+        index._positions = {(interest, level): positions for interest, level, positions in state["positions"]}
+        index.no_interaction = state["no_interaction"]
+        return index
+
+    def update(self, data: pd.DataFrame, positions: np.ndarray):
+        """
+        Refreshes the index after the rows at `positions` were modified or appended to `data`.
+
+        The rows are taken out of every tier and merged back at their rank, so an update costs a
+        pass over the tiers rather than a full re-sort. Tiers are replaced, never written, so a copy of
+        the index can be updated while the original is read.
+        """
+        positions = np.unique(np.asarray(positions, dtype=np.int64))
+        self._positions = dict(self._positions)
+        changed = np.zeros(len(data), dtype=bool)
+        changed[positions] = True
+
+        masks = compute_confidence_masks(data[config.interests_columns].iloc[positions].to_numpy())
+        for i, interest in enumerate(config.interests_columns):
+            interactions = data[f"{interest}_interaction"].to_numpy()
+            for level, mask in masks.items():
+                tier = self._positions[(interest, level)]
+                self._positions[(interest, level)] = merge_ranked(tier[~changed[tier]], positions[mask[:, i]],
+                                                                  interactions)
+
+        no_interaction = self.no_interaction[~changed[self.no_interaction]]
+        added = positions[data['Total'].to_numpy()[positions] == 0]
+        self.no_interaction = np.union1d(no_interaction, added).astype(np.int32)
+        self.n_rows = len(data)
+
+    def get_positions(self, interest: str, confidence_level: str) -> np.ndarray:
+        """
+        Returns the sorted row positions of the users in the given tier.
+        """
+        if interest not in config.interests_columns:
+            raise ValueError(f"Interest must be one of {config.interests_columns}")
+        if confidence_level not in config.confidence_level_list:
+            raise ValueError("Invalid confidence level. Choose from 'Very high', 'High', 'Good', 'Mid', 'Low'.")
+        return self._positions[(interest, confidence_level)]
+
+    def top_positions(self, interest: str, confidence_level: str, member_mask: np.ndarray | None,
+                      num_users: int | None) -> np.ndarray:
+        """
+        Returns the first `num_users` positions of the tier that are selected by `member_mask`.
+
+        The tier is scanned in growing chunks, so a permissive filter stops after a few
+        multiples of `num_users` positions instead of touching the whole tier.
+
+        Parameters:
+        - interest (str): The interest of the tier.
+        - confidence_level (str): The confidence level of the tier.
+        - member_mask (np.ndarray | None): Boolean array over all rows, None selects every row.
+        - num_users (int | None): Number of positions to return, None returns all of them.
+
+        Returns:
+        - np.ndarray: Row positions ordered by descending interaction count.
+        """
+        positions = self.get_positions(interest, confidence_level)
+        return take_members(positions, member_mask, num_users)
+
+    def no_interaction_positions(self, member_mask: np.ndarray | None) -> np.ndarray:
+        """
+        Returns the positions of the users without any interaction that are selected by `member_mask`.
+        """
+        return take_members(self.no_interaction, member_mask, None)
+
+
+def merge_ranked(tier: np.ndarray, added: np.ndarray, interactions: np.ndarray) -> np.ndarray:
+    """
+    Inserts `added` into `tier`, both row positions, keeping the tier order: descending interaction
+    count, ties by ascending position as produced by the stable sort.
+
+    The insertion points are found with a binary search reading the keys of about log2(len(tier)) tier
+    positions per added row, instead of computing the keys of the whole tier.
+    """
+    def rank_key(positions):
+        return -interactions[positions].astype(np.int64) * len(interactions) + positions
+
+    added = added[np.argsort(rank_key(added), kind="stable")]
+    keys = rank_key(added)
+    # First tier position whose key is not below the key of the added row, as np.searchsorted
+    low, high = np.zeros(len(added), dtype=np.int64), np.full(len(added), len(tier), dtype=np.int64)
+    while len(tier) and (low < high).any():
+        middle = (low + high) // 2
+        searching = low < high
+        below = searching & (rank_key(tier[np.minimum(middle, len(tier) - 1)]) < keys)
+        low = np.where(below, middle + 1, low)
+        high = np.where(searching & ~below, middle, high)
+    return np.insert(tier, low, added).astype(np.int32)
+
+
+def take_members(positions: np.ndarray, member_mask: np.ndarray | None, num_users: int | None) -> np.ndarray:
+    """
+    Keeps the positions selected by `member_mask`, preserving their order, up to `num_users` of them.
+    """
+    if member_mask is None:
+        return positions if num_users is None else positions[:num_users]
+    if num_users is None:
+        return positions[member_mask[positions]]
+
+    selected = []
+    found = 0
+    start = 0
+    chunk = max(4 * num_users, 1024)
+    while start < len(positions) and found < num_users:
+        block = positions[start:start + chunk]
+        block = block[member_mask[block]]
+        selected.append(block)
+        found += len(block)
+        start += chunk
+        chunk *= 2
+    if not selected:
+        return positions[:0]
+    return np.concatenate(selected)[:num_users]
+
+
+def sample_members(positions: np.ndarray, member_mask: np.ndarray | None, size: int, rng: np.random.Generator,
+                   exclude: np.ndarray | None = None) -> np.ndarray:
+    """
+    Draws up to `size` distinct positions uniformly at random, without replacement, among the `positions`
+    selected by `member_mask` and missing from `exclude`.
+
+    Random slots of the pool are drawn in growing batches and filtered, so the cost depends on the number
+    of users drawn rather than on the size of the pool, unless the filter rejects most of it, in which
+    case the last batch covers the whole pool.
+    """
+    if size <= 0 or len(positions) == 0:
+        return positions[:0]
+
+    batch = min(len(positions), max(2 * size, 64))
+    while True:
+        # A uniformly shuffled sample, so its first accepted slots are a uniform sample of the accepted ones
+        candidates = positions[rng.choice(len(positions), size=batch, replace=False)]
+        if member_mask is not None:
+            candidates = candidates[member_mask[candidates]]
+        if exclude is not None and len(exclude):
+            candidates = candidates[~np.isin(candidates, exclude)]
+        if len(candidates) >= size or batch == len(positions):
+            return candidates[:size]
+        batch = min(len(positions), 4 * batch)
@@ -0,0 +1,57 @@
+"""
+Benchmark of the confidence-level kernels against the row-wise implementation they replace.
+
+Usage:
+    python -m benchmarks.bench_confidence --n-users 1000000 --legacy-users 20000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from app import config
+from app.utils.confidence import compute_confidence_masks
+
+
+def legacy_good_mask(df: pd.DataFrame, interest: str) -> pd.Series:
+    interest_columns = config.interests_columns
+
+    def is_in_top_3(row):
+        return row[interest] in row[interest_columns].sort_values(ascending=False).head(3).values
+
+    return df.apply(is_in_top_3, axis=1)
+
+
+def make_interest_matrix(n_users: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return rng.integers(-4, 12, size=(n_users, len(config.interests_columns))).astype(float)
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n-users", type=int, default=1_000_000)
+    parser.add_argument("--legacy-users", type=int, default=20_000,
+                        help="Population used for the row-wise implementation, which is too slow for large inputs.")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    values = make_interest_matrix(args.n_users)
+    vectorized = min(timed(compute_confidence_masks, values) for _ in range(args.repeat))
+    print(f"vectorized, all tiers x all interests, {args.n_users} users: {vectorized * 1000:.1f} ms")
+
+    legacy_df = pd.DataFrame(values[:args.legacy_users], columns=config.interests_columns)
+    legacy = timed(legacy_good_mask, legacy_df, config.interests_columns[0])
+    per_user = legacy / len(legacy_df)
+    print(f"row-wise 'Good', one interest, {len(legacy_df)} users: {legacy * 1000:.1f} ms "
+          f"(~{per_user * args.n_users:.1f} s extrapolated to {args.n_users} users)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Recall and latency of the lookalike index against exact cosine search, for several n_probe values.
+
+Recall counts the returned users at least as similar as the k-th exact result, so users tied with it
+are not counted as misses.
+
+Usage:
+    python -m benchmarks.bench_lookalike --sizes 100000 1000000 --n-probe 1 4 8 16 32 --output lookalike.json
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from app.utils.lookalike_index import SIMILARITY_DECIMALS, LookalikeIndex
+from benchmarks.bench_suite import load_synthetic, write_results
+
+
+def exact_top(index: LookalikeIndex, query: np.ndarray, num_users: int, exclude: np.ndarray) -> tuple:
+    similarities = index.vectors @ (query / np.linalg.norm(query)).astype(np.float32)
+    similarities[exclude] = -np.inf
+    top = np.argpartition(-similarities, num_users - 1)[:num_users]
+    return np.round(similarities[top].min(), SIMILARITY_DECIMALS), similarities
+
+
+def run_size(data_dir: str, n_users: int, seed: int, n_probes: list, n_queries: int, num_users: int,
+             seeds_per_query: int) -> list:
+    df = load_synthetic(data_dir, n_users, seed)
+    start = time.perf_counter()
+    index = LookalikeIndex(df)
+    build_s = time.perf_counter() - start
+    print(f"{n_users:>10} users  {index.n_lists} lists  built in {build_s:.2f} s")
+
+    rng = np.random.default_rng(seed)
+    queries = [rng.choice(n_users, seeds_per_query, replace=False) for _ in range(n_queries)]
+
+    exact = []
+    exact_latencies = []
+    for seeds in queries:
+        query = index.vectors[seeds].astype(np.float64).mean(axis=0)
+        start = time.perf_counter()
+        exact.append(exact_top(index, query, num_users, seeds))
+        exact_latencies.append(time.perf_counter() - start)
+
+    results = [{"benchmark": "lookalike_exact", "n_users": n_users, "params": {"k": num_users},
+                "recall": 1.0, "median_s": statistics.median(exact_latencies), "build_s": build_s}]
+    for n_probe in n_probes:
+        recalls, latencies = [], []
+        for seeds, (threshold, similarities) in zip(queries, exact):
+            query = index.vectors[seeds].astype(np.float64).mean(axis=0)
+            start = time.perf_counter()
+            positions, _ = index.search(query, num_users, exclude=seeds, n_probe=n_probe)
+            latencies.append(time.perf_counter() - start)
+            recalls.append(np.mean(np.round(similarities[positions], SIMILARITY_DECIMALS) >= threshold))
+        results.append({"benchmark": "lookalike_ivf", "n_users": n_users,
+                        "params": {"k": num_users, "n_probe": n_probe, "n_lists": index.n_lists},
+                        "recall": float(np.mean(recalls)), "median_s": statistics.median(latencies),
+                        "build_s": build_s})
+
+    for result in results:
+        print(f"  {result['benchmark']:<16} n_probe={result['params'].get('n_probe', '-'):<5} "
+              f"recall {result['recall']:.3f}  median {result['median_s'] * 1000:8.2f} ms")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--n-probe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=100, help="Lookalike users per query.")
+    parser.add_argument("--seeds-per-query", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "user-profiling-bench"))
+    parser.add_argument("--output", default="lookalike-results.json")
+    args = parser.parse_args()
+
+    results = []
+    for n_users in args.sizes:
+        results.extend(run_size(args.data_dir, n_users, args.seed, args.n_probe, args.queries, args.k,
+                                args.seeds_per_query))
+    write_results(args.output, results, {"suite": "lookalike", "sizes": args.sizes, "seed": args.seed})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Cold start of the service: time and peak RSS of importing `app.main` in a fresh interpreter, time until a
+fresh worker answers its first targeting request from an existing snapshot, and the modules taking the
+most time to import.
+
+Every measurement runs in a new process, so nothing is shared with the previous runs but the page cache.
+
+Usage:
+    python -m benchmarks.bench_startup --n-users 1000000 --repeat 5 --output startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from app import config
+from benchmarks.bench_suite import write_results
+from benchmarks.synthetic import write_dataset
+
+# Run in the child processes, printing a JSON object on the last line
+IMPORT_PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                  "modules": len(sys.modules), "sklearn": "sklearn" in sys.modules}))
+"""
+
+FIRST_REQUEST_PROBE = """
+import json, resource, time
+start = time.perf_counter()
+from fastapi.testclient import TestClient
+from app.main import app
+imported = time.perf_counter() - start
+response = TestClient(app).post("/target-users/", json={"user_data": {
+    "gender": "Male", "interest": {"interests": ["Sports", "Travel"], "weights": [0.6, 0.4]}, "n_users": 100}})
+assert response.status_code == 200, response.text
+print(json.dumps({"seconds": time.perf_counter() - start, "import_seconds": imported,
+                  "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}))
+"""
+
+
+def run_probe(code: str, env: dict) -> dict:
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def summarize(name: str, samples: list, params: dict) -> dict:
+    result = {"benchmark": name, "params": params, "repeat": len(samples),
+              "min_s": min(sample["seconds"] for sample in samples),
+              "median_s": statistics.median(sample["seconds"] for sample in samples),
+              "max_rss_mb": max(sample["max_rss_kb"] for sample in samples) / 1024}
+    print(f"{name:<24} min {result['min_s'] * 1000:8.1f} ms  median {result['median_s'] * 1000:8.1f} ms  "
+          f"peak RSS {result['max_rss_mb']:7.1f} MB")
+    return result
+
+
+def slowest_imports(env: dict, count: int, max_depth: int = 2) -> list:
+    """
+    Modules imported within `max_depth` levels of `app.main`, by cumulative import time, from `python -X importtime`.
+    """
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app.main"], capture_output=True,
+                            text=True, env=env, check=True).stderr
+    modules = []
+    for line in output.splitlines()[1:]:
+        _, cumulative, name = line.split("|")
+        # Names are indented by two spaces per nesting level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth <= max_depth:
+            modules.append({"module": name.strip(), "depth": depth, "cumulative_s": int(cumulative) / 1e6})
+    return sorted(modules, key=lambda entry: -entry["cumulative_s"])[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n-users", type=int, default=100_000, help="Synthetic users served by the first request.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "user-profiling-bench"))
+    parser.add_argument("--output", default="startup-results.json")
+    args = parser.parse_args()
+
+    demographic_path, interaction_path = write_dataset(
+        os.path.join(args.data_dir, f"users-{args.n_users}-seed-{args.seed}"), args.n_users, seed=args.seed)
+    env = dict(os.environ, PYTHONPATH=os.getcwd(), USER_PROFILING_EAGER_LOAD="0",
+               USER_PROFILING_SNAPSHOT_DIR=os.path.join(args.data_dir, "snapshots"))
+
+    import_samples = [run_probe(IMPORT_PROBE, env) for _ in range(args.repeat)]
+    results = [summarize("import_app", import_samples, {"sklearn_imported": import_samples[0]["sklearn"]})]
+
+    # The data paths are set in the child before the app reads them, the snapshot is built by the warm-up run
+    probe = (f"from app import config\nconfig.DEMOGRAPHIC_DATA_PATH = {demographic_path!r}\n"
+             f"config.INTERACTION_DATA_PATH = {interaction_path!r}\n" + FIRST_REQUEST_PROBE)
+    run_probe(probe, env)
+    first_request = [run_probe(probe, env) for _ in range(args.repeat)]
+    results.append(summarize("first_request", first_request, {"n_users": args.n_users}))
+
+    imports = slowest_imports(env, 10)
+    for entry in imports:
+        print(f"  {entry['module']:<30} {entry['cumulative_s'] * 1000:8.1f} ms")
+    write_results(args.output, results, {"suite": "startup", "n_users": args.n_users, "seed": args.seed,
+                                         "use_snapshot": config.use_snapshot, "slowest_imports": imports})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Micro-benchmarks of the preprocessing and targeting functions on synthetic data of growing size.
+
+Results are written as JSON, one entry per (benchmark, size), together with the versions of the
+code and of the libraries, so runs of different versions can be compared.
+
+Usage:
+    python -m benchmarks.bench_suite --sizes 100000 1000000 --output results/bench.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from app import config
+from app.services import ingest_service, similarity_service
+from app.utils.data_loader import load_and_preprocess
+from app.utils.dataset import Dataset
+from benchmarks.synthetic import DataProfile, generate_demographics, generate_interactions, write_dataset
+
+# Multi-interest profile of the similarity benchmarks, over all the interests as the legacy function requires
+PROFILE = pd.Series([0.3, 0.1, 0.05, 0.15, 0.25, 0.15], index=config.interests_columns)
+N_RETURN_USERS = 1000
+# Ingestion batch of the same size at every dataset size, see `apply_batch` in the README
+INGEST_INTERACTIONS = 10_000
+INGEST_USERS = 100
+
+
+def measure(func, *args, repeat: int = 3, **kwargs) -> dict:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        timings.append(time.perf_counter() - start)
+    return {"min_s": min(timings), "median_s": statistics.median(timings), "repeat": repeat}
+
+
+def load_synthetic(data_dir: str, n_users: int, seed: int) -> pd.DataFrame:
+    """
+    Generates (or reuses) the synthetic CSVs of the given size and points the config at them.
+    """
+    config.DEMOGRAPHIC_DATA_PATH, config.INTERACTION_DATA_PATH = write_dataset(
+        os.path.join(data_dir, f"users-{n_users}-seed-{seed}"), n_users, seed=seed)
+    return load_and_preprocess()
+
+
+def run_size(data_dir: str, n_users: int, seed: int, repeat: int) -> list:
+    results = []
+
+    def record(name, func, *args, params=None, **kwargs):
+        result = {"benchmark": name, "n_users": n_users, "params": params or {}}
+        result.update(measure(func, *args, repeat=repeat, **kwargs))
+        results.append(result)
+        print(f"{name:<40} {json.dumps(result['params']):<56} {n_users:>10} users  {result['min_s'] * 1000:10.1f} ms")
+
+    df = load_synthetic(data_dir, n_users, seed)
+    record("load_and_preprocess", load_and_preprocess)
+    record("build_dataset_indexes", Dataset, df)
+    dataset = Dataset(df)
+
+    interest = config.interests_columns[0]
+    for level in config.confidence_level_list:
+        params = {"interest": interest, "confidence_level": level}
+        record("select_users_by_interest", similarity_service.select_users_by_interest, dataset.tier_index, None,
+               interest, level, num_users=N_RETURN_USERS, add_random=0.2, seed=seed, params=params)
+
+    record("add_random_positions", similarity_service.add_random_positions, dataset.tier_index, None,
+           N_RETURN_USERS // 5, "High", interest, seed=seed, params={"interest": interest, "confidence_level": "High"})
+    record("sort_users_by_cosine_similarity", similarity_service.sort_users_by_cosine_similarity, df, PROFILE)
+    record("rank_users_by_cosine_similarity", similarity_service.rank_users_by_cosine_similarity, dataset, None,
+           PROFILE, N_RETURN_USERS)
+
+    profile, rng = DataProfile.from_sample(), np.random.default_rng(seed)
+    interactions = generate_interactions(profile, n_users, INGEST_INTERACTIONS, rng)
+    new_users = generate_demographics(profile, n_users + 1, INGEST_USERS, rng)
+    record("apply_batch", ingest_service.apply_batch, dataset, interactions, new_users,
+           params={"interactions": INGEST_INTERACTIONS, "users": INGEST_USERS})
+    return results
+
+
+def metadata() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def write_results(path: str, results: list, extra: dict | None = None):
+    report = {"metadata": {**metadata(), **(extra or {})}, "results": results}
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as file:
+        json.dump(report, file, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "user-profiling-bench"),
+                        help="Where the synthetic CSVs are generated, and reused by later runs.")
+    parser.add_argument("--output", default="bench-results.json")
+    args = parser.parse_args()
+
+    results = []
+    for n_users in args.sizes:
+        results.extend(run_size(args.data_dir, n_users, args.seed, args.repeat))
+    write_results(args.output, results, {"suite": "micro", "sizes": args.sizes, "seed": args.seed})
+
+
+if __name__ == "__main__":
+    main()
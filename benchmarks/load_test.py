@@ -0,0 +1,129 @@
+"""
+End-to-end load test of the API with a weighted mix of targeting requests.
+
+Runs against a server given by --url, or in process against `app.main.app` on synthetic data of
+--n-users users. Latency percentiles, throughput and status codes are written as JSON, in the same
+report format as `benchmarks.bench_suite`.
+
+Usage:
+    python -m benchmarks.load_test --n-users 1000000 --requests 2000 --concurrency 32
+    python -m benchmarks.load_test --url http://localhost:8000 --requests 2000
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import httpx
+
+from app import config
+from benchmarks.bench_suite import write_results
+from benchmarks.synthetic import write_dataset
+
+MULTI_INTEREST = {"interests": ["Technology", "Fashion", "Travel"], "weights": [0.5, 0.3, 0.2]}
+
+# (name, weight, path, body) of the requests making up the load
+REQUEST_MIX = [
+    ("single_interest", 4, "/target-users/",
+     {"user_data": {"interest": {"interests": ["Sports"], "weights": [1.0]}, "confidence_level": "High",
+                    "n_users": 500}}),
+    ("single_interest_filtered", 2, "/target-users/",
+     {"user_data": {"gender": "Female", "region": "Northern Italy", "age": [25, 45],
+                    "interest": {"interests": ["Finance"], "weights": [1.0]}, "confidence_level": "Good",
+                    "n_users": 200}}),
+    ("multi_interest", 3, "/target-users/",
+     {"user_data": {"interest": MULTI_INTEREST, "n_users": 1000}}),
+    ("multi_interest_filtered", 2, "/target-users/",
+     {"user_data": {"occupation": ["Engineer", "Doctor"], "income": [50000, 120000],
+                    "interest": MULTI_INTEREST, "n_users": 200}}),
+    ("batch", 1, "/target-users/batch",
+     {"user_data": [{"gender": gender, "interest": MULTI_INTEREST, "n_users": 100}
+                    for gender in ["Male", "Female", "Other"]]}),
+]
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def run_load(client: httpx.AsyncClient, n_requests: int, concurrency: int, seed: int) -> tuple:
+    rng = random.Random(seed)
+    schedule = rng.choices(REQUEST_MIX, weights=[weight for _, weight, _, _ in REQUEST_MIX], k=n_requests)
+    queue = asyncio.Queue()
+    for request in schedule:
+        queue.put_nowait(request)
+    samples = []
+
+    async def worker():
+        while not queue.empty():
+            name, _, path, body = queue.get_nowait()
+            start = time.perf_counter()
+            response = await client.post(path, json=body)
+            await response.aread()
+            samples.append((name, response.status_code, time.perf_counter() - start))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return samples, time.perf_counter() - start
+
+
+def summarize(samples: list, elapsed: float) -> list:
+    results = []
+    for name in sorted({name for name, _, _ in samples}) + [None]:
+        selected = [sample for sample in samples if name is None or sample[0] == name]
+        latencies = [latency for _, _, latency in selected]
+        statuses = {}
+        for _, status, _ in selected:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        results.append({
+            "benchmark": "load_test", "request": name or "all", "count": len(selected),
+            "throughput_rps": len(selected) / elapsed, "status_codes": statuses,
+            "mean_s": statistics.fmean(latencies), "p50_s": percentile(latencies, 0.5),
+            "p95_s": percentile(latencies, 0.95), "p99_s": percentile(latencies, 0.99), "max_s": max(latencies),
+        })
+    return results
+
+
+async def main_async(args) -> list:
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=None)
+    else:
+        config.DEMOGRAPHIC_DATA_PATH, config.INTERACTION_DATA_PATH = write_dataset(
+            os.path.join(args.data_dir, f"users-{args.n_users}-seed-{args.seed}"), args.n_users, seed=args.seed)
+        from app.main import app
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test", timeout=None)
+
+    async with client:
+        # Load the data and warm up before measuring
+        await run_load(client, len(REQUEST_MIX), 1, args.seed)
+        samples, elapsed = await run_load(client, args.requests, args.concurrency, args.seed)
+
+    results = summarize(samples, elapsed)
+    for result in results:
+        print(f"{result['request']:<28} {result['count']:>6} requests  {result['throughput_rps']:8.1f} req/s  "
+              f"p50 {result['p50_s'] * 1000:8.1f} ms  p99 {result['p99_s'] * 1000:8.1f} ms  {result['status_codes']}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=None, help="Server to load, defaults to an in-process app.")
+    parser.add_argument("--n-users", type=int, default=100_000, help="Synthetic users of the in-process app.")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "user-profiling-bench"))
+    parser.add_argument("--output", default="load-test-results.json")
+    args = parser.parse_args()
+
+    results = asyncio.run(main_async(args))
+    write_results(args.output, results, {"suite": "load_test", "url": args.url, "n_users": None if args.url else args.n_users,
+                                         "requests": args.requests, "concurrency": args.concurrency, "seed": args.seed})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Synthetic demographic and interaction data with the schema and distributions of the sample CSVs,
+for benchmarking at sizes the samples do not reach.
+
+Usage:
+    python -m benchmarks.synthetic --n-users 1000000 --output-dir /tmp/user-profiling-1m
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from app import config
+
+DEMOGRAPHIC_FILE = "demographic_data.csv"
+INTERACTION_FILE = "interaction_data.csv"
+
+# Rows generated and written at a time, bounding the memory used for large outputs
+CHUNK_ROWS = 1_000_000
+
+
+class DataProfile:
+    """
+    Distributions of the sample data: frequencies of the categorical columns, quantiles of the numeric
+    ones and the number of interactions per user.
+    """
+
+    categorical_columns = ['gender', 'occupation', 'interests', 'city']
+    numeric_columns = ['age', 'income']
+
+    def __init__(self, demographic_df: pd.DataFrame, interaction_df: pd.DataFrame):
+        self.frequencies = {column: demographic_df[column].value_counts(normalize=True)
+                            for column in self.categorical_columns}
+        self.quantiles = {column: np.quantile(demographic_df[column], np.linspace(0, 1, 101))
+                          for column in self.numeric_columns}
+        self.survey_types = interaction_df['survey_type'].value_counts(normalize=True)
+        self.responses = interaction_df['response'].value_counts(normalize=True)
+        self.interactions_per_user = len(interaction_df) / len(demographic_df)
+
+    @classmethod
+    def from_sample(cls) -> "DataProfile":
+        return cls(pd.read_csv(config.DEMOGRAPHIC_DATA_PATH), pd.read_csv(config.INTERACTION_DATA_PATH))
+
+
+def sample_categorical(rng: np.random.Generator, frequencies: pd.Series, size: int) -> np.ndarray:
+    return rng.choice(frequencies.index.to_numpy(), size=size, p=frequencies.to_numpy())
+
+
+def sample_numeric(rng: np.random.Generator, quantiles: np.ndarray, size: int) -> np.ndarray:
+    # Inverse transform sampling over the percentiles of the sample
+    return np.round(np.interp(rng.random(size), np.linspace(0, 1, len(quantiles)), quantiles)).astype(np.int64)
+
+
+def generate_demographics(profile: DataProfile, first_user_id: int, n_users: int,
+                          rng: np.random.Generator) -> pd.DataFrame:
+    columns = {'user_id': np.arange(first_user_id, first_user_id + n_users)}
+    for column in ['age', 'gender', 'occupation', 'income', 'interests', 'city']:
+        if column in profile.quantiles:
+            columns[column] = sample_numeric(rng, profile.quantiles[column], n_users)
+        else:
+            columns[column] = sample_categorical(rng, profile.frequencies[column], n_users)
+    return pd.DataFrame(columns)
+
+
+def generate_interactions(profile: DataProfile, n_users: int, n_interactions: int,
+                          rng: np.random.Generator) -> pd.DataFrame:
+    return pd.DataFrame({
+        'user_id': rng.integers(1, n_users + 1, size=n_interactions),
+        'survey_type': sample_categorical(rng, profile.survey_types, n_interactions),
+        'response': sample_categorical(rng, profile.responses, n_interactions),
+    })
+
+
+def generate(n_users: int, n_interactions: int | None = None, seed: int = 0,
+             profile: DataProfile | None = None):
+    """
+    Generates the demographic and interaction data in chunks of `CHUNK_ROWS` rows.
+
+    Parameters:
+    - n_users (int): Number of users.
+    - n_interactions (int, optional): Number of interactions, defaults to the per-user rate of the sample.
+    - seed (int): Seed of the generator, the same arguments always produce the same data.
+    - profile (DataProfile, optional): Distributions to follow, defaults to those of the sample CSVs.
+
+    Returns:
+    - tuple: Iterators over the demographic chunks and over the interaction chunks.
+    """
+    if profile is None:
+        profile = DataProfile.from_sample()
+    if n_interactions is None:
+        n_interactions = round(n_users * profile.interactions_per_user)
+    # Independent streams, so the users do not depend on how many interactions are drawn
+    demographic_rng, interaction_rng = np.random.default_rng(seed).spawn(2)
+
+    demographics = (generate_demographics(profile, start + 1, min(CHUNK_ROWS, n_users - start), demographic_rng)
+                    for start in range(0, n_users, CHUNK_ROWS))
+    interactions = (generate_interactions(profile, n_users, min(CHUNK_ROWS, n_interactions - start), interaction_rng)
+                    for start in range(0, n_interactions, CHUNK_ROWS))
+    return demographics, interactions
+
+
+def write_csv(chunks, path: str):
+    for i, chunk in enumerate(chunks):
+        chunk.to_csv(path, mode="w" if i == 0 else "a", header=i == 0, index=False)
+
+
+def write_dataset(output_dir: str, n_users: int, n_interactions: int | None = None, seed: int = 0) -> tuple:
+    """
+    Writes the synthetic CSVs to `output_dir`, skipping the files already there, and returns their paths.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = os.path.join(output_dir, DEMOGRAPHIC_FILE), os.path.join(output_dir, INTERACTION_FILE)
+    if not all(os.path.exists(path) for path in paths):
+        demographics, interactions = generate(n_users, n_interactions, seed)
+        write_csv(demographics, paths[0])
+        write_csv(interactions, paths[1])
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n-users", type=int, default=100_000)
+    parser.add_argument("--n-interactions", type=int, default=None,
+                        help="Defaults to the number of interactions per user of the sample data.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output-dir", required=True)
+    args = parser.parse_args()
+
+    for path in write_dataset(args.output_dir, args.n_users, args.n_interactions, args.seed):
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
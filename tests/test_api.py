@@ -1,9 +1,13 @@
+import gzip
+import time
 import app.services
 import app.services.user_service
 from fastapi.testclient import TestClient
 from app.main import app
+from app.utils.cache import ResultCache
 from unittest.mock import patch
 import pandas as pd
+import pytest
 
 client = TestClient(app)
 
@@ -68,4 +72,192 @@ def test_create_target_users_failure():
 
         # Assertions
         assert response.status_code == 500
-        assert response.json() == {"message": "No result"}
\ No newline at end of file
+        assert response.json() == {"message": "No result"}
+
+def test_create_target_users_batch():
+    user_data = {
+        "gender": "Male",
+        "interest": {
+            "interests": ["Technology", "Fashion"],
+            "weights": [0.7, 0.3]
+        },
+        "n_users": 5
+    }
+    with patch('app.services.user_service.process_user_data_batch') as mock_process_user_data_batch:
+        mock_process_user_data_batch.return_value = [pd.DataFrame({"user_id": [1, 2]}), None]
+
+        response = client.post("/target-users/batch", json={"user_data": [user_data, user_data]})
+
+        assert response.status_code == 200
+        assert response.json() == [{"user_id": {"0": 1, "1": 2}}, {"message": "No result"}]
+
+def test_ingest():
+    summary = {"users_added": 1, "users_skipped": 0, "users_updated": 1,
+               "interactions_applied": 1, "interactions_skipped": 0, "version": 2}
+    with patch('app.services.ingest_service.ingest') as mock_ingest:
+        mock_ingest.return_value = summary
+
+        response = client.post("/admin/ingest", json={
+            "interactions": [{"user_id": 7, "survey_type": "Sports", "response": "Yes"}],
+            "users": [{"user_id": 7, "age": 30, "gender": "Male", "occupation": "Engineer",
+                       "income": 50000, "interests": "Sports", "city": "Milan"}],
+        })
+
+        assert response.status_code == 200
+        assert response.json() == summary
+        interactions, users = mock_ingest.call_args.args
+        assert interactions['user_id'].tolist() == [7]
+        assert users['city'].tolist() == ['Milan']
+
+def test_create_target_users_ndjson():
+    request_data = {"user_data": {"interest": {"interests": ["Technology", "Fashion"], "weights": [0.7, 0.3]}}}
+    result = pd.DataFrame({"user_id": [3, 1], "similarity": [0.9, 0.5], "city": ["Milan", "Rome"]}, index=[7, 2])
+    # Multi-interest results are cached, a fresh cache keeps the other tests posting this body from seeing it
+    with patch('app.services.user_service.result_cache', ResultCache(max_size=10, ttl_seconds=60)), \
+         patch('app.services.user_service.process_user_data') as mock_process_user_data:
+        mock_process_user_data.return_value = result
+
+        response = client.post("/target-users/?columns=user_id,similarity", json=request_data,
+                               headers={"Accept": "application/x-ndjson"})
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        assert response.text == '{"user_id":3,"similarity":0.9}\n{"user_id":1,"similarity":0.5}\n'
+
+        response = client.post("/target-users/?format=ndjson&columns=score", json=request_data)
+        assert response.status_code == 400
+
+
+def test_create_target_users_arrow():
+    pa = pytest.importorskip("pyarrow")
+    request_data = {"user_data": {"interest": {"interests": ["Technology", "Fashion"], "weights": [0.7, 0.3]}}}
+    result = pd.DataFrame({"user_id": range(25_000), "similarity": 0.5})
+    with patch('app.services.user_service.result_cache', ResultCache(max_size=10, ttl_seconds=60)), \
+         patch('app.services.user_service.process_user_data') as mock_process_user_data:
+        mock_process_user_data.return_value = result
+
+        response = client.post("/target-users/?format=arrow&columns=user_id", json=request_data)
+
+        assert response.status_code == 200
+        mock_process_user_data.assert_called_once()
+        table = pa.ipc.open_stream(response.content).read_all()
+        assert table.column_names == ["user_id"]
+        assert table.column("user_id").to_pylist() == list(range(25_000))
+
+
+def test_profile_header_and_metrics():
+    request_data = {"user_data": {"gender": "Male", "interest": {"interests": ["Technology", "Fashion"], "weights": [0.7, 0.3]}}}
+    with patch('app.services.user_service.process_user_data') as mock_process_user_data:
+        mock_process_user_data.return_value = pd.DataFrame({"user_id": [1]})
+
+        response = client.post("/target-users/", json=request_data, headers={"X-Profile": "1"})
+        assert response.status_code == 200
+        assert "serialization;dur=" in response.headers["Server-Timing"]
+
+        assert "Server-Timing" not in client.post("/target-users/", json=request_data).headers
+        # Streamed formats are serialized after the headers are sent
+        response = client.post("/target-users/?format=ndjson", json=request_data, headers={"X-Profile": "1"})
+        assert response.text == '{"user_id":1}\n' and "serialization" not in response.headers["Server-Timing"]
+    assert client.post("/target-users/?format=xml", json=request_data).status_code == 400
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert 'user_profiling_request_seconds_count{endpoint="target_users"}' in response.text
+    assert 'user_profiling_stage_seconds_bucket{le="+Inf",stage="serialization"}' in response.text
+
+
+def test_audience_size():
+    cube_request = {"user_data": {"gender": "Male", "region": ["Northern Italy"],
+                                  "interest": {"interests": ["Sports"], "weights": [1.0]}, "confidence_level": "Mid"}}
+    response = client.post("/audience-size", json=cube_request)
+    assert response.status_code == 200
+    assert response.json()["source"] == "cube"
+
+    # Raw ranges fall back to a count, which agrees with the cube on the whole age range
+    scan_request = {"user_data": {**cube_request["user_data"], "age": [0, 200]}}
+    response_scan = client.post("/audience-size", json=scan_request)
+    assert response_scan.json() == {"audience_size": response.json()["audience_size"], "source": "scan"}
+
+    multi_interest = {"user_data": {"interest": {"interests": ["Sports", "Travel"], "weights": [0.5, 0.5]}}}
+    assert client.post("/audience-size", json=multi_interest).status_code == 400
+
+
+def test_reload():
+    with patch('app.services.reload_service.dataset_reloader.start') as mock_start:
+        mock_start.return_value = True
+        assert client.post("/admin/reload").status_code == 202
+        mock_start.return_value = False
+        assert client.post("/admin/reload").status_code == 409
+
+    response = client.get("/admin/reload")
+    assert response.status_code == 200
+    assert response.json()["state"] in ("idle", "running", "failed")
+
+
+def test_export(tmp_path):
+    request_data = {"user_data": {"interest": {"interests": ["Sports"], "weights": [1.0]}}, "columns": ["user_id"]}
+    with patch('app.services.user_service.process_user_data') as mock_process_user_data, \
+         patch('app.services.export_service.export_manager.directory', str(tmp_path)):
+        mock_process_user_data.return_value = pd.DataFrame({"user_id": [4, 2], "city": ["Milan", "Rome"]})
+
+        response = client.post("/exports", json=request_data)
+        assert response.status_code == 202
+        job_id = response.json()["id"]
+        for _ in range(1000):
+            job = client.get(f"/exports/{job_id}").json()
+            if job["state"] not in ("queued", "running"):
+                break
+            time.sleep(0.01)
+
+    assert job["state"] == "completed"
+    response = client.get(f"/exports/{job_id}/file")
+    assert response.status_code == 200
+    assert gzip.decompress(response.content).decode().splitlines() == ["user_id", "4", "2"]
+    assert client.get("/exports/unknown").status_code == 404
+    assert client.post("/exports", json={**request_data, "format": "xlsx"}).status_code == 400
+    with patch('app.services.export_service.export_manager.max_pending', 0):
+        response = client.post("/exports", json=request_data)
+        assert response.status_code == 503 and response.headers["Retry-After"] == "10"
+
+
+def test_target_users_pages():
+    request_data = {"user_data": {"interest": {"interests": ["Sports", "Travel"], "weights": [0.5, 0.5]}, "n_users": 30}}
+    full = client.post("/target-users/?format=ndjson&columns=user_id,similarity", json=request_data).text.splitlines()
+
+    response = client.post("/target-users/?format=ndjson&columns=user_id,similarity&page_size=20", json=request_data)
+    assert response.status_code == 200
+    assert response.headers["X-Total-Count"] == "30"
+    pages = response.text.splitlines()
+    response = client.post(f"/target-users/?format=ndjson&columns=user_id,similarity&cursor={response.headers['X-Next-Cursor']}")
+    assert response.status_code == 200
+    assert "X-Next-Cursor" not in response.headers
+    assert pages + response.text.splitlines() == full
+
+    assert client.post("/target-users/?cursor=bm90OmE=").status_code == 400
+    assert client.post("/target-users/").status_code == 422
+
+
+def test_unknown_dataset():
+    request_data = {"user_data": {"interest": {"interests": ["Sports"], "weights": [1.0]}}}
+    assert client.post("/target-users/?dataset=unknown", json=request_data).status_code == 404
+    assert client.post("/exports?dataset=unknown", json=request_data).status_code == 404
+    assert client.post("/target-users/?dataset=default", json=request_data).status_code == 200
+    assert client.get("/admin/datasets").json()["loaded"] == {}
+
+
+def test_target_users_columns():
+    # The columns of the table, the response counts rescoring custom weights are not part of the results
+    table_columns = ['user_id', 'age', 'gender', 'occupation', 'income', 'interests', 'city', 'Sports', 'Finance',
+                     'Politics', 'Fashion', 'Technology', 'Travel', 'Fashion_interaction', 'Finance_interaction',
+                     'Politics_interaction', 'Sports_interaction', 'Technology_interaction', 'Travel_interaction',
+                     'Total', 'age_group', 'age_group_name', 'region', 'occupation_category', 'income_quintile_name']
+    single = {"interest": {"interests": ["Sports"], "weights": [1.0]}, "n_users": 30}
+    multi = {"interest": {"interests": ["Sports", "Travel"], "weights": [0.5, 0.5]}, "n_users": 30}
+
+    assert list(client.post("/target-users/", json={"user_data": single}).json()) == table_columns
+    assert list(client.post("/target-users/", json={"user_data": multi}).json()) == table_columns + ["similarity"]
+    custom = {**single, "scoring_weights": {"yes": 4}}
+    assert list(client.post("/target-users/", json={"user_data": custom}).json()) == table_columns
+
+    response = client.post("/target-users/?page_size=20", json={"user_data": single})
+    response = client.post(f"/target-users/?cursor={response.headers['X-Next-Cursor']}")
+    assert list(response.json()) == table_columns
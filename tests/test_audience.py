@@ -0,0 +1,61 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app import config
+from app.api.schemas import UserData
+from app.services import audience_service
+from app.utils.audience_cube import AudienceCube
+from app.utils.dataset import Dataset
+from tests.test_user_service import make_full_dataset
+
+SELECTIONS = [
+    {},
+    {'gender': 'Male'},
+    {'gender': ['Female', 'Other'], 'region': ['Northern Italy', 'Insular Italy']},
+    {'age_group': 'Adults', 'income_group': ['1st Quintile', '5th Quintile']},
+    {'occupation_category': 'Highly Specialized Professions', 'region': 'Central Italy', 'gender': 'Male'},
+    {'region': 'Atlantis'},
+]
+
+
+@pytest.fixture(scope="module")
+def dataset():
+    return Dataset(make_full_dataset(2000))
+
+
+@pytest.mark.parametrize("fields", SELECTIONS)
+def test_cube_matches_scan(dataset, fields):
+    tiers = [(None, None)] + list(itertools.product(['Sports', 'Travel'], config.confidence_level_list))
+    for interest, confidence_level in tiers:
+        user_data = UserData(**fields, confidence_level=confidence_level,
+                             interest=None if interest is None else {'interests': [interest], 'weights': [1.0]})
+        size = audience_service.cube_audience_size(user_data, dataset)
+
+        assert size == audience_service.scan_audience_size(user_data, dataset)
+
+
+def test_raw_ranges_are_not_answered_by_the_cube(dataset):
+    user_data = UserData(gender='Male', age=[25, 40])
+
+    assert audience_service.cube_audience_size(user_data, dataset) is None
+    expected = ((dataset.data['gender'] == 'Male') & dataset.data['age'].between(25, 40)).sum()
+    assert audience_service.scan_audience_size(user_data, dataset) == expected
+
+
+def test_update_matches_rebuild():
+    data = make_full_dataset(600)
+    cube = AudienceCube(data.iloc[:500].reset_index(drop=True))
+
+    # Modified interests of existing users, and new users, one of them with an unknown region
+    data.loc[[3, 40, 41], config.interests_columns] = [[10, 0, 0, 0, 0, 0], [-3, 5, 5, 0, 0, 0], [0, 0, 0, 0, 0, 7]]
+    cube.update(data, np.concatenate([[3, 40, 41], np.arange(500, 600)]))
+    np.testing.assert_array_equal(cube.total, AudienceCube(data).total)
+    np.testing.assert_array_equal(cube.tiers, AudienceCube(data).tiers)
+
+    data.loc[599, 'region'] = 'Atlantis'
+    cube.update(data, [599])
+    assert cube.count({'region': 'Atlantis'}) == 1
+    assert cube.count({}) == len(data)
@@ -0,0 +1,44 @@
+from unittest.mock import patch
+
+from app.utils.cache import ResultCache
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResultCache(max_size=2, ttl_seconds=60)
+    cache.put('a', 1, 'A')
+    cache.put('b', 1, 'B')
+    cache.get('a', 1)
+    cache.put('c', 1, 'C')
+
+    assert cache.get('b', 1) is None
+    assert cache.get('a', 1) == 'A'
+    assert cache.stats()['evictions'] == 1
+
+
+def test_entries_expire():
+    cache = ResultCache(max_size=2, ttl_seconds=10)
+    with patch('app.utils.cache.time.monotonic', return_value=100.0):
+        cache.put('a', 1, 'A')
+    with patch('app.utils.cache.time.monotonic', return_value=111.0):
+        assert cache.get('a', 1) is None
+
+
+def test_new_dataset_version_invalidates_entries():
+    cache = ResultCache(max_size=2, ttl_seconds=60)
+    cache.put('a', 1, 'A')
+
+    assert cache.get('a', 2) is None
+    assert cache.get('a', 1) is None
+    assert cache.stats() == {'size': 0, 'max_size': 2, 'hits': 0, 'misses': 2, 'evictions': 0,
+                             'hit_rate': 0.0, 'dataset_version': 1}
+
+
+def test_namespaces_keep_their_own_versions():
+    cache = ResultCache(max_size=4, ttl_seconds=60)
+    cache.put('a', 1, 'A')
+    cache.put('a', 2, 'tenant A', namespace='tenant')
+
+    assert cache.get('a', 1) == 'A'
+    assert cache.get('a', 2, 'tenant') == 'tenant A'
+    assert cache.get('a', 3, 'tenant') is None
+    assert cache.get('a', 1) == 'A'
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app import config
+from app.services.similarity_service import select_users_by_interest
+from app.utils.confidence import compute_confidence_mask, compute_confidence_masks
+from app.utils.dataset import Dataset
+
+
+def legacy_confidence_mask(df, interest, confidence_level):
+    # Row-wise reference implementation the vectorized kernels replace
+    interest_columns = config.interests_columns
+    if confidence_level == "Very High":
+        return (df[interest] > 0) & (df[[col for col in interest_columns if col != interest]].le(0).all(axis=1))
+    if confidence_level == "High":
+        return (df[interest] > 0) & (df[interest_columns].idxmax(axis=1) == interest)
+    if confidence_level == "Good":
+        def is_in_top_3(row):
+            top_3_values = row[interest_columns].sort_values(ascending=False).head(3).values
+            return row[interest] in top_3_values
+        return df.apply(is_in_top_3, axis=1)
+    if confidence_level == "Mid":
+        return df[interest] >= 0
+    return pd.Series(True, index=df.index)
+
+
+def make_users(n_users=500, seed=0):
+    rng = np.random.default_rng(seed)
+    # Small integer scores produce plenty of ties, which is where the tiers are easiest to get wrong
+    df = pd.DataFrame(rng.integers(-4, 9, size=(n_users, len(config.interests_columns))).astype(float),
+                      columns=config.interests_columns)
+    for column in config.interation_columns:
+        df[column] = rng.integers(0, 6, size=n_users)
+    df['user_id'] = np.arange(1, n_users + 1)
+    return df
+
+
+@pytest.mark.parametrize("confidence_level", config.confidence_level_list)
+def test_confidence_mask_matches_legacy(confidence_level):
+    df = make_users()
+    masks = compute_confidence_masks(df[config.interests_columns].to_numpy())
+    for i, interest in enumerate(config.interests_columns):
+        expected = legacy_confidence_mask(df, interest, confidence_level).to_numpy()
+        assert np.array_equal(masks[confidence_level][:, i], expected)
+        assert np.array_equal(compute_confidence_mask(df[config.interests_columns].to_numpy(), interest, confidence_level),
+                              expected)
+
+
+@pytest.mark.parametrize("confidence_level", config.confidence_level_list)
+def test_select_users_by_interest_membership(confidence_level):
+    df = make_users(seed=1)
+    df['Total'] = df[config.interation_columns].sum(axis=1)
+    interest = 'Finance'
+    positions = select_users_by_interest(Dataset(df).tier_index, None, interest, confidence_level, num_users=len(df),
+                                         add_random=None)
+
+    result = df.iloc[positions]
+    expected = df[legacy_confidence_mask(df, interest, confidence_level)]
+    assert set(result['user_id']) == set(expected['user_id'])
+    assert result[f'{interest}_interaction'].is_monotonic_decreasing
+
+
+def test_confidence_mask_rejects_unknown_level():
+    df = make_users(n_users=10)
+    with pytest.raises(ValueError):
+        compute_confidence_mask(df[config.interests_columns].to_numpy(), 'Finance', 'Unknown')
@@ -0,0 +1,71 @@
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from app import config
+from app.services import dataset_registry, user_service
+from app.services.dataset_registry import DatasetRegistry, UnknownDataset, load_definitions
+from benchmarks.synthetic import write_dataset
+from tests.test_user_service import make_request
+
+ALL_CITIES = sorted(city for cities in config.region_mapping.values() for city in cities)
+
+
+@pytest.fixture(scope="module")
+def definitions_file(tmp_path_factory):
+    root = tmp_path_factory.mktemp("tenants")
+    definitions = {}
+    for dataset_id, n_users, seed in [("north", 300, 1), ("south", 500, 2)]:
+        demographic_path, interaction_path = write_dataset(str(root / dataset_id), n_users, seed=seed)
+        definitions[dataset_id] = {"demographic_data": demographic_path, "interaction_data": interaction_path}
+    definitions["south"]["region_mapping"] = {"Everywhere": ALL_CITIES}
+    path = root / "datasets.json"
+    path.write_text(json.dumps(definitions))
+    return str(path)
+
+
+@pytest.fixture
+def spawns(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'SNAPSHOT_DIR', str(tmp_path / "snapshots"))
+    spawned = []
+
+    def counting_executor(*args, **kwargs):
+        spawned.append(kwargs)
+        return ProcessPoolExecutor(*args, **kwargs)
+
+    monkeypatch.setattr(dataset_registry, 'ProcessPoolExecutor', counting_executor)
+    return spawned
+
+
+def test_datasets_are_loaded_with_their_own_settings(definitions_file, spawns):
+    registry = DatasetRegistry(load_definitions(definitions_file), max_bytes=1 << 30)
+
+    north, south = registry.get("north"), registry.get("south")
+
+    assert (len(north), len(south)) == (300, 500)
+    assert north.dataset_id == "north" and north.version != south.version
+    assert "Everywhere" in set(south.data[config.region_column])
+    assert not set(south.data[config.region_column]) & set(config.region_mapping)
+    assert "Everywhere" not in set(north.data[config.region_column])
+    assert registry.get("north") is north and len(spawns) == 2
+    assert len(user_service.process_user_data(make_request(region="Everywhere"), south)) == 20
+    with pytest.raises(UnknownDataset):
+        registry.get("east")
+
+
+def test_least_recently_used_dataset_is_evicted(definitions_file, spawns):
+    registry = DatasetRegistry(load_definitions(definitions_file), max_bytes=1 << 30)
+    north = registry.get("north")
+    registry.max_bytes = registry.status()["bytes"] + 1
+
+    registry.get("south")
+    status = registry.status()
+    assert list(status["loaded"]) == ["south"] and status["evictions"] == 1
+
+    # Evicted datasets are mapped again from their snapshot, without preprocessing them again
+    reloaded = registry.get("north")
+    assert reloaded is not north and len(reloaded) == len(north)
+    assert reloaded.version > north.version
+    assert len(spawns) == 2
+    assert list(registry.status()["loaded"]) == ["north"]
@@ -0,0 +1,54 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.services.executor import ComputeExecutor, ExecutorBusy
+from app.services.user_service import compute_target_users
+from tests.test_user_service import make_request
+
+
+def test_run_returns_the_result():
+    executor = ComputeExecutor("thread", max_workers=2, max_queue=0, timeout_seconds=5)
+    assert asyncio.run(executor.run(pow, 2, 10)) == 1024
+    executor.shutdown()
+
+
+def test_full_pool_rejects_new_tasks():
+    executor = ComputeExecutor("thread", max_workers=1, max_queue=1, timeout_seconds=5)
+    release = threading.Event()
+
+    async def scenario():
+        running = [asyncio.create_task(executor.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        with pytest.raises(ExecutorBusy):
+            await executor.run(release.wait)
+        release.set()
+        await asyncio.gather(*running)
+
+    asyncio.run(scenario())
+    assert executor.in_flight == 0
+    executor.shutdown()
+
+
+def test_slow_task_times_out():
+    executor = ComputeExecutor("thread", max_workers=1, max_queue=0, timeout_seconds=0.05)
+    release = threading.Event()
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(executor.run(release.wait))
+    release.set()
+    executor.shutdown()
+
+
+def test_process_workers_are_spawned_and_serve_requests(tmp_path, monkeypatch):
+    # Spawned workers import the app again and load the dataset, reading their settings from the environment
+    monkeypatch.setenv('USER_PROFILING_SNAPSHOT_DIR', str(tmp_path / "snapshots"))
+    executor = ComputeExecutor("process", max_workers=1, max_queue=0, timeout_seconds=120)
+    try:
+        result = asyncio.run(executor.run(compute_target_users, make_request()))
+        assert executor._get_pool()._mp_context.get_start_method() == "spawn"
+    finally:
+        executor.shutdown()
+
+    assert len(result) == 20
@@ -0,0 +1,91 @@
+import gzip
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from app.services import sharding, user_service
+from app.services.export_service import ExportManager, ExportsBusy, write_export
+from app.utils.data_manager import DataManager
+from app.utils.dataset import Dataset
+from tests.test_user_service import make_full_dataset, make_request
+
+
+@pytest.fixture
+def dataset(monkeypatch):
+    dataset = Dataset(make_full_dataset(500))
+    monkeypatch.setattr(DataManager, '_dataset', dataset)
+    return dataset
+
+
+def wait_for(manager: ExportManager, job_id: str) -> dict:
+    deadline = time.time() + 30
+    while manager.status(job_id)["state"] in ("queued", "running") and time.time() < deadline:
+        time.sleep(0.01)
+    return manager.status(job_id)
+
+
+def test_export_writes_the_ranked_audience(dataset, tmp_path):
+    manager = ExportManager(str(tmp_path), max_workers=1, max_jobs=10, max_pending=10)
+    request = make_request(gender='Female', n_users=300)
+
+    job = wait_for(manager, manager.submit(request, columns=['user_id', 'similarity'])["id"])
+
+    assert job["state"] == "completed" and job["progress"] == 1.0
+    exported = pd.read_csv(job["path"])
+    expected = user_service.process_user_data(request, dataset)[['user_id', 'similarity']].reset_index(drop=True)
+    pd.testing.assert_frame_equal(exported, expected)
+    manager.shutdown()
+
+
+def test_failed_exports_report_their_error(dataset, tmp_path):
+    manager = ExportManager(str(tmp_path), max_workers=1, max_jobs=10, max_pending=10)
+
+    job = wait_for(manager, manager.submit(make_request(), columns=['score'])["id"])
+
+    assert job["state"] == "failed" and "score" in job["error"]
+    with pytest.raises(ValueError):
+        manager.submit(make_request(), format="xlsx")
+    manager.shutdown()
+
+
+def test_oldest_finished_exports_are_removed(dataset, tmp_path):
+    manager = ExportManager(str(tmp_path), max_workers=1, max_jobs=2, max_pending=10)
+    jobs = []
+    for _ in range(3):
+        jobs.append(wait_for(manager, manager.submit(make_request())["id"]))
+
+    assert manager.status(jobs[0]["id"]) is None
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted(f"{job['id']}.csv.gz" for job in jobs[1:])
+    manager.shutdown()
+
+
+
+def test_submissions_beyond_the_pending_limit_are_rejected(dataset, tmp_path, monkeypatch):
+    manager = ExportManager(str(tmp_path), max_workers=1, max_jobs=10, max_pending=2)
+    release = threading.Event()
+    compute = sharding.compute_target_users
+    monkeypatch.setattr(sharding, 'compute_target_users', lambda *args: release.wait() and compute(*args))
+
+    # One running job and one queued behind it
+    pending = [manager.submit(make_request())["id"] for _ in range(2)]
+    with pytest.raises(ExportsBusy):
+        manager.submit(make_request())
+    assert len(manager._jobs) == 2
+
+    release.set()
+    assert all(wait_for(manager, job_id)["state"] == "completed" for job_id in pending)
+    assert wait_for(manager, manager.submit(make_request())["id"])["state"] == "completed"
+    manager.shutdown()
+
+def test_csv_export_is_chunked(tmp_path, monkeypatch):
+    monkeypatch.setattr('app.services.export_service.EXPORT_CHUNK_ROWS', 7)
+    result = pd.DataFrame({"user_id": range(20), "city": ["Milan", "Rome"] * 10})
+    progress = []
+
+    write_export(result, str(tmp_path / "audience.csv.gz"), "csv.gz", progress.append)
+
+    assert progress == [7, 14, 20]
+    with gzip.open(tmp_path / "audience.csv.gz", "rt") as file:
+        pd.testing.assert_frame_equal(pd.read_csv(file), result)
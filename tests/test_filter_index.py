@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+
+from app import config
+from app.utils.helpers import FilterIndex, filter_by_feature, filter_by_intervals
+
+
+def make_demographics(n_users=400, seed=0):
+    rng = np.random.default_rng(seed)
+    cities = sorted(set().union(*config.region_mapping.values()))
+    df = pd.DataFrame({
+        'user_id': np.arange(1, n_users + 1),
+        'age': rng.integers(18, 70, size=n_users),
+        'gender': rng.choice(['Male', 'Female', 'Other'], size=n_users),
+        'occupation': rng.choice(list(config.occupation_mapping), size=n_users),
+        'income': rng.integers(10000, 150000, size=n_users),
+        'city': rng.choice(cities, size=n_users),
+    })
+    df['region'] = df['city'].map({city: region for region, group in config.region_mapping.items() for city in group})
+    df['occupation_category'] = df['occupation'].map(config.occupation_mapping)
+    df['age_group_name'] = pd.cut(df['age'], bins=config.age_bins, labels=config.age_descriptive_labels)
+    df['income_quintile_name'] = pd.qcut(df['income'], q=config.number_of_income_quintile,
+                                         labels=config.income_quintile_labels)
+    return df
+
+
+def test_selection_matches_dataframe_filters():
+    df = make_demographics()
+    index = FilterIndex(df)
+
+    selection = (index.selection()
+                 .by_intervals([25, 50], config.age_column)
+                 .by_feature(['Male', 'Other'], config.gender_column)
+                 .by_feature('Northern Italy', config.region_column)
+                 .by_feature(['2nd Quintile', '3rd Quintile', '4th Quintile'], config.income_quintile_name_column))
+
+    expected = filter_by_intervals(df, [25, 50], config.age_column)
+    expected = filter_by_feature(expected, ['Male', 'Other'], config.gender_column)
+    expected = filter_by_feature(expected, 'Northern Italy', config.region_column)
+    expected = filter_by_feature(expected, ['2nd Quintile', '3rd Quintile', '4th Quintile'],
+                                 config.income_quintile_name_column)
+
+    assert np.array_equal(np.flatnonzero(selection.mask()), expected.index.to_numpy())
+    assert selection.count() == len(expected)
+
+
+def test_selection_without_filters_selects_everything():
+    index = FilterIndex(make_demographics(n_users=50))
+    selection = index.selection().by_feature(None, config.city_column).by_intervals(None, config.income_column)
+
+    assert selection.mask() is None
+    assert selection.count() == 50
+
+
+def test_unknown_value_selects_nothing():
+    index = FilterIndex(make_demographics(n_users=50))
+    selection = index.selection().by_feature(['Roma'], config.city_column)
+
+    assert not selection.mask().any()
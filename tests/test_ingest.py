@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+
+from app import config
+from app.services import ingest_service
+from app.utils import snapshot
+from app.utils.data_loader import add_derived_columns
+from app.utils.data_manager import DataManager
+from app.utils.dataset import Dataset
+from app.utils.preprocessing import helpers
+from tests.test_preprocessing import make_raw_data
+
+
+def preprocess(demographic_df, interaction_df):
+    return add_derived_columns(helpers.process_user_data_streaming(demographic_df, [interaction_df]))
+
+
+def as_comparable(df):
+    # Dtypes and category orders depend on the values seen, compare the values only
+    return df.astype(object).drop(columns=config.income_quintile_name_column)
+
+
+def assert_matches(dataset, expected):
+    # `expected` is a preprocessed table, whose response counts the dataset keeps apart
+    expected = Dataset(expected)
+    pd.testing.assert_frame_equal(as_comparable(dataset.data), as_comparable(expected.data))
+    np.testing.assert_array_equal(dataset.responses, expected.responses)
+
+
+def assert_indexes_match(dataset):
+    rebuilt = Dataset(dataset.data.copy())
+    for key, positions in rebuilt.tier_index._positions.items():
+        np.testing.assert_array_equal(dataset.tier_index._positions[key], positions)
+    np.testing.assert_array_equal(dataset.tier_index.no_interaction, rebuilt.tier_index.no_interaction)
+
+    for column, bitmaps in rebuilt.filter_index._bitmaps.items():
+        for value, bitmap in bitmaps.items():
+            np.testing.assert_array_equal(dataset.filter_index._bitmaps[column][value], bitmap)
+    for column, (values, order) in rebuilt.filter_index._sorted.items():
+        np.testing.assert_array_equal(dataset.filter_index._sorted[column][0], values)
+        np.testing.assert_array_equal(dataset.filter_index._sorted[column][1], order)
+
+    np.testing.assert_array_equal(dataset.interest_vectors.unit, rebuilt.interest_vectors.unit)
+
+
+def test_ingest_matches_full_reprocessing():
+    demographic_df, interaction_df = make_raw_data(n_users=400, n_interactions=4000)
+    # Interactions of users unknown at preprocessing time are lost, like with a full reprocessing then
+    initial = interaction_df[:2500]
+    initial = initial[initial['user_id'] <= 300]
+    dataset = Dataset(preprocess(demographic_df[:300], initial), version=1)
+
+    new_users = demographic_df[300:]
+    # Known users are skipped, interactions of unknown users and responses are ignored
+    new_users = pd.concat([new_users, demographic_df[:2]])
+    new_interactions = pd.concat([interaction_df[2500:], pd.DataFrame({
+        'user_id': [999, 1], 'survey_type': ['Sports', 'Sports'], 'response': ['Yes', 'Maybe']})])
+    previous, original, original_responses = dataset, dataset.data.copy(), dataset.responses.copy()
+    dataset, summary = ingest_service.apply_batch(previous, new_interactions, new_users)
+
+    assert summary['users_added'] == 100
+    assert summary['users_skipped'] == 2
+    assert summary['interactions_applied'] == 1500
+    assert summary['interactions_skipped'] == 2
+    assert dataset.version > 1 and summary['version'] == dataset.version
+    # Requests still holding the previous dataset keep reading it unchanged
+    pd.testing.assert_frame_equal(previous.data, original)
+    np.testing.assert_array_equal(previous.responses, original_responses)
+    assert previous.version == 1
+    assert_indexes_match(previous)
+
+    assert_matches(dataset, preprocess(demographic_df, pd.concat([initial, interaction_df[2500:]])))
+    assert dataset.data[config.income_quintile_name_column].notna().all()
+    assert_indexes_match(dataset)
+
+
+def test_ingest_into_memory_mapped_snapshot(tmp_path):
+    demographic_df, interaction_df = make_raw_data(n_users=200, n_interactions=2000)
+    base = Dataset(preprocess(demographic_df, interaction_df[:1000]))
+    directory = snapshot.write_snapshot(base.data, str(tmp_path / "snapshot"), index_state=base.index_state(),
+                                        responses=base.responses)
+    dataset = snapshot.read_snapshot_dataset(directory)
+
+    # Enough interactions of one user to overflow the narrow count columns
+    burst = pd.DataFrame({'user_id': 7, 'survey_type': 'Travel', 'response': 'Yes'}, index=range(300))
+    dataset, _ = ingest_service.apply_batch(dataset, pd.concat([interaction_df[1000:], burst]))
+
+    assert_matches(dataset, preprocess(demographic_df, pd.concat([interaction_df, burst])))
+    assert len({dataset.data[column].dtype for column in config.interation_columns}) == 1
+    assert_indexes_match(dataset)
+
+
+def test_ingest_swaps_in_the_updated_dataset(monkeypatch):
+    demographic_df, interaction_df = make_raw_data(n_users=200, n_interactions=2000)
+    served = Dataset(preprocess(demographic_df, interaction_df[:1000]), version=1)
+    monkeypatch.setattr(DataManager, '_dataset', served)
+
+    summary = ingest_service.ingest(interaction_df[1000:])
+
+    current = DataManager.get_dataset()
+    assert current is not served and current.version == summary['version'] > served.version
+    assert current.data['Total'].sum() == served.data['Total'].sum() + summary['interactions_applied']
+    # An empty batch leaves the served dataset as it is
+    assert ingest_service.ingest()['version'] == current.version and DataManager.get_dataset() is current
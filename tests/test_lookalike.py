@@ -0,0 +1,114 @@
+import copy
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app import config
+from app.api.schemas import LookalikeRequest, UserData
+from app.services.lookalike_service import find_lookalikes
+from app.utils.dataset import Dataset
+from app.utils.lookalike_index import LookalikeIndex
+from tests.test_user_service import make_full_dataset
+
+
+def exact_search(index, query, num_users, member_mask=None, exclude=()):
+    similarities = index.vectors.astype(np.float64) @ (query / np.linalg.norm(query))
+    allowed = np.ones(len(similarities), dtype=bool) if member_mask is None else member_mask.copy()
+    allowed[list(exclude)] = False
+    positions = np.flatnonzero(allowed)
+    order = np.lexsort((positions, -np.round(similarities[positions], 6)))
+    return positions[order[:num_users]], similarities
+
+
+def test_small_population_is_searched_exhaustively():
+    index = LookalikeIndex(make_full_dataset(500))
+    assert index.n_lists == 0
+    query = index.vectors[:3].mean(axis=0)
+
+    positions, similarities = index.search(query, 20, exclude=np.array([0, 1, 2]))
+    expected, exact = exact_search(index, query, 20, exclude=[0, 1, 2])
+    np.testing.assert_array_equal(positions, expected)
+    np.testing.assert_allclose(similarities, exact[positions], atol=1e-6)
+
+
+def test_partitioned_search_recall(monkeypatch):
+    monkeypatch.setattr(config, "lookalike_min_population", 1000)
+    data = make_full_dataset(6000)
+    index = LookalikeIndex(data)
+    assert index.n_lists == int(np.sqrt(6000))
+
+    rng = np.random.default_rng(0)
+    member_mask = data['gender'].to_numpy() == 'Female'
+    recalls = []
+    for _ in range(20):
+        query = index.vectors[rng.choice(len(data), 5)].mean(axis=0)
+        positions, _ = index.search(query, 50, member_mask, n_probe=8)
+        expected, similarities = exact_search(index, query, 50, member_mask)
+        assert member_mask[positions].all()
+        # Users tied with the last expected one are as good as it
+        recalls.append(np.mean(np.round(similarities[positions], 6) >= np.round(similarities[expected[-1]], 6)))
+
+        all_lists, _ = index.search(query, 50, member_mask, n_probe=index.n_lists)
+        np.testing.assert_array_equal(all_lists, expected)
+    assert np.mean(recalls) >= 0.9
+
+
+def test_index_update_matches_rebuild():
+    data = make_full_dataset(500)
+    index = Dataset(data).lookalike_index
+    data.loc[[3, 10], config.interests_columns] = [[9, 0, 0, 0, 0, 0], [0, 0, 0, 0, 0, -2]]
+    index.update(data, np.array([3, 10]))
+
+    np.testing.assert_array_equal(index.vectors, LookalikeIndex(data).vectors)
+
+
+def test_index_is_built_on_first_use(monkeypatch):
+    built = []
+    build = LookalikeIndex.__init__
+    monkeypatch.setattr(LookalikeIndex, '__init__', lambda index, data: built.append(len(data)) or build(index, data))
+    dataset = Dataset(make_full_dataset(300))
+    updated = dataset.updated(dataset.data, np.array([0]), None)
+    assert built == [] and dataset.nbytes() > 0
+
+    index = dataset.lookalike_index
+    assert dataset.lookalike_index is index and built == [300]
+    assert "lookalike_index" in dataset.index_state()
+    assert "lookalike_index" not in updated.built_indexes()
+
+
+def test_partitioned_index_update_matches_rebuilt_lists(monkeypatch):
+    monkeypatch.setattr(config, "lookalike_min_population", 1000)
+    data = make_full_dataset(2000)
+    index = LookalikeIndex(data)
+    assert index.n_lists > 1
+    grown = make_full_dataset(2100).assign(user_id=lambda df: df['user_id'] + 10_000)[2000:]
+    data = pd.concat([data, grown], ignore_index=True)
+    data.loc[[3, 10, 500], config.interests_columns] = [[9, 0, 0, 0, 0, 0], [0, 0, 0, 0, 0, -2], [0, 5, 5, 0, 0, 0]]
+    members, codes = index.members.copy(), index.codes.copy()
+
+    updated = copy.copy(index)
+    updated.update(data, np.concatenate([[500, 10, 3], np.arange(2000, 2100)]))
+
+    rebuilt = copy.copy(updated)
+    rebuilt._build_lists()
+    for name in ['members', 'offsets', 'codes']:
+        np.testing.assert_array_equal(getattr(updated, name), getattr(rebuilt, name))
+    # The index the copy was made from is unchanged
+    np.testing.assert_array_equal(index.members, members)
+    np.testing.assert_array_equal(index.codes, codes)
+
+
+def test_find_lookalikes():
+    dataset = Dataset(make_full_dataset(500))
+    seeds = dataset.data['user_id'].iloc[[4, 8]].tolist()
+    request = LookalikeRequest(seed_user_ids=seeds + [10_000], n_users=15, user_data=UserData(region='Northern Italy'))
+
+    result = find_lookalikes(request, dataset)
+    assert len(result) == 15
+    assert not result['user_id'].isin(seeds).any()
+    assert (result['region'] == 'Northern Italy').all()
+    assert result['similarity'].is_monotonic_decreasing
+
+    with pytest.raises(ValueError):
+        find_lookalikes(LookalikeRequest(seed_user_ids=[10_000]), dataset)
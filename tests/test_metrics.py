@@ -0,0 +1,72 @@
+import time
+
+import pytest
+
+from app.api.formats import timed_chunks
+from app.services import user_service
+from app.utils.dataset import Dataset
+from app.utils.metrics import observe_stages, render_metrics, server_timing, stage, timed_request, with_stage_timings
+from tests.test_user_service import make_full_dataset, make_request
+
+
+def test_stage_timings_are_exposed_as_histograms():
+    bucket = 'user_profiling_stage_seconds_bucket{le="0.1",stage="test_stage"}'
+    before = metric_value(bucket)
+    for seconds in [0.05, 0.5]:
+        observe_stages({"test_stage": seconds})
+
+    assert metric_value(bucket) == before + 1
+    assert 'user_profiling_stage_seconds_count{stage="test_stage"}' in render_metrics().decode()
+
+
+def metric_value(sample: str) -> float:
+    for line in render_metrics().decode().splitlines():
+        if line.startswith(sample + " "):
+            return float(line.split()[-1])
+    return 0.0
+
+
+def test_pipeline_stages_are_timed():
+    dataset = Dataset(make_full_dataset())
+    request = make_request(interest={'interests': ['Travel'], 'weights': [1.0]}, gender='Male', age=[20, 40],
+                           random_user_percent=20)
+
+    result, timings = with_stage_timings(user_service.process_user_data, request, dataset)
+
+    assert len(result) == 20
+    assert {'age', 'location', 'gender', 'income', 'occupation', 'interest_ranking', 'random_fill',
+            'materialize'} <= set(timings)
+    assert all(seconds >= 0 for seconds in timings.values())
+    assert server_timing({'age': 0.0015}) == "age;dur=1.500"
+
+
+def test_stages_are_not_collected_by_default():
+    with stage("age"):
+        pass
+    _, timings = with_stage_timings(lambda: None)
+    assert timings == {}
+
+
+def test_streamed_serialization_times_the_encoding_only():
+    def slow_chunks():
+        for chunk in ["a", "b"]:
+            time.sleep(0.02)
+            yield chunk
+
+    reported = []
+    stream = timed_chunks(slow_chunks(), reported.append)
+    assert next(stream) == "a" and reported == []
+    # Time spent sending a chunk is not counted
+    time.sleep(0.1)
+    assert list(stream) == ["b"]
+    assert len(reported) == 1 and 0.04 <= reported[0] < 0.1
+
+
+def test_failed_requests_are_timed():
+    count = 'user_profiling_request_seconds_count{endpoint="test_endpoint"}'
+    before = metric_value(count)
+    with pytest.raises(TimeoutError):
+        with timed_request("test_endpoint"):
+            raise TimeoutError()
+
+    assert metric_value(count) == before + 1
@@ -0,0 +1,80 @@
+from unittest.mock import patch
+
+import pandas as pd
+import pytest
+
+from app.services import page_service, user_service
+from app.services.page_service import CursorExpired, first_page, next_page
+from app.utils.cache import ResultCache
+from app.utils.dataset import Dataset
+from tests.test_user_service import make_full_dataset, make_request
+
+
+@pytest.fixture(autouse=True)
+def ranking_cache():
+    with patch.object(page_service, 'ranking_cache', ResultCache(10, 60, max_bytes=1 << 20)) as cache:
+        yield cache
+
+
+def all_pages(result, user_data, dataset, page_size):
+    page, cursor, total = first_page(result, user_data, dataset, page_size)
+    pages = [page]
+    while cursor is not None:
+        page, cursor, page_total = next_page(cursor, dataset)
+        assert page_total == total and len(page) <= page_size
+        pages.append(page)
+    return pages
+
+
+@pytest.mark.parametrize("fields", [
+    {'n_users': 230},
+    {'n_users': 230, 'interest': {'interests': ['Travel'], 'weights': [1.0]}, 'random_user_percent': 40},
+])
+def test_pages_are_slices_of_the_first_ranking(fields):
+    dataset = Dataset(make_full_dataset(2000))
+    user_data = make_request(**fields)
+    # Unseeded random users are drawn once, every page comes from the same draw
+    result = user_service.process_user_data(user_data, dataset)
+
+    pages = all_pages(result, user_data, dataset, 100)
+
+    assert [len(page) for page in pages] == [100, 100, 30]
+    pd.testing.assert_frame_equal(pd.concat(pages), result)
+
+
+def test_page_size_can_change_between_pages():
+    dataset = Dataset(make_full_dataset(500))
+    result = user_service.process_user_data(make_request(n_users=50), dataset)
+    _, cursor, _ = first_page(result, make_request(n_users=50), dataset, 10)
+
+    page, cursor, total = next_page(cursor, dataset, page_size=25)
+    pd.testing.assert_frame_equal(page, result[10:35])
+    assert total == 50 and cursor is not None
+
+
+def test_cursors_expire_with_the_dataset(ranking_cache):
+    dataset = Dataset(make_full_dataset(500), version=1)
+    result = user_service.process_user_data(make_request(n_users=50), dataset)
+    _, cursor, _ = first_page(result, make_request(n_users=50), dataset, 10)
+
+    dataset.version = 2
+    with pytest.raises(CursorExpired):
+        next_page(cursor, dataset)
+    with pytest.raises(ValueError):
+        next_page("not a cursor", dataset)
+
+
+def test_rankings_are_evicted_beyond_the_memory_budget(ranking_cache):
+    dataset = Dataset(make_full_dataset(500))
+    request = make_request(n_users=50)
+    result = user_service.process_user_data(request, dataset)
+    ranking_cache.max_bytes = page_service.RankedAudience.of(result, request, dataset, 10).nbytes * 2
+
+    cursors = [first_page(result, request, dataset, 10)[1] for _ in range(3)]
+
+    with pytest.raises(CursorExpired):
+        next_page(cursors[0], dataset)
+    assert len(next_page(cursors[2], dataset)[0]) == 10
+    ranking_cache.max_bytes = 10
+    with pytest.raises(ValueError):
+        first_page(result, request, dataset, 10)
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app import config
+from app.utils.preprocessing import helpers
+
+
+def make_raw_data(n_users=300, n_interactions=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    demographic_df = pd.DataFrame({
+        'user_id': np.arange(1, n_users + 1),
+        'age': rng.integers(18, 70, size=n_users),
+        'gender': rng.choice(['Male', 'Female'], size=n_users),
+        'occupation': rng.choice(list(config.occupation_mapping), size=n_users),
+        'income': rng.integers(10000, 150000, size=n_users),
+        'interests': rng.choice(config.interests_columns, size=n_users),
+        'city': rng.choice(['Milan', 'Rome', 'Naples'], size=n_users),
+    })
+    interaction_df = pd.DataFrame({
+        'user_id': rng.integers(1, n_users + 1, size=n_interactions),
+        'survey_type': rng.choice(config.interests_columns, size=n_interactions),
+        'response': rng.choice(helpers.interaction_responses, size=n_interactions),
+    })
+    return demographic_df, interaction_df
+
+
+def chunks(df, size):
+    return (df.iloc[start:start + size] for start in range(0, len(df), size))
+
+
+@pytest.mark.parametrize("n_interactions", [200, 5000])
+@pytest.mark.parametrize("chunk_size", [1, 97, 10_000])
+def test_streaming_matches_batch(n_interactions, chunk_size):
+    # With few interactions some users have none, which makes the batch pipeline produce float scores
+    demographic_df, interaction_df = make_raw_data(n_interactions=n_interactions)
+    expected = helpers.process_user_data(demographic_df, interaction_df)
+    result = helpers.process_user_data_streaming(demographic_df, chunks(interaction_df, chunk_size))
+
+    pd.testing.assert_frame_equal(result, expected, check_exact=True)
+
+
+def test_streaming_ignores_unknown_users():
+    demographic_df, interaction_df = make_raw_data(n_users=50, n_interactions=2000)
+    extra = pd.DataFrame({'user_id': [999, 1000], 'survey_type': ['Sports', 'Travel'], 'response': ['Yes', 'No']})
+    result = helpers.process_user_data_streaming(demographic_df, [interaction_df, extra])
+
+    pd.testing.assert_frame_equal(result, helpers.process_user_data(demographic_df, interaction_df), check_exact=True)
+
+
+def test_compact_dtypes_keeps_values():
+    demographic_df, interaction_df = make_raw_data(n_interactions=200)
+    processed = helpers.process_user_data(demographic_df, interaction_df)
+    processed.loc[0, 'Travel'] = 300
+    compact = helpers.compact_dtypes(processed.copy())
+
+    assert compact['city'].dtype == 'category'
+    assert compact['age'].dtype == np.int8
+    # The interest scores share one type wide enough for all of them
+    assert set(compact[config.interests_columns].dtypes) == {np.dtype(np.int16)}
+    assert set(compact[config.interation_columns].dtypes) == {np.dtype(np.int8)}
+    pd.testing.assert_frame_equal(compact, processed, check_dtype=False, check_categorical=False)
@@ -0,0 +1,116 @@
+import gc
+import threading
+import weakref
+from unittest.mock import patch
+
+import pytest
+
+from app import config
+from app.services import ingest_service, reload_service, user_service
+from app.services.reload_service import DatasetReloader
+from app.utils.data_manager import DataManager
+from app.utils.dataset import Dataset
+from benchmarks.synthetic import write_dataset
+from tests.test_user_service import make_full_dataset, make_request
+
+
+@pytest.fixture
+def served(monkeypatch):
+    monkeypatch.setattr(DataManager, '_dataset', None)
+    return DataManager.swap(Dataset(make_full_dataset(300)))
+
+
+def reload_now(reloader: DatasetReloader):
+    assert reloader.start()
+    reloader.join()
+
+
+def test_reload_swaps_the_dataset_and_frees_the_old_one(monkeypatch):
+    monkeypatch.setattr(DataManager, '_dataset', None)
+    served = DataManager.swap(Dataset(make_full_dataset(300)))
+    monkeypatch.setattr(config, 'use_snapshot', False)
+    monkeypatch.setattr(reload_service, 'load_and_preprocess', lambda: make_full_dataset(500))
+    request = make_request()
+    old_version = served.version
+    old = weakref.ref(served)
+
+    reloader = DatasetReloader()
+    reload_now(reloader)
+
+    current = DataManager.get_dataset()
+    assert reloader.status()["state"] == "idle"
+    assert len(current) == 500 and current.version > old_version
+    # A request still holding the previous dataset finishes on it
+    assert len(user_service.process_user_data(request, served)) == 20
+
+    del served
+    gc.collect()
+    assert old() is None
+
+
+def test_failed_reload_keeps_the_dataset(served, monkeypatch):
+    monkeypatch.setattr(config, 'use_snapshot', False)
+
+    def failing_preprocess():
+        raise OSError("demographic_data.csv is missing")
+
+    monkeypatch.setattr(reload_service, 'load_and_preprocess', failing_preprocess)
+    reloader = DatasetReloader()
+    reload_now(reloader)
+
+    assert DataManager.get_dataset() is served
+    assert reloader.status()["state"] == "failed"
+    assert "missing" in reloader.status()["error"]
+
+
+def test_reload_builds_the_snapshot_out_of_process(served, tmp_path, monkeypatch):
+    paths = write_dataset(str(tmp_path / "data"), 400, seed=1)
+    monkeypatch.setattr(config, 'DEMOGRAPHIC_DATA_PATH', paths[0])
+    monkeypatch.setattr(config, 'INTERACTION_DATA_PATH', paths[1])
+    monkeypatch.setattr(config, 'SNAPSHOT_DIR', str(tmp_path / "snapshots"))
+    monkeypatch.setattr(config, 'use_snapshot', True)
+
+    with patch.object(reload_service.compute_executor, 'recycle') as recycle:
+        reload_now(DatasetReloader())
+
+    current = DataManager.get_dataset()
+    assert current is not served and len(current) == 400
+    assert current.snapshot_directory.startswith(str(tmp_path / "snapshots"))
+    recycle.assert_not_called()
+
+
+def test_only_one_reload_runs_at_a_time(served, monkeypatch):
+    monkeypatch.setattr(config, 'use_snapshot', False)
+    release = threading.Event()
+    monkeypatch.setattr(reload_service, 'load_and_preprocess', lambda: release.wait() and make_full_dataset(100))
+    reloader = DatasetReloader()
+
+    assert reloader.start()
+    assert not reloader.start()
+    assert reloader.status()["state"] == "running"
+    release.set()
+    reloader.join()
+    assert len(DataManager.get_dataset()) == 100
+
+
+def test_ingestion_is_rejected_while_reloading(served, monkeypatch):
+    monkeypatch.setattr(config, 'use_snapshot', False)
+    loading, release = threading.Event(), threading.Event()
+
+    def slow_preprocess():
+        loading.set()
+        release.wait()
+        return make_full_dataset(100)
+
+    monkeypatch.setattr(reload_service, 'load_and_preprocess', slow_preprocess)
+    reloader = DatasetReloader()
+    assert reloader.start()
+    loading.wait()
+
+    # The ingested rows would be applied to the dataset the reload is about to replace
+    with pytest.raises(ingest_service.IngestionSuspended):
+        ingest_service.ingest()
+    release.set()
+    reloader.join()
+    assert len(DataManager.get_dataset()) == 100
+    assert ingest_service.ingest()['version'] == DataManager.get_dataset().version
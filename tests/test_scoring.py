@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app import config
+from app.services import audience_service, user_service
+from app.utils.dataset import Dataset
+from app.utils.scoring import default_weights, rescore
+from tests.test_ingest import preprocess
+from tests.test_preprocessing import make_raw_data
+from tests.test_user_service import make_full_dataset, make_request
+
+CUSTOM = {'initial_interest': 2, 'yes': 4, 'no': -1, 'neutral': 0.5}
+
+
+@pytest.fixture(scope="module")
+def raw_data():
+    return make_raw_data(n_users=600, n_interactions=6000, seed=3)
+
+
+def reprocessed_with(raw_data, monkeypatch, weights):
+    for name, value in zip(['inital_interest_weight', 'yes_interaction_weight', 'no_interaction_weight',
+                            'neutral_interaction_weight'], weights):
+        monkeypatch.setattr(config, name, value)
+    dataset = Dataset(preprocess(*raw_data))
+    monkeypatch.undo()
+    return dataset
+
+
+def test_rescore_with_the_configured_weights_gives_the_stored_scores(raw_data):
+    dataset = Dataset(preprocess(*raw_data))
+    positions = np.arange(0, len(dataset), 7)
+    np.testing.assert_array_equal(rescore(dataset, positions, default_weights()),
+                                  dataset.data[config.interests_columns].to_numpy()[positions])
+
+
+@pytest.mark.parametrize("request_fields", [
+    {'interest': {'interests': ['Travel'], 'weights': [1.0]}, 'confidence_level': 'High', 'random_user_percent': 30,
+     'seed': 5},
+    {'interest': {'interests': ['Finance'], 'weights': [1.0]}, 'confidence_level': 'Good', 'gender': 'Female'},
+    {'interest': {'interests': ['Sports', 'Travel', 'Finance'], 'weights': [0.5, 0.3, 0.2]}, 'city': ['Rome']},
+])
+def test_custom_weights_match_a_reprocessed_dataset(raw_data, monkeypatch, request_fields):
+    dataset = Dataset(preprocess(*raw_data))
+    reprocessed = reprocessed_with(raw_data, monkeypatch, [CUSTOM[key] for key in ['initial_interest', 'yes', 'no', 'neutral']])
+
+    result = user_service.process_user_data(make_request(scoring_weights=CUSTOM, **request_fields), dataset)
+    expected = user_service.process_user_data(make_request(**request_fields), reprocessed)
+
+    assert len(result) == 20
+    if 'gender' in request_fields:
+        # Filtered random users are drawn from the members of the rescored tiers, not from the whole tiers
+        assert (result['gender'] == request_fields['gender']).all()
+        result, expected = result[:16], expected[:16]
+    pd.testing.assert_frame_equal(result.reset_index(drop=True), expected.reset_index(drop=True), check_dtype=False)
+
+
+def test_custom_weights_change_the_audience_size(raw_data, monkeypatch):
+    dataset = Dataset(preprocess(*raw_data))
+    reprocessed = reprocessed_with(raw_data, monkeypatch, [0, config.yes_interaction_weight, 1, 1])
+    request = make_request(interest={'interests': ['Politics'], 'weights': [1.0]}, confidence_level='Very High',
+                           gender='Male')
+    custom = make_request(interest={'interests': ['Politics'], 'weights': [1.0]}, confidence_level='Very High',
+                          gender='Male', scoring_weights={'initial_interest': 0, 'no': 1, 'neutral': 1})
+
+    assert audience_service.cube_audience_size(custom, dataset) is None
+    assert audience_service.scan_audience_size(custom, dataset) == audience_service.scan_audience_size(request, reprocessed)
+    assert audience_service.scan_audience_size(custom, dataset) != audience_service.scan_audience_size(request, dataset)
+
+
+def test_configured_weights_take_the_precomputed_path():
+    assert user_service.request_weights(make_request(scoring_weights={'yes': config.yes_interaction_weight})) is None
+    # Datasets preprocessed without the response counts cannot be rescored
+    request = make_request(scoring_weights={'yes': 1})
+    assert user_service.process_user_data(request, Dataset(make_full_dataset(100))) is None
@@ -0,0 +1,102 @@
+import os
+import threading
+import time
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services import sharding, user_service
+from app.utils import snapshot
+from tests.test_user_service import make_full_dataset, make_request
+
+
+@pytest.fixture(scope="module")
+def sharded(tmp_path_factory):
+    data = make_full_dataset(3000)
+    # Ids out of table order, so every shard holds rows spread over the whole table
+    data['user_id'] = np.random.default_rng(0).permutation(len(data)) + 1
+    directory = snapshot.write_snapshot(data, str(tmp_path_factory.mktemp("sharding") / "snapshot"))
+    dataset = snapshot.read_snapshot_dataset(directory)
+
+    pool = sharding.ShardPool(3)
+    with patch.object(sharding, 'shard_pool', pool):
+        yield dataset
+    pool.shutdown()
+
+
+def test_shard_boundaries_balance_the_shards():
+    user_ids = np.random.default_rng(1).permutation(1000)
+    counts = np.bincount(sharding.shard_of(user_ids, sharding.shard_boundaries(user_ids, 4)))
+
+    assert counts.tolist() == [250, 250, 250, 250]
+
+
+@pytest.mark.parametrize("fields", [
+    {},
+    {'gender': 'Male', 'n_users': 200},
+    {'region': ['Northern Italy'], 'age': [30, 60], 'n_users': 50},
+    {'interest': {'interests': ['Fashion', 'Technology'], 'weights': [0.6, 0.4]}, 'n_users': 3000},
+])
+def test_sharded_similarity_ranking_matches_single_process(sharded, fields):
+    request = make_request(**fields)
+
+    pd.testing.assert_frame_equal(sharding.process_user_data_sharded(request, sharded),
+                                  user_service.process_user_data(request, sharded))
+
+
+def test_single_interest_requests_are_served_in_process(sharded):
+    request = make_request(interest={'interests': ['Travel'], 'weights': [1.0]}, confidence_level='High',
+                           gender='Female', n_users=100, random_user_percent=30, seed=5)
+
+    with patch.object(sharding.shard_pool, 'map') as shard_map:
+        result = sharding.process_user_data_sharded(request, sharded)
+    shard_map.assert_not_called()
+    # Random users included, so a seeded request gives the same audience whatever the number of shards
+    pd.testing.assert_frame_equal(result, user_service.process_user_data(request, sharded))
+    assert not sharding.is_sharded(request)
+    assert not sharding.is_sharded(make_request(scoring_weights={'yes': 2.0}))
+    assert sharding.is_sharded(make_request())
+
+
+def test_modified_datasets_are_not_sharded(sharded):
+    with patch.object(sharding.config, 'use_snapshot', True):
+        assert sharding.shard_pool.serves(sharded)
+        sharded.snapshot_directory, directory = None, sharded.snapshot_directory
+        try:
+            assert not sharding.shard_pool.serves(sharded)
+        finally:
+            sharded.snapshot_directory = directory
+
+
+def test_requests_on_a_replaced_snapshot_finish_or_fall_back(tmp_path):
+    data = make_full_dataset(1000)
+    path = str(tmp_path / "snapshot")
+    snapshot.write_snapshot(data, path)
+    old = snapshot.read_snapshot_dataset(path)
+    request = make_request()
+    pool = sharding.ShardPool(2)
+    with patch.object(sharding, 'shard_pool', pool):
+        try:
+            expected = user_service.process_user_data(request, old)
+            pd.testing.assert_frame_equal(sharding.process_user_data_sharded(request, old), expected)
+            # A request still running on the shards of the old snapshot when it is replaced
+            running = []
+            thread = threading.Thread(target=lambda: running.append(pool.map(old, time.sleep, [(1,)] * 2)))
+            thread.start()
+            time.sleep(0.3)
+
+            snapshot.write_snapshot(data, path)
+            new = snapshot.read_snapshot_dataset(path)
+            assert not os.path.exists(old.snapshot_directory)
+            pd.testing.assert_frame_equal(sharding.process_user_data_sharded(request, new), expected)
+            thread.join()
+
+            assert running == [[None, None]]
+            # Later requests on the old snapshot do not restart its shards, they are served in process
+            assert pool.map(old, time.sleep, [(0,)] * 2) is None
+            pd.testing.assert_frame_equal(sharding.process_user_data_sharded(request, old), expected)
+            assert pool.directory == new.snapshot_directory
+        finally:
+            pool.shutdown()
@@ -1,3 +1,78 @@
-
 ### We can implement lots of logical and functional test in this file for similarity function
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app import config
+from app.services.similarity_service import rank_users_by_cosine_similarity, sort_users_by_cosine_similarity
+from app.utils.interest_vectors import cosine_similarity
+from tests.test_tier_index import make_dataset
+
+
+def make_profile():
+    return pd.Series([0.5, 0.0, 0.0, 0.3, 0.2, 0.0], index=config.interests_columns)
+
+
+def test_ranking_matches_full_sort():
+    dataset = make_dataset(n_users=2000)
+    member_mask = dataset.data['user_id'].to_numpy() % 4 != 0
+    profile = make_profile()
+
+    positions, similarities = rank_users_by_cosine_similarity(dataset, member_mask, profile, num_users=100)
+    expected = sort_users_by_cosine_similarity(dataset.data[member_mask], profile).head(100)
+
+    assert member_mask[positions].all()
+    np.testing.assert_allclose(similarities, expected['similarity'].to_numpy(), rtol=0, atol=1e-12)
+
+
+def test_ties_are_broken_by_profile_weights():
+    dataset = make_dataset(n_users=2000)
+    profile = make_profile()
+    positions, similarities = rank_users_by_cosine_similarity(dataset, None, profile, num_users=300)
+
+    ranked = dataset.data.iloc[positions]
+    keys = [np.round(similarities, 12)] + [ranked[interest].to_numpy() for interest in ['Sports', 'Fashion', 'Technology']]
+    for previous, current in zip(zip(*keys), list(zip(*keys))[1:]):
+        assert previous >= current
+
+
+def test_ranking_does_not_modify_the_dataset():
+    dataset = make_dataset()
+    columns = list(dataset.data.columns)
+    rank_users_by_cosine_similarity(dataset, None, make_profile(), num_users=10)
+    sort_users_by_cosine_similarity(dataset.data, make_profile())
+
+    assert list(dataset.data.columns) == columns
+
+
+def test_partial_profile_is_aligned_by_name():
+    dataset = make_dataset()
+    profile = pd.Series([0.4, 0.6], index=['Travel', 'Finance'])
+    positions, similarities = rank_users_by_cosine_similarity(dataset, None, profile, num_users=5)
+
+    vectors = dataset.data[config.interests_columns].to_numpy()[positions]
+    target = profile.reindex(config.interests_columns, fill_value=0).to_numpy()
+    expected = vectors @ target / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(target))
+    np.testing.assert_allclose(similarities, expected)
+
+
+def test_cosine_kernel_matches_scikit_learn():
+    pairwise = pytest.importorskip("sklearn.metrics.pairwise")
+    values = np.random.default_rng(0).integers(-5, 10, size=(200, 6)).astype(float)
+    values[:3] = 0
+    profiles = np.array([[0.5, 0.2, 0, 0, 0.3, 0], [0, 0, 0, 0, 0, 0]])
+
+    np.testing.assert_array_equal(cosine_similarity(values, profiles), pairwise.cosine_similarity(values, profiles))
+
+
+def test_app_starts_without_scikit_learn():
+    # pyarrow is not checked, pandas imports it on its own whenever it is installed
+    code = "import sys, app.main; print('sklearn' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+    assert result.stdout.split() == ["False"]
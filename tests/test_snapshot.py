@@ -0,0 +1,109 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from app import config
+from app.utils import snapshot
+from app.utils.dataset import Dataset
+from tests.test_tier_index import make_dataset
+
+
+def make_table():
+    return pd.DataFrame({
+        'user_id': np.arange(1, 6),
+        'city': ['Milan', 'Rome', 'Milan', 'Bari', 'Rome'],
+        'Sports': [1.0, -3.0, 0.0, 5.0, 8.0],
+        'Sports_interaction': [1, 2, 0, 4, 3],
+        'occupation_category': ['A', None, 'B', 'A', 'B'],
+        'age_group_name': pd.Categorical(['Adults', 'Young Adults', 'Adults', 'Adults', 'Older Adults'],
+                                         categories=config.age_descriptive_labels, ordered=True),
+    })
+
+
+def test_snapshot_round_trip(tmp_path):
+    df = make_table()
+    directory = snapshot.write_snapshot(df, str(tmp_path / "snapshot"))
+    restored = snapshot.read_snapshot(directory)
+
+    # Strings come back as categoricals, everything else as it was written
+    expected = df.copy()
+    for column in ['city', 'occupation_category']:
+        expected[column] = expected[column].astype('category')
+    pd.testing.assert_frame_equal(restored, expected)
+
+
+def test_snapshot_columns_are_memory_mapped(tmp_path):
+    directory = snapshot.write_snapshot(make_table(), str(tmp_path / "snapshot"))
+    restored = snapshot.read_snapshot(directory)
+
+    values = restored['Sports'].to_numpy()
+    while values.base is not None and not isinstance(values, np.memmap):
+        values = values.base
+    assert isinstance(values, np.memmap)
+
+
+def test_fingerprint_depends_on_weights(monkeypatch):
+    before = snapshot.source_fingerprint()
+    monkeypatch.setattr(config, 'yes_interaction_weight', config.yes_interaction_weight + 1)
+
+    assert snapshot.source_fingerprint() != before
+
+
+def test_snapshot_is_reused_with_its_indexes(tmp_path, monkeypatch):
+    calls = []
+    table = make_dataset().data
+
+    def fake_preprocess():
+        calls.append(1)
+        return table
+
+    monkeypatch.setattr(config, 'SNAPSHOT_DIR', str(tmp_path))
+    monkeypatch.setattr(snapshot, 'load_and_preprocess', fake_preprocess)
+
+    first = snapshot.load_snapshot_dataset()
+    second = snapshot.load_snapshot_dataset()
+
+    assert len(calls) == 1
+    pd.testing.assert_frame_equal(first.data, table)
+    for interest in config.interests_columns:
+        for level in config.confidence_level_list:
+            expected = Dataset(table).tier_index.get_positions(interest, level)
+            assert np.array_equal(second.tier_index.get_positions(interest, level), expected)
+    assert np.array_equal(second.tier_index.no_interaction, Dataset(table).tier_index.no_interaction)
+
+
+def test_matrix_columns_share_one_mapping(tmp_path):
+    table = make_dataset().data
+    directory = snapshot.write_snapshot(table, str(tmp_path / "snapshot"))
+    restored = snapshot.read_snapshot(directory)
+
+    sports = restored['Sports'].to_numpy()
+    finance = restored['Finance'].to_numpy()
+    assert sports.base is not None and sports.base is finance.base
+
+
+def test_replacing_a_snapshot_never_hides_it_from_readers(tmp_path, monkeypatch):
+    table = make_dataset(50).data
+    path = str(tmp_path / "snapshot")
+    snapshot.write_snapshot(table, path)
+    first_version = os.readlink(path)
+    moves = []
+
+    def checked(move):
+        def wrapper(source, destination):
+            # Every step of the replacement leaves a complete snapshot in place
+            moves.append(os.path.isfile(os.path.join(path, snapshot.META_FILE)))
+            move(source, destination)
+            moves.append(os.path.isfile(os.path.join(path, snapshot.META_FILE)))
+        return wrapper
+
+    monkeypatch.setattr(os, 'rename', checked(os.rename))
+    monkeypatch.setattr(os, 'replace', checked(os.replace))
+    snapshot.write_snapshot(table, path)
+
+    assert moves and all(moves)
+    assert len(snapshot.read_snapshot_dataset(path)) == len(table)
+    # Only the current version is left next to the link
+    assert os.readlink(path) != first_version
+    assert sorted(os.listdir(tmp_path)) == sorted(["snapshot", os.readlink(path)])
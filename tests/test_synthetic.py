@@ -0,0 +1,22 @@
+import pandas as pd
+
+from app import config
+from benchmarks import synthetic
+
+
+def test_synthetic_data_follows_sample_schema(monkeypatch):
+    sample = pd.read_csv(config.DEMOGRAPHIC_DATA_PATH)
+    monkeypatch.setattr(synthetic, "CHUNK_ROWS", 700)
+
+    demographics, interactions = synthetic.generate(2000, seed=1)
+    demographics, interactions = pd.concat(demographics), pd.concat(interactions)
+
+    assert list(demographics.columns) == list(sample.columns)
+    assert demographics['user_id'].tolist() == list(range(1, 2001))
+    assert demographics['age'].between(sample['age'].min(), sample['age'].max()).all()
+    assert set(demographics['city']) <= set(sample['city'])
+    assert len(interactions) == 6000
+    assert interactions['user_id'].between(1, 2000).all()
+
+    again, _ = synthetic.generate(2000, seed=1)
+    pd.testing.assert_frame_equal(pd.concat(again), demographics)
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+from app import config
+from app.services.similarity_service import add_random_positions, select_users_by_interest
+from app.utils.confidence import compute_confidence_mask
+from app.utils.dataset import Dataset
+from app.utils.tier_index import sample_members
+from tests.test_confidence import make_users
+
+
+def make_dataset(n_users=500, seed=0):
+    df = make_users(n_users, seed)
+    df['Total'] = df[config.interation_columns].sum(axis=1)
+    return Dataset(df)
+
+
+@pytest.mark.parametrize("confidence_level", config.confidence_level_list)
+def test_tier_positions_match_filter(confidence_level):
+    dataset = make_dataset()
+    scores = dataset.data[config.interests_columns].to_numpy()
+    for interest in config.interests_columns:
+        # Members of the tier by descending interaction count, ties in table order
+        expected = dataset.data[compute_confidence_mask(scores, interest, confidence_level)]
+        expected = expected.sort_values(f'{interest}_interaction', ascending=False, kind='stable')
+        positions = dataset.tier_index.get_positions(interest, confidence_level)
+        assert positions.tolist() == expected.index.tolist()
+
+
+def test_select_users_respects_member_mask():
+    dataset = make_dataset()
+    member_mask = dataset.data['user_id'].to_numpy() % 3 == 0
+    positions = select_users_by_interest(dataset.tier_index, member_mask, 'Sports', 'Mid', num_users=20, add_random=None)
+
+    tier = dataset.tier_index.get_positions('Sports', 'Mid')
+    assert len(positions) == 20
+    assert member_mask[positions].all()
+    assert positions.tolist() == tier[member_mask[tier]][:20].tolist()
+
+
+def test_select_users_with_random_users():
+    dataset = make_dataset()
+    member_mask = dataset.data['user_id'].to_numpy() % 2 == 0
+    positions = select_users_by_interest(dataset.tier_index, member_mask, 'Travel', 'High', num_users=40, add_random=0.2)
+
+    assert 0 < len(positions) <= 40
+    assert len(np.unique(positions)) == len(positions)
+    assert member_mask[positions].all()
+
+
+def test_sample_members_draws_distinct_allowed_positions():
+    rng = np.random.default_rng(0)
+    positions = np.arange(100_000, dtype=np.int32)
+    member_mask = positions % 1000 == 0
+    exclude = np.arange(0, 50_000, 1000)
+
+    sampled = sample_members(positions, member_mask, 30, rng, exclude)
+    assert len(sampled) == 30
+    assert len(np.unique(sampled)) == 30
+    assert member_mask[sampled].all()
+    assert not np.isin(sampled, exclude).any()
+    # Only 50 positions are allowed, all of them are returned when asking for more
+    assert sorted(sample_members(positions, member_mask, 80, rng, exclude)) == list(range(50_000, 100_000, 1000))
+
+
+def test_random_positions_follow_proportions():
+    dataset = make_dataset(2000)
+    tier_index = dataset.tier_index
+    ranked = tier_index.top_positions('Sports', 'Very High', None, 10)
+    sampled = add_random_positions(tier_index, None, 50, 'Very High', 'Sports', seed=3, proportions=[0.2, 0.8, 0.0],
+                                   exclude=ranked)
+
+    assert len(sampled) == 50
+    assert len(np.unique(sampled)) == 50
+    assert not np.isin(sampled, ranked).any()
+    assert np.isin(sampled[:10], tier_index.get_positions('Sports', 'High')).all()
+    assert np.isin(sampled[10:], tier_index.get_positions('Sports', 'Good')).all()
+    np.testing.assert_array_equal(sampled, add_random_positions(tier_index, None, 50, 'Very High', 'Sports', seed=3,
+                                                                proportions=[0.2, 0.8, 0.0], exclude=ranked))
+    with pytest.raises(ValueError):
+        add_random_positions(tier_index, None, 50, 'Very High', 'Sports', proportions=[0.5, 0.6, 0.0])
+
+
+def test_filtered_out_users_without_interactions_fall_back_to_the_second_lower_level():
+    dataset = make_dataset(2000)
+    tier_index = dataset.tier_index
+    assert len(tier_index.no_interaction)
+    member_mask = np.ones(len(dataset), dtype=bool)
+    member_mask[tier_index.no_interaction] = False
+
+    sampled = add_random_positions(tier_index, member_mask, 20, 'Very High', 'Sports', seed=1,
+                                   proportions=[0.0, 0.0, 1.0])
+
+    assert len(sampled) == 20
+    assert np.isin(sampled, tier_index.get_positions('Sports', 'Good')).all()
@@ -0,0 +1,85 @@
+from unittest.mock import patch
+
+import pandas as pd
+
+from app.api.schemas import UserData
+from app.services import user_service
+from app.utils.cache import ResultCache
+from app.utils.dataset import Dataset
+from tests.test_filter_index import make_demographics
+from tests.test_tier_index import make_dataset
+
+
+def make_full_dataset(n_users=1000):
+    dataset = make_dataset(n_users)
+    demographics = make_demographics(n_users).drop(columns='user_id')
+    return pd.concat([dataset.data, demographics], axis=1)
+
+
+def make_request(**fields):
+    fields.setdefault('interest', {'interests': ['Sports', 'Travel', 'Finance'], 'weights': [0.5, 0.3, 0.2]})
+    fields.setdefault('n_users', 20)
+    return UserData(**fields)
+
+
+def test_batch_matches_individual_requests():
+    data = make_full_dataset()
+    requests = [
+        make_request(gender='Male'),
+        make_request(gender='Male', interest={'interests': ['Fashion', 'Technology'], 'weights': [0.6, 0.4]}),
+        make_request(region=['Northern Italy'], age=[30, 60], n_users=5),
+        make_request(gender='Male', interest={'interests': ['Politics'], 'weights': [1.0]}, confidence_level='Mid'),
+        make_request(interest={'interests': ['Sports', 'Travel'], 'weights': [0.5, 0.9]}),
+    ]
+    results = user_service.process_user_data_batch(requests, data)
+
+    assert len(results) == len(requests)
+    for request, result in zip(requests[:3], results[:3]):
+        pd.testing.assert_frame_equal(result, user_service.process_user_data(request, data))
+    assert len(results[3]) == 20
+    assert (results[3]['gender'] == 'Male').all()
+    # An invalid profile fails alone, without failing the rest of the batch
+    assert results[4] is None
+
+
+def test_seed_makes_random_users_reproducible():
+    data = make_full_dataset()
+    request = make_request(interest={'interests': ['Travel'], 'weights': [1.0]}, confidence_level='High',
+                           random_user_percent=40, seed=7)
+
+    first = user_service.process_user_data(request, data)
+    second = user_service.process_user_data(request, data)
+    pd.testing.assert_frame_equal(first, second)
+
+
+def test_reproducible_requests_are_cached():
+    dataset = Dataset(make_full_dataset(), version=1)
+    seeded = make_request(interest={'interests': ['Travel'], 'weights': [1.0]}, seed=3)
+    unseeded = make_request(interest={'interests': ['Travel'], 'weights': [1.0]})
+
+    with patch.object(user_service, 'result_cache', ResultCache(max_size=10, ttl_seconds=60)) as cache:
+        first = user_service.get_target_users(seeded, dataset)
+        assert user_service.get_target_users(seeded, dataset) is first
+        user_service.get_target_users(unseeded, dataset)
+        user_service.get_target_users(unseeded, dataset)
+
+        assert cache.stats()['hits'] == 1
+        assert cache.stats()['size'] == 1
+
+        dataset.version = 2
+        assert user_service.get_target_users(seeded, dataset) is not first
+
+
+def test_cached_results_are_kept_within_the_memory_budget():
+    dataset = Dataset(make_full_dataset(), version=1)
+    small = make_request(interest={'interests': ['Travel'], 'weights': [1.0]}, seed=3, n_users=10)
+    large = make_request(interest={'interests': ['Travel'], 'weights': [1.0]}, seed=3, n_users=200)
+    small_bytes = int(user_service.process_user_data(small, dataset).memory_usage().sum())
+
+    with patch.object(user_service, 'result_cache', ResultCache(10, 60, max_bytes=small_bytes * 3)) as cache:
+        user_service.get_target_users(small, dataset)
+        # Larger than the whole budget, returned but not cached
+        assert len(user_service.get_target_users(large, dataset)) == 200
+
+        assert cache.stats()['size'] == 1
+        assert cache.stats()['bytes'] == small_bytes